@@ -1,9 +1,26 @@
 from django.contrib import admin
-from .models import User, Guardian, Dependent, GuardianMessageDefault, AppSettings
+from .models import AccountDeletion, Broadcast, User, Guardian, Dependent, DependentInterest, GuardianMessageDefault, AppSettings, JobRun, ReportJob
 
 # Register your models here.
 admin.site.register(User)
 admin.site.register(Guardian)
 admin.site.register(Dependent)
+admin.site.register(DependentInterest)
 admin.site.register(AppSettings)
-admin.site.register(GuardianMessageDefault)
\ No newline at end of file
+admin.site.register(GuardianMessageDefault)
+admin.site.register(ReportJob)
+admin.site.register(Broadcast)
+admin.site.register(AccountDeletion)
+
+
+# Job runs (recent batch job telemetry) 
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'started_at', 'duration', 'rows_processed', 'queries', 'peak_memory_kb')
+    list_filter = ('status', 'name')
+    date_hierarchy = 'started_at'
+    readonly_fields = [field.name for field in JobRun._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
@@ -1,5 +1,13 @@
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
-from .models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .models import Guardian, User
 
 # Custom authentication backend for phone number login 
 class PhoneBackend(ModelBackend):
@@ -11,3 +19,92 @@ class PhoneBackend(ModelBackend):
 
         if user.check_password(password) and self.user_can_authenticate(user):
             return user
+
+
+# Fields of the cached principal; the password hash and last_login are never cached and load lazily if used 
+PRINCIPAL_USER_FIELDS = (
+    'id', 'name', 'phone_number', 'role', 'profile_picture', 'address',
+    'is_active', 'is_superuser', 'is_staff', 'is_admin', 'is_block', 'is_deleted',
+)
+# Every guardian column is cached, so views reading the PIN or reset fields do not load them one query per field 
+PRINCIPAL_GUARDIAN_FIELDS = ('id', 'guardian_code_hashed', 'pin_reset_otp', 'otp_created_at', 'created_at')
+
+
+def _principal_key(user_id):
+    return f'principal:{user_id}'
+
+
+def invalidate_principals(user_ids):
+    """Drop cached principals now and again after the surrounding transaction commits."""
+    keys = [_principal_key(user_id) for user_id in user_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_principal(user_id):
+    invalidate_principals([user_id])
+
+
+def load_principal(user_id):
+    """Cached user fields plus guardian fields for `user_id` (one joined query on a miss), or None."""
+    key = _principal_key(user_id)
+    principal = cache.get(key)
+    if principal is None:
+        principal = User.objects.filter(pk=user_id).values(
+            *PRINCIPAL_USER_FIELDS,
+            *(f'guardian__{field}' for field in PRINCIPAL_GUARDIAN_FIELDS)
+        ).first()
+        if principal is None:
+            return None
+        cache.set(key, principal, settings.PRINCIPAL_CACHE_SECONDS)
+    return principal
+
+
+# Model.from_db takes values in concrete field order; fields not given stay deferred 
+def _from_db(model, values):
+    field_names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(model.objects.db, field_names, [values[name] for name in field_names])
+
+
+def build_principal(principal):
+    """A User instance (with its guardian relation primed) from a cached principal, without a query."""
+    user = _from_db(User, {field: principal[field] for field in PRINCIPAL_USER_FIELDS})
+    guardian_relation = User._meta.get_field('guardian')
+    if principal['guardian__id'] is None:
+        guardian_relation.set_cached_value(user, None)
+    else:
+        # Fields missing from a principal cached by an older release stay deferred; PrincipalContext reloads those
+        guardian = _from_db(Guardian, {
+            'user_id': user.pk,
+            **{field: principal[f'guardian__{field}'] for field in PRINCIPAL_GUARDIAN_FIELDS if f'guardian__{field}' in principal}
+        })
+        Guardian._meta.get_field('user').set_cached_value(guardian, user)
+        guardian_relation.set_cached_value(user, guardian)
+    return user
+
+
+# JWT authentication that serves the user from a short-lived principal cache instead of a query per request 
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        # Revocation checks need the password hash, which is not cached 
+        if jwt_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        principal = load_principal(user_id)
+        if principal is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if jwt_settings.CHECK_USER_IS_ACTIVE and not principal['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if principal['is_block']:
+            raise AuthenticationFailed(_('تم حظر حساب المستخدم.'), code="user_blocked")
+
+        return build_principal(principal)
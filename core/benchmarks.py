@@ -0,0 +1,211 @@
+import json
+import subprocess
+from contextlib import contextmanager
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from fcm_django.models import FCMDevice
+from firebase_admin import messaging
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import tasks
+from .jobs import track_job
+from .models import AppSettings, Guardian, GuardianMessageDefault, JobRun, User
+from .views import AppSettingsView
+
+
+# Rows inserted per bulk_create while seeding
+SEED_BATCH_SIZE = 5000
+
+# Seeded guardians whose package counts as expired (every n-th guardian)
+EXPIRED_EVERY = 5
+
+BENCHMARK_MAX_SMS = 30
+
+# Metrics compared between two result files
+COMPARED_METRICS = ('wall_seconds', 'queries', 'peak_memory_kb')
+
+
+@contextmanager
+def benchmark_database(keepdb=False):
+    """Run the enclosed block against a throwaway test database, never the configured one."""
+    old_name = connection.settings_dict['NAME']
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+class ExternalServiceStub:
+    """Stands in for FCM and Taqnyat: every push succeeds and every SMS is only counted."""
+
+    def __init__(self):
+        self.fcm_messages = 0
+        self.sms = 0
+
+    def send_each(self, batch, dry_run=False):
+        self.fcm_messages += len(batch)
+        return messaging.BatchResponse([
+            messaging.SendResponse({'name': 'projects/benchmark/messages/0'}, None) for _message in batch
+        ])
+
+    def send_sms(self, recipients, message, sender_name="SMS"):
+        self.sms += len(recipients)
+        return {'success': True}
+
+    @contextmanager
+    def installed(self):
+        with mock.patch.object(messaging, 'send_each', side_effect=self.send_each), \
+                mock.patch('core.utils.TaqnyatSMSService.send_sms', side_effect=self.send_sms):
+            yield self
+
+    def reset(self):
+        self.fcm_messages = 0
+        self.sms = 0
+
+
+def seed_guardians(count, app_settings, batch_size=SEED_BATCH_SIZE):
+    """
+    Insert `count` guardians, each with a message default row and one FCM device.
+    Every EXPIRED_EVERY-th guardian has a used-up package. Signals are bypassed.
+    """
+    password = make_password(None)
+    for start in range(0, count, batch_size):
+        numbers = range(start, min(start + batch_size, count))
+        phones = [f'9{number:011d}' for number in numbers]
+        User.objects.bulk_create(
+            [User(phone_number=phone, role='guardian', password=password) for phone in phones],
+            batch_size=batch_size
+        )
+        user_ids = dict(User.objects.filter(phone_number__in=phones).values_list('phone_number', 'id'))
+
+        Guardian.objects.bulk_create(
+            [Guardian(user_id=user_ids[phone]) for phone in phones],
+            batch_size=batch_size
+        )
+        guardian_ids = dict(Guardian.objects.filter(user_id__in=user_ids.values()).values_list('user_id', 'id'))
+
+        GuardianMessageDefault.objects.bulk_create([
+            GuardianMessageDefault(
+                guardian_id=guardian_ids[user_ids[phone]],
+                app_settings=app_settings,
+                messages_per_month=BENCHMARK_MAX_SMS if number % EXPIRED_EVERY == 0 else 0,
+            )
+            for number, phone in zip(numbers, phones)
+        ], batch_size=batch_size)
+
+        FCMDevice.objects.bulk_create(
+            [FCMDevice(user_id=user_ids[phone], registration_id=f'benchmark-{phone}', type='android') for phone in phones],
+            batch_size=batch_size
+        )
+
+
+# AppSettingsView.post with update_guardians_now, followed by the background job that applies it
+def run_update_guardians_now():
+    admin = User.objects.filter(is_superuser=True).first()
+    if admin is None:
+        admin = User.objects.create_superuser(phone_number='100000000000', password=None)
+    app_settings = AppSettings.objects.first()
+
+    request = APIRequestFactory().post('/', {
+        'max_sms_message': app_settings.max_sms_message + 5,
+        'update_guardians_now': True,
+    }, format='json')
+    force_authenticate(request, user=admin)
+    response = AppSettingsView.as_view()(request)
+    if response.status_code != 200:
+        raise RuntimeError(f"AppSettingsView returned {response.status_code}: {response.data}")
+    tasks.apply_immediate_guardian_increment()
+
+
+BENCHMARK_JOBS = {
+    'notify_expired_guardians': tasks.notify_expired_guardians,
+    'reset_monthly_messages': tasks.reset_monthly_messages,
+    'reset_or_increment_guardians': tasks.reset_or_increment_guardians,
+    'update_guardians_now': run_update_guardians_now,
+}
+
+
+def measure(name, func, stub):
+    """Run `func` as a tracked job and return its wall time, queries, peak memory and rows."""
+    stub.reset()
+    with override_settings(JOB_RUN_TRACE_MEMORY=True):
+        with track_job(f'benchmark.{name}') as tracker:
+            func()
+    run = tracker.run
+    # Rows are reported to the job's own tracked run, recorded inside the benchmark run
+    rows = JobRun.objects.filter(id__gt=run.id).aggregate(rows=Sum('rows_processed'))['rows'] or 0
+    return {
+        'wall_seconds': run.duration,
+        'queries': run.queries,
+        'peak_memory_kb': run.peak_memory_kb,
+        'rows': rows,
+        'fcm_messages': stub.fcm_messages,
+        'sms': stub.sms,
+    }
+
+
+def run_benchmarks(sizes, job_names, log=print):
+    """Seed each size into a fresh database and measure every job; returns the result rows."""
+    results = []
+    stub = ExternalServiceStub()
+    with stub.installed():
+        for size in sizes:
+            call_command('flush', interactive=False, verbosity=0)
+            app_settings = AppSettings.objects.create(
+                version='benchmark',
+                whatsapp_number='966500000000',
+                max_sms_message=BENCHMARK_MAX_SMS,
+                pending_guardian_increment=5,
+            )
+            log(f"Seeding {size} guardians")
+            seed_guardians(size, app_settings)
+
+            for name in job_names:
+                metrics = measure(name, BENCHMARK_JOBS[name], stub)
+                log(f"{name} @ {size}: {metrics['wall_seconds']}s, {metrics['queries']} queries, "
+                    f"peak {metrics['peak_memory_kb']} KB")
+                results.append({'job': name, 'guardians': size, **metrics})
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, results):
+    document = {
+        'created_at': timezone.now().isoformat(),
+        'revision': git_revision(),
+        'database': connection.vendor,
+        'results': results,
+    }
+    with open(path, 'w') as output:
+        json.dump(document, output, indent=2)
+    return document
+
+
+def compare_results(previous, current):
+    """Yield (job, guardians, metric, before, after, change ratio) for runs present in both documents."""
+    before = {(row['job'], row['guardians']): row for row in previous['results']}
+    for row in current['results']:
+        old = before.get((row['job'], row['guardians']))
+        if old is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if old.get(metric) and row.get(metric) is not None:
+                yield row['job'], row['guardians'], metric, old[metric], row[metric], row[metric] / old[metric] - 1
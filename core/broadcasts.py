@@ -0,0 +1,59 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import User
+from .utils import create_bulk_notifications, push_bulk_notifications
+
+
+# Recipients read, notified and pushed per step; the checkpoint advances after each one 
+BROADCAST_CHUNK_SIZE = 5000
+
+
+# Users targeted by a broadcast segment 
+def segment_recipients(broadcast):
+    users = User.objects.filter(role='guardian', is_active=True, is_block=False, is_deleted=False)
+    if broadcast.segment == 'expired_guardians':
+        users = users.filter(
+            guardian__message_defaults__messages_per_month__gte=F('guardian__message_defaults__app_settings__max_sms_message')
+        )
+    elif broadcast.segment == 'disability_type':
+        users = users.filter(guardian__dependents__disability_type_id=broadcast.disability_type_id).distinct()
+    return users
+
+
+def run_broadcast(broadcast, chunk_size=BROADCAST_CHUNK_SIZE):
+    """
+    Stream the segment in user id order. Each chunk's notifications are created and the
+    checkpoint advanced in one transaction, then pushed through batched FCM requests, so
+    an interrupted broadcast continues after `last_user_id` without notifying anyone twice.
+    """
+    recipients = segment_recipients(broadcast)
+    data = {"type": "general", "broadcast_id": broadcast.id}
+
+    while True:
+        user_ids = list(
+            recipients.filter(id__gt=broadcast.last_user_id)
+            .order_by('id')
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if not user_ids:
+            break
+
+        with transaction.atomic():
+            notifications = create_bulk_notifications(user_ids, broadcast.title, broadcast.body, "general")
+            broadcast.recipients_count += len(user_ids)
+            broadcast.last_user_id = user_ids[-1]
+            broadcast.save(update_fields=['recipients_count', 'last_user_id'])
+
+        results = push_bulk_notifications(notifications, broadcast.title, broadcast.body, data)
+        sent = sum(1 for _message, response in results if response is not None and response.success)
+
+        broadcast.pushes_sent += sent
+        broadcast.pushes_failed += len(results) - sent
+        broadcast.save(update_fields=['pushes_sent', 'pushes_failed'])
+
+    broadcast.status = 'completed'
+    broadcast.completed_at = timezone.now()
+    broadcast.save(update_fields=['status', 'completed_at'])
+    return broadcast
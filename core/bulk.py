@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.db import transaction
+
+from .authentication import invalidate_principals
+from .changelog import record_changes
+from .deletions import queued_deletion_user_ids
+from .models import Guardian, GuardianMessageDefault, User
+
+
+class SelectionTooLarge(Exception):
+    pass
+
+
+def select_guardians(ids=None, filters=None):
+    """Guardians picked by id, or by the same user__* filters the guardian list accepts; accounts queued for deletion are left out."""
+    queryset = Guardian.objects.exclude(user_id__in=queued_deletion_user_ids()).order_by('id')
+    if ids is not None:
+        return queryset.filter(id__in=ids)
+    return queryset.filter(**filters)
+
+
+# (guardian id, *fields) of the selection, refusing selections over GUARDIAN_BULK_MAX_ROWS
+def _selected_rows(guardians, *fields):
+    rows = list(guardians.values_list('id', *fields)[:settings.GUARDIAN_BULK_MAX_ROWS + 1])
+    if len(rows) > settings.GUARDIAN_BULK_MAX_ROWS:
+        raise SelectionTooLarge(f"More than {settings.GUARDIAN_BULK_MAX_ROWS} guardians selected")
+    return rows
+
+
+# Per-id results; requested ids that matched no guardian are reported as not_found
+def _results(statuses, requested_ids):
+    results = [{'id': guardian_id, 'status': result} for guardian_id, result in statuses.items()]
+    if requested_ids is not None:
+        results += [
+            {'id': guardian_id, 'status': 'not_found'}
+            for guardian_id in dict.fromkeys(requested_ids) if guardian_id not in statuses
+        ]
+    return results
+
+
+def bulk_set_user_field(guardians, field, value, requested_ids=None):
+    """
+    Set a flag (is_block, is_active) on the users of the selected guardians with one UPDATE,
+    skipping users that already have the value, and drop their cached principals.
+    """
+    rows = _selected_rows(guardians, 'user_id', f'user__{field}')
+    changed = {guardian_id: user_id for guardian_id, user_id, current in rows if current != value}
+
+    if changed:
+        with transaction.atomic():
+            User.objects.filter(id__in=changed.values()).update(**{field: value})
+            invalidate_principals(changed.values())
+
+    statuses = {guardian_id: 'updated' if guardian_id in changed else 'unchanged' for guardian_id, *_ in rows}
+    return _results(statuses, requested_ids)
+
+
+def bulk_set_messages_per_month(guardians, messages_per_month, requested_ids=None):
+    """Set the monthly message quota of the selected guardians with one UPDATE, logged on the change feed."""
+    rows = _selected_rows(guardians, 'message_defaults__id', 'message_defaults__messages_per_month')
+    changed = {
+        guardian_id: default_id
+        for guardian_id, default_id, current in rows
+        if default_id is not None and current != messages_per_month
+    }
+
+    if changed:
+        with transaction.atomic():
+            GuardianMessageDefault.objects.filter(id__in=changed.values()).update(messages_per_month=messages_per_month)
+            record_changes(GuardianMessageDefault, changed.values(), 'update', {'messages_per_month': messages_per_month})
+
+    statuses = {
+        guardian_id: 'no_message_defaults' if default_id is None else ('updated' if guardian_id in changed else 'unchanged')
+        for guardian_id, default_id, _current in rows
+    }
+    return _results(statuses, requested_ids)
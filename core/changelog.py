@@ -0,0 +1,53 @@
+from .models import ChangeLogEntry
+
+# Models published on the change feed and the fields included in each entry 
+TRACKED_FIELDS = {
+    'message.message': [
+        'guardian', 'dependent', 'message_type', 'created_at',
+        'is_seen', 'is_sms', 'is_voice', 'is_emergency',
+    ],
+    'core.dependent': [
+        'name', 'guardian', 'date_birth', 'control_method', 'disability_type', 'gender',
+        'marital_status', 'degree_type', 'degree_type_other', 'created_at',
+    ],
+    'core.guardian': [
+        'user', 'created_at',
+    ],
+    'core.guardianmessagedefault': [
+        'guardian', 'messages_per_month', 'app_settings', 'notified_expired',
+    ],
+}
+
+
+# Tracked field values of an instance, keyed by attname (foreign keys as ids) 
+def snapshot(instance):
+    fields = TRACKED_FIELDS[instance._meta.label_lower]
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in (instance._meta.get_field(name) for name in fields)
+    }
+
+
+# Append one entry for a saved or deleted instance 
+def record_change(instance, action):
+    ChangeLogEntry.objects.create(
+        model=instance._meta.label_lower,
+        object_id=instance.pk,
+        action=action,
+        data=snapshot(instance) if action != 'delete' else None,
+    )
+
+
+def record_changes(model, object_ids, action, data=None):
+    """
+    Append entries for rows changed by a queryset update() or a raw delete, which bypass
+    the model signals. `data` holds only the fields that were set, shared by every row.
+    """
+    label = model._meta.label_lower
+    ChangeLogEntry.objects.bulk_create(
+        [
+            ChangeLogEntry(model=label, object_id=object_id, action=action, data=data)
+            for object_id in object_ids
+        ],
+        batch_size=1000,
+    )
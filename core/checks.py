@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+from rest_framework.settings import api_settings
+
+
+# Features that coordinate workers through the cache cannot work with a per-process cache 
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    errors = []
+    if settings.SHARED_CACHE:
+        return errors
+
+    if settings.ACTIVITY_COUNTER_STORE == 'cache':
+        errors.append(Error(
+            "ACTIVITY_COUNTER_STORE is 'cache' but the default cache is not shared between workers; "
+            "the scheduler's flush would never see the counts.",
+            hint="Configure a shared CACHE_BACKEND or set ACTIVITY_COUNTER_STORE to 'db'.",
+            id='core.E001',
+        ))
+    if settings.PIN_FAILURE_STORE == 'cache':
+        errors.append(Error(
+            "PIN_FAILURE_STORE is 'cache' but the default cache is not shared between workers; "
+            "spreading wrong PINs across workers would get around the lockout.",
+            hint="Configure a shared CACHE_BACKEND or set PIN_FAILURE_STORE to 'db'.",
+            id='core.E002',
+        ))
+    if api_settings.DEFAULT_THROTTLE_CLASSES and api_settings.DEFAULT_THROTTLE_RATES:
+        errors.append(Warning(
+            "Throttle counters live in the default cache, which is not shared between workers; "
+            "every worker process enforces its own copy of each rate limit.",
+            hint="Configure a shared CACHE_BACKEND (e.g. Redis or Memcached) so the limits hold across workers.",
+            id='core.W001',
+        ))
+    return errors
@@ -0,0 +1,66 @@
+from .models import Guardian, GuardianMessageDefault, User
+
+
+_UNLOADED = object()
+
+
+class PrincipalContext:
+    """
+    The request user's Guardian and GuardianMessageDefault, loaded at most once per request.
+    The guardian primed by CachedJWTAuthentication is reused when all its fields are loaded;
+    when the message defaults (or an unprimed or partly loaded guardian) are needed, the
+    guardian and its defaults come in one joined query and are linked both ways with
+    request.user, so `request.user.guardian` and `guardian.user` cost nothing afterwards.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._guardian = _UNLOADED
+
+    @property
+    def guardian(self):
+        if self._guardian is _UNLOADED:
+            relation = User._meta.get_field('guardian')
+            guardian = _UNLOADED
+            if self.user and self.user.is_authenticated and relation.is_cached(self.user):
+                guardian = relation.get_cached_value(self.user)
+            # A partly loaded guardian would cost a query per deferred field read later
+            if guardian is _UNLOADED or (guardian is not None and guardian.get_deferred_fields()):
+                guardian = self._load_guardian()
+            self._guardian = guardian
+        return self._guardian
+
+    @property
+    def message_defaults(self):
+        guardian = self.guardian
+        if guardian is None:
+            return None
+        if not Guardian._meta.get_field('message_defaults').is_cached(guardian):
+            guardian = self._guardian = self._load_guardian()
+            if guardian is None:
+                return None
+        try:
+            return guardian.message_defaults
+        except GuardianMessageDefault.DoesNotExist:
+            return None
+
+    def _load_guardian(self):
+        user = self.user
+        if not user or not user.is_authenticated:
+            return None
+
+        guardian = Guardian.objects.select_related('message_defaults').filter(user_id=user.pk).first()
+        if guardian is not None:
+            Guardian._meta.get_field('user').set_cached_value(guardian, user)
+        User._meta.get_field('guardian').set_cached_value(user, guardian)
+        return guardian
+
+
+def get_principal(request):
+    """The PrincipalContext of a DRF or Django request, created once and kept on the HttpRequest."""
+    http_request = getattr(request, '_request', request)
+    context = getattr(http_request, 'principal', None)
+    if context is None or context.user is not request.user:
+        context = PrincipalContext(request.user)
+        http_request.principal = context
+    return context
@@ -0,0 +1,111 @@
+from django.contrib.admin.models import LogEntry
+from django.db import models, transaction
+from django.utils import timezone
+from fcm_django.models import FCMDevice
+
+from message.models import EscalationTimer, GuardianMessageType, Message
+from .authentication import invalidate_principal
+from .changelog import TRACKED_FIELDS, record_changes
+from .models import AccountDeletion, Dependent, DependentInterest, Guardian, GuardianMessageDefault, Notification, PinFailure, User
+from .push import forget_fcm_devices
+
+
+# Rows removed per raw delete; each batch is a short statement of its own
+DELETION_BATCH_SIZE = 1000
+
+
+def request_account_deletion(user, requested_by=None):
+    """
+    Deactivate the account right away (its tokens stop working) and queue its rows for
+    process_account_deletions. A deletion already queued for the user is reused.
+    """
+    with transaction.atomic():
+        user.is_active = False
+        user.is_deleted = True
+        user.save()
+
+        deletion = AccountDeletion.objects.filter(user_id=user.pk, status__in=['pending', 'running']).first()
+        if deletion is None:
+            deletion = AccountDeletion.objects.create(
+                user_id=user.pk,
+                phone_number=user.phone_number,
+                requested_by=requested_by,
+            )
+    return deletion
+
+
+# Users whose deletion is queued or under way; they can no longer be restored or edited 
+def queued_deletion_user_ids():
+    return AccountDeletion.objects.filter(status__in=['pending', 'running']).values('user_id')
+
+
+# Everything referencing the user, in an order where no row is deleted before the rows that point to it
+def deletion_steps(user_id, guardian_id):
+    steps = []
+    if guardian_id is not None:
+        steps += [
+            ('escalation timers', EscalationTimer.objects.filter(message__guardian_id=guardian_id)),
+            ('message notifications', Notification.objects.filter(dependent_msg__guardian_id=guardian_id)),
+            ('messages', Message.objects.filter(guardian_id=guardian_id)),
+            ('dependent interests', DependentInterest.objects.filter(dependent__guardian_id=guardian_id)),
+            ('dependents', Dependent.objects.filter(guardian_id=guardian_id)),
+            ('message types', GuardianMessageType.objects.filter(guardian_id=guardian_id)),
+            ('message defaults', GuardianMessageDefault.objects.filter(guardian_id=guardian_id)),
+            ('pin failures', PinFailure.objects.filter(guardian_id=guardian_id)),
+            ('guardian', Guardian.objects.filter(id=guardian_id)),
+        ]
+    steps += [
+        ('notifications', Notification.objects.filter(user_id=user_id)),
+        ('devices', FCMDevice.objects.filter(user_id=user_id)),
+        ('admin log', LogEntry.objects.filter(user_id=user_id)),
+        ('groups', User.groups.through.objects.filter(user_id=user_id)),
+        ('permissions', User.user_permissions.through.objects.filter(user_id=user_id)),
+    ]
+    return steps
+
+
+# Rows that outlive the user (tokens, reports, broadcasts, deletions) lose the reference instead
+def _clear_user_references(user_id):
+    for relation in User._meta.related_objects:
+        if relation.on_delete is models.SET_NULL:
+            name = relation.field.name
+            relation.related_model.objects.filter(**{name: user_id}).update(**{name: None})
+
+
+def run_account_deletion(deletion, batch_size=DELETION_BATCH_SIZE):
+    """
+    Delete the user's rows children first with raw bulk deletes of `batch_size` rows, so no
+    cascade is collected in Python and no statement holds locks for long. Deletes of models
+    on the change feed are recorded. Progress is saved after every batch; an interrupted
+    deletion simply starts over on whatever is left.
+    """
+    user_id = deletion.user_id
+    guardian_id = Guardian.objects.filter(user_id=user_id).values_list('id', flat=True).first()
+    forget_fcm_devices(list(FCMDevice.objects.filter(user_id=user_id).values_list('registration_id', flat=True)))
+
+    for step, queryset in deletion_steps(user_id, guardian_id):
+        model = queryset.model
+        while True:
+            ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                batch = model.objects.filter(pk__in=ids)
+                batch._raw_delete(batch.db)
+                if model._meta.label_lower in TRACKED_FIELDS:
+                    record_changes(model, ids, 'delete')
+
+            deletion.step = step
+            deletion.rows_deleted += len(ids)
+            deletion.save(update_fields=['step', 'rows_deleted'])
+
+    _clear_user_references(user_id)
+    users = User.objects.filter(id=user_id)
+    deletion.rows_deleted += users._raw_delete(users.db)
+    invalidate_principal(user_id)
+
+    deletion.status = 'completed'
+    deletion.step = ''
+    deletion.completed_at = timezone.now()
+    deletion.save(update_fields=['status', 'step', 'rows_deleted', 'completed_at'])
+    return deletion
@@ -0,0 +1,60 @@
+import csv
+import json
+from itertools import chain
+
+from django.http import StreamingHttpResponse
+
+
+# Rows fetched per query while streaming an export 
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_OUTPUTS = ('csv', 'ndjson')
+
+
+# File-like object that hands back what csv.writer writes, so rows can be yielded one by one 
+class Echo:
+    def write(self, value):
+        return value
+
+
+def iterate_by_pk(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield every object of the queryset in primary key order, one keyset page at a time.
+    Each page is a separate `pk > last` query, so neither the database driver nor Python
+    ever holds more than `chunk_size` rows, even on backends without server-side cursors.
+    """
+    last_pk = None
+    while True:
+        page = queryset.order_by('pk')
+        if last_pk is not None:
+            page = page.filter(pk__gt=last_pk)
+        rows = list(page[:chunk_size].iterator(chunk_size=chunk_size))
+        if not rows:
+            return
+        yield from rows
+        last_pk = rows[-1].pk
+
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def stream_export(rows, columns, output, filename):
+    """
+    Build a StreamingHttpResponse writing `rows` (iterables of values matching `columns`)
+    as CSV or newline-delimited JSON. Nothing is buffered beyond the current row.
+    """
+    if output == 'ndjson':
+        content = (
+            json.dumps(dict(zip(columns, row)), default=_json_default, ensure_ascii=False) + '\n'
+            for row in rows
+        )
+        content_type = 'application/x-ndjson'
+    else:
+        writer = csv.writer(Echo())
+        content = chain([writer.writerow(columns)], (writer.writerow(row) for row in rows))
+        content_type = 'text/csv'
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
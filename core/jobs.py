@@ -0,0 +1,134 @@
+import functools
+import logging
+import threading
+import time
+import tracemalloc
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import JobRun
+
+
+logger = logging.getLogger(__name__)
+
+_current_run = ContextVar('current_job_run', default=None)
+
+# tracemalloc's peak is process wide: with JOB_RUN_TRACE_MEMORY, tracked jobs run one at a
+# time, and a job nested in another is measured as part of the outer one (its own peak is not recorded) 
+_tracing_lock = threading.RLock()
+_tracing_depth = 0
+# Whether the outermost job started tracemalloc itself (and so stops it again)
+_tracing_started = False
+
+
+# Hold the tracing lock for the job; True when this job owns the peak measurement 
+def _start_tracing():
+    global _tracing_depth, _tracing_started
+    _tracing_lock.acquire()
+    _tracing_depth += 1
+    if _tracing_depth > 1:
+        return False
+    _tracing_started = not tracemalloc.is_tracing()
+    if _tracing_started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    return True
+
+
+def _stop_tracing(owner):
+    global _tracing_depth
+    try:
+        if not owner:
+            return None
+        peak = tracemalloc.get_traced_memory()[1]
+        # Tracing that was on before the job (e.g. PYTHONTRACEMALLOC) stays on
+        if _tracing_started:
+            tracemalloc.stop()
+        return peak
+    finally:
+        _tracing_depth -= 1
+        _tracing_lock.release()
+
+
+# Counters of the running job, updated by record_rows and the query wrapper 
+class JobTracker:
+    def __init__(self, run):
+        self.run = run
+        self.rows = 0
+        self.queries = 0
+
+    def add_rows(self, count):
+        self.rows += count
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def track_job(name):
+    """
+    Record a JobRun for the enclosed block: start and end time, duration, rows reported
+    through record_rows(), queries issued on this thread, peak traced memory and errors.
+    """
+    run = JobRun.objects.create(name=name)
+    tracker = JobTracker(run)
+    token = _current_run.set(tracker)
+    trace_memory = settings.JOB_RUN_TRACE_MEMORY
+    traces_peak = _start_tracing() if trace_memory else False
+    started = time.monotonic()
+
+    try:
+        with connection.execute_wrapper(tracker):
+            yield tracker
+        run.status = 'succeeded'
+    except Exception:
+        run.status = 'failed'
+        run.error = traceback.format_exc()
+        raise
+    finally:
+        peak = _stop_tracing(traces_peak) if trace_memory else None
+        _current_run.reset(token)
+
+        run.finished_at = timezone.now()
+        run.duration = round(time.monotonic() - started, 3)
+        run.rows_processed = tracker.rows
+        run.queries = tracker.queries
+        run.peak_memory_kb = peak // 1024 if peak is not None else None
+        run.save(update_fields=['status', 'error', 'finished_at', 'duration', 'rows_processed', 'queries', 'peak_memory_kb'])
+        logger.info(
+            f"Job {name} {run.status} in {run.duration}s: {run.rows_processed} rows, "
+            f"{run.queries} queries, peak {run.peak_memory_kb} KB"
+        )
+
+
+def tracked_job(func):
+    """Decorator recording every call of a batch job as a JobRun."""
+    name = f"{func.__module__}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with track_job(name):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+# Report rows processed by the job running on this thread (no-op outside a tracked job) 
+def record_rows(count):
+    tracker = _current_run.get()
+    if tracker is not None:
+        tracker.add_rows(count)
+
+
+# Delete job runs older than JOB_RUN_RETENTION_DAYS 
+def prune_job_runs():
+    cutoff = timezone.now() - timedelta(days=settings.JOB_RUN_RETENTION_DAYS)
+    deleted, _ = JobRun.objects.filter(started_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,50 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.benchmarks import BENCHMARK_JOBS, benchmark_database, compare_results, run_benchmarks, write_results
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic guardians into a throwaway test database and measure the scheduled batch jobs "
+        "(wall time, queries, peak memory) with FCM and SMS stubbed. Results are written as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000],
+                            help="Guardian counts to benchmark, e.g. --sizes 10000 100000 1000000")
+        parser.add_argument('--jobs', nargs='+', choices=list(BENCHMARK_JOBS), default=list(BENCHMARK_JOBS))
+        parser.add_argument('--output', help="Result file (default: benchmarks/jobs-<timestamp>.json).")
+        parser.add_argument('--compare', help="Earlier result file to compare against.")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Relative change reported as a regression (default 0.2 = 20%%).")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the test database between runs.")
+
+    def handle(self, *args, **options):
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as source:
+                    previous = json.load(source)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        output = options['output'] or os.path.join('benchmarks', f"jobs-{timezone.now():%Y%m%d-%H%M%S}.json")
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+
+        with benchmark_database(keepdb=options['keepdb']):
+            results = run_benchmarks(options['sizes'], options['jobs'], log=self.stdout.write)
+        document = write_results(output, results)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {output}"))
+
+        if previous is None:
+            return
+        for job, guardians, metric, before, after, change in compare_results(previous, document):
+            line = f"{job} @ {guardians} {metric}: {before} -> {after} ({change:+.0%})"
+            if change > options['threshold']:
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
@@ -0,0 +1,71 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.benchmarks import benchmark_database, git_revision
+from core.models import Guardian, User
+from core.views import VerifyGuardianPinCodeView
+
+
+BENCHMARK_PIN = '1234'
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure CPU and wall time per VerifyGuardianPinCodeView request, verifying with the PIN "
+        "(password hash) versus presenting the pin_token from an earlier verification."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help="Requests per mode (default 20).")
+        parser.add_argument('--output', help="Also write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            results = self.run_benchmark(options['requests'])
+
+        for mode, metrics in results.items():
+            self.stdout.write(
+                f"{mode}: {metrics['cpu_ms']:.2f} ms CPU, {metrics['wall_ms']:.2f} ms wall per request"
+            )
+        if results['pin_token']['cpu_ms']:
+            self.stdout.write(f"CPU per request reduced {results['pin_code']['cpu_ms'] / results['pin_token']['cpu_ms']:.0f}x")
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'revision': git_revision(), 'requests': options['requests'], 'results': results}, output, indent=2)
+
+    def run_benchmark(self, requests):
+        user = User.objects.create(phone_number='100000000001', role='guardian')
+        guardian = Guardian.objects.create(user=user)
+        guardian.set_code(BENCHMARK_PIN)
+
+        view = VerifyGuardianPinCodeView.as_view()
+        factory = APIRequestFactory()
+
+        def verify(data):
+            request = factory.post('/', data, format='json')
+            force_authenticate(request, user=User.objects.get(pk=user.pk))
+            response = view(request)
+            if response.status_code != 200:
+                raise RuntimeError(f"Verification failed with {response.status_code}: {response.data}")
+            return response.data
+
+        pin_token = verify({'pin_code': BENCHMARK_PIN})['pin_token']
+        modes = {
+            'pin_code': {'pin_code': BENCHMARK_PIN},
+            'pin_token': {'pin_token': pin_token},
+        }
+
+        results = {}
+        for mode, data in modes.items():
+            cpu_started, wall_started = time.process_time(), time.perf_counter()
+            for _ in range(requests):
+                verify(data)
+            results[mode] = {
+                'cpu_ms': (time.process_time() - cpu_started) * 1000 / requests,
+                'wall_ms': (time.perf_counter() - wall_started) * 1000 / requests,
+            }
+        return results
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core.models import JobRun
+
+
+class Command(BaseCommand):
+    help = "List recent batch job runs with their duration, rows, queries and peak memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', help="Only runs of jobs whose name contains this text.")
+        parser.add_argument('--status', choices=[choice for choice, _label in JobRun.STATUS_CHOICES])
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        runs = JobRun.objects.all()
+        if options['name']:
+            runs = runs.filter(name__icontains=options['name'])
+        if options['status']:
+            runs = runs.filter(status=options['status'])
+
+        header = f"{'started':<19}  {'status':<9}  {'seconds':>9}  {'rows':>9}  {'queries':>8}  {'peak KB':>9}  name"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for run in runs[:options['limit']]:
+            self.stdout.write(
+                f"{run.started_at:%Y-%m-%d %H:%M:%S}  {run.status:<9}  {run.duration if run.duration is not None else '-':>9}  "
+                f"{run.rows_processed:>9}  {run.queries:>8}  {run.peak_memory_kb if run.peak_memory_kb is not None else '-':>9}  {run.name}"
+            )
+            if run.status == 'failed' and run.error:
+                self.stdout.write(self.style.ERROR(f"    {run.error.strip().splitlines()[-1]}"))
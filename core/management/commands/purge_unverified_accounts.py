@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from fcm_django.models import FCMDevice
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from core.models import Dependent, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete guardian accounts created by logins whose OTP was never verified: never logged in, no token "
+        "is on record, no device was registered, no PIN was set and no dependents were added."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=7,
+                            help="Only accounts created at least this many days ago (default 7).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Only count the matching accounts.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        unverified = User.objects.filter(
+            role='guardian',
+            is_staff=False,
+            is_superuser=False,
+            last_login__isnull=True,
+            guardian__created_at__lt=cutoff,
+            guardian__guardian_code_hashed__isnull=True,
+        ).exclude(
+            Exists(OutstandingToken.objects.filter(user_id=OuterRef('pk')))
+        ).exclude(
+            Exists(FCMDevice.objects.filter(user_id=OuterRef('pk')))
+        ).exclude(
+            Exists(Dependent.objects.filter(guardian__user_id=OuterRef('pk')))
+        )
+
+        if options['dry_run']:
+            self.stdout.write(f"{unverified.count()} unverified accounts would be deleted")
+            return
+
+        deleted = 0
+        last_id = 0
+        while True:
+            ids = list(unverified.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            last_id = ids[-1]
+            User.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            self.stdout.write(f"Deleted {deleted} unverified accounts")
+        self.stdout.write(self.style.SUCCESS(f"Done: {deleted} unverified accounts deleted"))
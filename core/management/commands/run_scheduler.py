@@ -0,0 +1,38 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.scheduler import due_runs, get_scheduled_jobs, run_claimed_job, scheduler_owner
+
+
+class Command(BaseCommand):
+    help = "Run settings.SCHEDULED_JOBS; each scheduled run is claimed through a DB lease so exactly one node executes it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run the jobs that are due now and exit.")
+
+    def handle(self, *args, **options):
+        jobs = get_scheduled_jobs()
+        owner = scheduler_owner()
+        self.stdout.write(f"Scheduler {owner} started with {len(jobs)} jobs:")
+        for job in jobs:
+            self.stdout.write(f"  {job}")
+
+        running = []
+        while True:
+            running = [thread for thread in running if thread.is_alive()]
+            for job, scheduled_for in due_runs(jobs, owner):
+                self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} claimed {job.name} ({scheduled_for:%Y-%m-%d %H:%M})")
+                thread = threading.Thread(target=run_claimed_job, args=(job, owner, scheduled_for), name=job.name)
+                thread.start()
+                running.append(thread)
+
+            if options['once']:
+                for thread in running:
+                    thread.join()
+                return
+
+            # Wake up just after the next minute boundary 
+            time.sleep(60 - time.time() % 60 + 1)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.tokens import prune_expired_tokens, token_table_stats
+
+
+class Command(BaseCommand):
+    help = "Report the size of the JWT outstanding and blacklist tables, optionally pruning expired tokens first."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true', help="Delete expired tokens before reporting.")
+        parser.add_argument('--batch-size', type=int, help="Tokens deleted per batch (default TOKEN_PRUNE_BATCH_SIZE).")
+
+    def handle(self, *args, **options):
+        if options['prune']:
+            deleted = prune_expired_tokens(options['batch_size'])
+            self.stdout.write(f"Deleted {deleted} expired tokens")
+
+        stats = token_table_stats()
+        self.stdout.write(f"Outstanding tokens: {stats['outstanding']} ({stats['outstanding_expired']} expired)")
+        self.stdout.write(f"Blacklisted tokens: {stats['blacklisted']} ({stats['blacklisted_expired']} expired)")
+        if 'outstanding_bytes' in stats:
+            self.stdout.write(f"Table size: {stats['outstanding_bytes']} + {stats['blacklisted_bytes']} bytes")
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copy the comma-joined interest_field values into DependentInterest rows 
+def backfill_interests(apps, schema_editor):
+    Dependent = apps.get_model('core', 'Dependent')
+    DependentInterest = apps.get_model('core', 'DependentInterest')
+
+    batch = []
+    rows = Dependent.objects.exclude(interest_field__isnull=True).values_list('id', 'interest_field')
+    for dependent_id, interests in rows.iterator(chunk_size=2000):
+        if isinstance(interests, str):
+            interests = interests.split(',')
+        for interest in {item.strip() for item in interests or [] if item and item.strip()}:
+            batch.append(DependentInterest(dependent_id=dependent_id, interest=interest))
+        if len(batch) >= 2000:
+            DependentInterest.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        DependentInterest.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+# Join the DependentInterest rows back into interest_field 
+def restore_interest_field(apps, schema_editor):
+    Dependent = apps.get_model('core', 'Dependent')
+    DependentInterest = apps.get_model('core', 'DependentInterest')
+
+    interests = {}
+    for dependent_id, interest in DependentInterest.objects.values_list('dependent_id', 'interest').iterator(chunk_size=2000):
+        interests.setdefault(dependent_id, []).append(interest)
+    for dependent_id, values in interests.items():
+        Dependent.objects.filter(id=dependent_id).update(interest_field=','.join(values))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_dependent_degree_type_other'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DependentInterest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interest', models.CharField(choices=[('tech', 'Tech, Cybersecurity, and AI'), ('design', 'Design, Graphics, and UX'), ('business', 'Business, Entrepreneurship, and Marketing'), ('medical', 'Medicine and Health'), ('law', 'Law and Regulations'), ('education', 'Education, Training, and Mentoring'), ('engineering', 'Engineering (All Types)'), ('science', 'Natural Sciences (Physics, Chemistry, Biology)'), ('earth', 'Earth and Environmental Sciences'), ('languages', 'Languages and Literature')], db_index=True, max_length=50, verbose_name='Field of Interest')),
+                ('dependent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='interests', to='core.dependent')),
+            ],
+            options={
+                'unique_together': {('dependent', 'interest')},
+            },
+        ),
+        migrations.RunPython(backfill_interests, restore_interest_field),
+        migrations.RemoveField(
+            model_name='dependent',
+            name='interest_field',
+        ),
+    ]
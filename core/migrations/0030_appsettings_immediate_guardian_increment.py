@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_changelogentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appsettings',
+            name='immediate_guardian_increment',
+            field=models.IntegerField(default=0, help_text='Number of additional messages queued to be added to guardians by the next background run.', verbose_name='Immediate Guardian Increment'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_jobrun'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=255, verbose_name='title')),
+                ('body', models.CharField(max_length=1024, verbose_name='message')),
+                ('segment', models.CharField(choices=[('all_guardians', 'All Guardians'), ('expired_guardians', 'Guardians With Expired Packages'), ('disability_type', 'Guardians By Dependent Disability Type')], max_length=30)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20)),
+                ('recipients_count', models.PositiveIntegerField(default=0)),
+                ('pushes_sent', models.PositiveIntegerField(default=0)),
+                ('pushes_failed', models.PositiveIntegerField(default=0)),
+                ('last_user_id', models.PositiveBigIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcasts', to=settings.AUTH_USER_MODEL)),
+                ('disability_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcasts', to='core.disabilitytype')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
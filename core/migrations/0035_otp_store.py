@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_broadcast'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OneTimePassword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_number', models.CharField(max_length=17, unique=True)),
+                ('code_hash', models.CharField(max_length=128)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('sent_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='user',
+            name='otp',
+        ),
+    ]
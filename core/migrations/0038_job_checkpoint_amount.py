@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0037_report_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobcheckpoint',
+            name='amount',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
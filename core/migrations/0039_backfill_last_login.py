@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-19 16:05
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+# Logins were never recorded before, so a verified account was only recognisable by its tokens.
+# Stamp each such account with its first token before prune_token_blacklist deletes the expired
+# ones; otherwise purge_unverified_accounts would take it for an unverified signup.
+def backfill_last_login(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    OutstandingToken = apps.get_model('token_blacklist', 'OutstandingToken')
+
+    first_token = (
+        OutstandingToken.objects.filter(user_id=OuterRef('pk'), created_at__isnull=False)
+        .order_by('created_at')
+        .values('created_at')[:1]
+    )
+    User.objects.filter(
+        last_login__isnull=True,
+        id__in=OutstandingToken.objects.filter(created_at__isnull=False).values('user_id'),
+    ).update(last_login=Subquery(first_token))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0038_job_checkpoint_amount'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_last_login, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0039_backfill_last_login'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PinFailure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('failures', models.PositiveIntegerField(default=0)),
+                ('last_failed_at', models.DateTimeField()),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('guardian', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='pin_failure', to='core.guardian')),
+            ],
+        ),
+    ]
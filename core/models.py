@@ -1,11 +1,12 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.fields.files import FieldFile
 from django.utils import timezone
 from django.core.validators import RegexValidator
 from django.contrib.auth.hashers import make_password, check_password
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils.translation import gettext_lazy as _
 from message.models import Message
-from multiselectfield import MultiSelectField
 
 
 # manager for the User model
@@ -45,8 +46,70 @@ phone_regex = RegexValidator(
     message="Phone number must be entered in the format: '+999999999'. Up to 15 digits allowed."
 )
 
+# Dirty field tracking 
+class DirtyFieldsMixin:
+    """
+    Remembers the column values an instance was loaded or last saved with, so a plain save()
+    writes only the columns that changed (plus auto_now columns) and skips the query when
+    nothing did. Explicit update_fields, forced inserts/updates, a changed primary key or an
+    instance that was never loaded save as usual.
+    """
+    _loaded_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_values()
+        return instance
+
+    # Also covers deferred fields, which Django loads through refresh_from_db(fields=[...])
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember_values(fields)
+
+    def _tracked_value(self, field):
+        value = self.__dict__[field.attname]
+        # A FieldFile is updated in place, so remember its name
+        return value.name if isinstance(value, FieldFile) else value
+
+    def _remember_values(self, fields=None):
+        values = {} if fields is None else dict(self._loaded_values or {})
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__ and (fields is None or field.name in fields or field.attname in fields):
+                values[field.attname] = self._tracked_value(field)
+        self._loaded_values = values
+
+    def get_dirty_fields(self):
+        """Names of the loaded fields whose value differs from the one last loaded or saved."""
+        loaded = self._loaded_values or {}
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+            and (field.attname not in loaded or self._tracked_value(field) != loaded[field.attname])
+        ]
+
+    def save(self, *args, force_insert=False, force_update=False, using=None, update_fields=None):
+        tracked = (
+            self._loaded_values is not None
+            and not (args or force_insert or force_update or update_fields is not None or self._state.adding)
+            and using in (None, self._state.db)
+            and self.pk == self._loaded_values.get(self._meta.pk.attname)
+        )
+        if tracked:
+            update_fields = self.get_dirty_fields()
+            if not update_fields:
+                return
+            update_fields += [
+                field.name for field in self._meta.concrete_fields
+                if getattr(field, 'auto_now', False) and field.name not in update_fields
+            ]
+
+        super().save(*args, force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+        self._remember_values()
+
+
 # User model
-class User(AbstractBaseUser, PermissionsMixin):
+class User(DirtyFieldsMixin, AbstractBaseUser, PermissionsMixin):
     # User Roles 
     ROLES_CHOICES = (
         ('admin', _('Admin')),
@@ -56,7 +119,6 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255, null=True, blank=True)
     phone_number = models.CharField(validators=[phone_regex], max_length=17, unique=True)  # max_length 17 for country code and number
     role = models.CharField(max_length=50, choices=ROLES_CHOICES)
-    otp = models.CharField(max_length=6, null=True, blank=True)  # OTP for verification
     profile_picture = models.ImageField(upload_to='profile_pics/', null=True, blank=True)
     address = models.CharField(max_length=255, null=True, blank=True) 
     is_active = models.BooleanField(default=True)
@@ -82,7 +144,7 @@ class User(AbstractBaseUser, PermissionsMixin):
 
 
 # Guardian model
-class Guardian(models.Model):
+class Guardian(DirtyFieldsMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='guardian')
     guardian_code_hashed = models.CharField(max_length=255, null=True, blank=True)
     pin_reset_otp = models.CharField(max_length=6, null=True, blank=True)
@@ -113,7 +175,7 @@ class DisabilityType(models.Model):
     
 
 # Dependent Model 
-class Dependent(models.Model):
+class Dependent(DirtyFieldsMixin, models.Model):
     # Control Method Choices
     CONTROL_METHOD_CHOICES = (
         ('eye', _('Eye Only')),
@@ -164,12 +226,6 @@ class Dependent(models.Model):
         help_text=_('Custom degree type when "other" is selected')
     )
     
-    interest_field = MultiSelectField(
-        choices=INTEREST_FIELD_CHOICES,
-        null=True,
-        blank=True,
-        verbose_name=_('Field of Interest')
-    )
     # Device Registration ID for Push Notifications 
     registration_id = models.CharField(
         max_length=255, 
@@ -180,10 +236,51 @@ class Dependent(models.Model):
     )
     created_at = models.DateTimeField(default=timezone.now)
 
+    # Interests are stored as DependentInterest rows, exposed as a list of choice keys 
+    @property
+    def interest_field(self):
+        order = [key for key, _label in self.INTEREST_FIELD_CHOICES]
+        return sorted((item.interest for item in self.interests.all()), key=order.index)
+
+    # Replace the dependent interests, writing only the rows that changed 
+    def set_interests(self, interests):
+        new_interests = set(interests or [])
+        old_interests = set(self.interests.values_list('interest', flat=True))
+
+        removed = old_interests - new_interests
+        if removed:
+            self.interests.filter(interest__in=removed).delete()
+
+        added = new_interests - old_interests
+        if added:
+            DependentInterest.objects.bulk_create(
+                [DependentInterest(dependent=self, interest=interest) for interest in added]
+            )
+
+        # Drop any prefetched interests so the next read reflects the change 
+        getattr(self, '_prefetched_objects_cache', {}).pop('interests', None)
+
     def __str__(self):
         return self.name
 
 
+# Dependent Interest (one row per selected field of interest) 
+class DependentInterest(models.Model):
+    dependent = models.ForeignKey(Dependent, related_name='interests', on_delete=models.CASCADE)
+    interest = models.CharField(
+        max_length=50,
+        choices=Dependent.INTEREST_FIELD_CHOICES,
+        db_index=True,
+        verbose_name=_('Field of Interest')
+    )
+
+    class Meta:
+        unique_together = ('dependent', 'interest')
+
+    def __str__(self):
+        return f"{self.dependent} - {self.interest}"
+
+
 # App Settings 
 class AppSettings(models.Model):
     version = models.CharField(max_length=10, verbose_name=_("App Version"))
@@ -193,6 +290,10 @@ class AppSettings(models.Model):
         default=0,
         verbose_name=_("Pending Guardian Increment"),
         help_text=_("Number of additional messages to add to guardians with expired packages when they renew."))
+    immediate_guardian_increment = models.IntegerField(
+        default=0,
+        verbose_name=_("Immediate Guardian Increment"),
+        help_text=_("Number of additional messages queued to be added to guardians by the next background run."))
 
 
 # Notification Model 
@@ -220,7 +321,7 @@ class Notification(models.Model):
 
 
 # Guardian Message Default 
-class GuardianMessageDefault(models.Model):
+class GuardianMessageDefault(DirtyFieldsMixin, models.Model):
     guardian = models.OneToOneField(
         "Guardian",
         on_delete=models.CASCADE,
@@ -238,3 +339,199 @@ class GuardianMessageDefault(models.Model):
 
     def __str__(self):
         return f"{self.guardian} - {self.messages_per_month} msgs (v{self.app_settings.version})"
+
+
+# Report Job (admin analytics computed in the background) 
+class ReportJob(models.Model):
+    REPORT_TYPE_CHOICES = (
+        ('messages', _('Messages')),
+        ('dependents', _('Dependents')),
+    )
+
+    STATUS_CHOICES = (
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+        ('failed', _('Failed')),
+    )
+
+    report_type = models.CharField(max_length=20, choices=REPORT_TYPE_CHOICES)
+    definition = models.JSONField()
+    definition_hash = models.CharField(max_length=64, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    progress = models.PositiveSmallIntegerField(default=0)  # Percent of the id range scanned 
+    processed_rows = models.PositiveBigIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='report_jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # Written with every chunk while running 
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.report_type} report #{self.pk} ({self.status})"
+
+
+# Change Log Entry (append-only feed of changes; the id is the consumer offset) 
+class ChangeLogEntry(models.Model):
+    ACTION_CHOICES = (
+        ('create', _('Create')),
+        ('update', _('Update')),
+        ('delete', _('Delete')),
+    )
+
+    model = models.CharField(max_length=50)
+    object_id = models.PositiveBigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'id']),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.action} {self.model}:{self.object_id}"
+
+
+# Job Checkpoint (last id processed by a resumable batch job) 
+class JobCheckpoint(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    position = models.PositiveBigIntegerField(default=0)
+    amount = models.BigIntegerField(default=0)  # Work claimed by the run (e.g. an increment), kept until fully applied 
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+
+# Job Lease (claims one scheduled run of a job for a single node) 
+class JobLease(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    owner = models.CharField(max_length=255, null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)  # Scheduled time of the last claimed run 
+
+    def __str__(self):
+        return f"{self.name} ({self.owner or 'free'})"
+
+
+# Job Run (telemetry of one execution of a batch job) 
+class JobRun(models.Model):
+    STATUS_CHOICES = (
+        ('running', _('Running')),
+        ('succeeded', _('Succeeded')),
+        ('failed', _('Failed')),
+    )
+
+    name = models.CharField(max_length=255, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    started_at = models.DateTimeField(default=timezone.now, db_index=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True, verbose_name=_("Duration (seconds)"))
+    rows_processed = models.PositiveBigIntegerField(default=0)
+    queries = models.PositiveIntegerField(default=0)
+    peak_memory_kb = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.name} ({self.status}) {self.started_at:%Y-%m-%d %H:%M}"
+
+
+# Broadcast (admin announcement pushed to a segment of guardians in the background) 
+class Broadcast(models.Model):
+    SEGMENT_CHOICES = (
+        ('all_guardians', _('All Guardians')),
+        ('expired_guardians', _('Guardians With Expired Packages')),
+        ('disability_type', _('Guardians By Dependent Disability Type')),
+    )
+
+    STATUS_CHOICES = (
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+        ('failed', _('Failed')),
+    )
+
+    title = models.CharField(_("title"), max_length=255)
+    body = models.CharField(_("message"), max_length=1024)
+    segment = models.CharField(max_length=30, choices=SEGMENT_CHOICES)
+    disability_type = models.ForeignKey(DisabilityType, on_delete=models.SET_NULL, null=True, blank=True, related_name='broadcasts')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    recipients_count = models.PositiveIntegerField(default=0)
+    pushes_sent = models.PositiveIntegerField(default=0)
+    pushes_failed = models.PositiveIntegerField(default=0)
+    last_user_id = models.PositiveBigIntegerField(default=0)  # Checkpoint: recipients are processed in user id order 
+    error = models.TextField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='broadcasts')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.title} ({self.get_segment_display()}, {self.status})"
+
+
+# Account Deletion (a user's rows removed in the background, children first) 
+class AccountDeletion(models.Model):
+    STATUS_CHOICES = (
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+        ('failed', _('Failed')),
+    )
+
+    user_id = models.PositiveBigIntegerField(db_index=True)  # Not a foreign key: the user row is deleted last 
+    phone_number = models.CharField(max_length=17)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='requested_deletions')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
+    step = models.CharField(max_length=50, blank=True, default='')  # Rows currently being deleted 
+    rows_deleted = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.phone_number} ({self.status})"
+
+
+# One-Time Password (login codes when settings.OTP_STORE is 'db'; only the hash is stored) 
+class OneTimePassword(models.Model):
+    phone_number = models.CharField(max_length=17, unique=True)
+    code_hash = models.CharField(max_length=128)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    sent_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"OTP for {self.phone_number} (expires {self.expires_at:%Y-%m-%d %H:%M:%S})"
+
+
+
+# Wrong guardian PINs (when settings.PIN_FAILURE_STORE is 'db') 
+class PinFailure(models.Model):
+    guardian = models.OneToOneField(Guardian, on_delete=models.CASCADE, related_name='pin_failure')
+    failures = models.PositiveIntegerField(default=0)
+    last_failed_at = models.DateTimeField()
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.failures} wrong PINs for guardian {self.guardian_id}"
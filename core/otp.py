@@ -0,0 +1,132 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .models import OneTimePassword
+
+
+# Verification outcomes
+OTP_VALID = 'valid'
+OTP_INVALID = 'invalid'
+OTP_EXPIRED = 'expired'
+OTP_LOCKED = 'locked'
+
+# Fixed login code for the store review test account
+FIXED_OTPS = {
+    "507177774": "2252",
+}
+
+
+class OTPCooldown(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"OTP was sent less than {settings.OTP_RESEND_COOLDOWN_SECONDS}s ago")
+        self.retry_after = retry_after
+
+
+def _hash_code(phone_number, code):
+    return salted_hmac('core.otp', f'{phone_number}:{code}').hexdigest()
+
+
+# Codes, attempt counters and cooldowns kept in the shared cache
+class CacheOTPStore:
+    def _keys(self, phone_number):
+        return f'otp:{phone_number}', f'otp-attempts:{phone_number}', f'otp-cooldown:{phone_number}'
+
+    def issue(self, phone_number, code_hash, now):
+        code_key, attempts_key, cooldown_key = self._keys(phone_number)
+        if not cache.add(cooldown_key, now.timestamp(), settings.OTP_RESEND_COOLDOWN_SECONDS):
+            sent_at = cache.get(cooldown_key) or now.timestamp()
+            raise OTPCooldown(max(int(sent_at + settings.OTP_RESEND_COOLDOWN_SECONDS - now.timestamp()), 1))
+        cache.set(code_key, code_hash, settings.OTP_TTL_SECONDS)
+        cache.delete(attempts_key)
+
+    def check(self, phone_number, code_hash, now):
+        code_key, attempts_key, _cooldown_key = self._keys(phone_number)
+        stored = cache.get(code_key)
+        if stored is None:
+            return OTP_EXPIRED
+
+        cache.add(attempts_key, 0, settings.OTP_TTL_SECONDS)
+        try:
+            attempts = cache.incr(attempts_key)
+        except ValueError:
+            attempts = 1
+        if attempts > settings.OTP_MAX_ATTEMPTS:
+            cache.delete(code_key)
+            return OTP_LOCKED
+
+        if not constant_time_compare(stored, code_hash):
+            return OTP_INVALID
+        cache.delete_many([code_key, attempts_key])
+        return OTP_VALID
+
+
+# Same rules on a small table of its own, for deployments without a shared cache
+class DatabaseOTPStore:
+    def issue(self, phone_number, code_hash, now):
+        record = OneTimePassword.objects.filter(phone_number=phone_number).first()
+        if record is not None:
+            retry_after = (record.sent_at - now).total_seconds() + settings.OTP_RESEND_COOLDOWN_SECONDS
+            if retry_after > 0:
+                raise OTPCooldown(max(int(retry_after), 1))
+
+        values = {
+            'code_hash': code_hash,
+            'attempts': 0,
+            'sent_at': now,
+            'expires_at': now + timedelta(seconds=settings.OTP_TTL_SECONDS),
+        }
+        if record is None:
+            try:
+                OneTimePassword.objects.create(phone_number=phone_number, **values)
+                return
+            except IntegrityError:
+                raise OTPCooldown(settings.OTP_RESEND_COOLDOWN_SECONDS)
+        OneTimePassword.objects.filter(pk=record.pk).update(**values)
+
+    def check(self, phone_number, code_hash, now):
+        record = OneTimePassword.objects.filter(phone_number=phone_number).first()
+        if record is None or record.expires_at <= now:
+            return OTP_EXPIRED
+        if record.attempts >= settings.OTP_MAX_ATTEMPTS:
+            return OTP_LOCKED
+
+        # Count the attempt first; a concurrent attempt that got there before us wins
+        counted = OneTimePassword.objects.filter(pk=record.pk, attempts=record.attempts).update(
+            attempts=F('attempts') + 1
+        )
+        if not counted:
+            return OTP_INVALID
+
+        if not constant_time_compare(record.code_hash, code_hash):
+            return OTP_INVALID
+        OneTimePassword.objects.filter(pk=record.pk).delete()
+        return OTP_VALID
+
+
+def get_otp_store():
+    return DatabaseOTPStore() if settings.OTP_STORE == 'db' else CacheOTPStore()
+
+
+def issue_otp(phone_number):
+    """
+    Generate a login code for the phone number and store only its hash, valid for
+    OTP_TTL_SECONDS. Raises OTPCooldown when a code was sent within the resend cooldown.
+    """
+    code = FIXED_OTPS.get(phone_number) or str(random.randint(1000, 9999))
+    get_otp_store().issue(phone_number, _hash_code(phone_number, code), timezone.now())
+    return code
+
+
+def verify_otp(phone_number, code):
+    """
+    Check a login code: returns OTP_VALID (the code is consumed), OTP_INVALID, OTP_EXPIRED,
+    or OTP_LOCKED once OTP_MAX_ATTEMPTS wrong codes were tried.
+    """
+    return get_otp_store().check(phone_number, _hash_code(phone_number, str(code)), timezone.now())
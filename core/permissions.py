@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from .context import get_principal
 
 
 
@@ -20,10 +21,11 @@ class IsGuardianOwnDependent(permissions.BasePermission):
 
     def has_permission(self, request, view):
         # Allow only authenticated users with guardian profile
-        return bool(request.user and request.user.is_authenticated and hasattr(request.user, 'guardian'))
+        return bool(request.user and request.user.is_authenticated and get_principal(request).guardian)
 
     def has_object_permission(self, request, view, obj):
         # Only allow access to dependents owned by the guardian
-        return hasattr(request.user, 'guardian') and obj.guardian == request.user.guardian
+        guardian = get_principal(request).guardian
+        return guardian is not None and obj.guardian_id == guardian.id
 
 
@@ -0,0 +1,108 @@
+import hashlib
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PinFailure
+
+
+PIN_TOKEN_SALT = 'core.pin-verified'
+
+
+# Changes whenever the PIN changes, so resetting the PIN invalidates earlier tokens
+def _pin_fragment(guardian):
+    return hashlib.sha256((guardian.guardian_code_hashed or '').encode()).hexdigest()[:16]
+
+
+def issue_pin_token(guardian):
+    """Signed claim that this guardian entered the right PIN, valid for PIN_VERIFIED_TOKEN_SECONDS."""
+    return signing.dumps({'g': guardian.id, 'h': _pin_fragment(guardian)}, salt=PIN_TOKEN_SALT, compress=True)
+
+
+def check_pin_token(guardian, token):
+    try:
+        claim = signing.loads(token, salt=PIN_TOKEN_SALT, max_age=settings.PIN_VERIFIED_TOKEN_SECONDS)
+    except signing.BadSignature:
+        return False
+    return claim.get('g') == guardian.id and claim.get('h') == _pin_fragment(guardian)
+
+
+def _failures_key(guardian):
+    return f'pin-failures:{guardian.id}'
+
+
+def _lockout_key(guardian):
+    return f'pin-lockout:{guardian.id}'
+
+
+def _lockout_seconds(failures):
+    excess = failures - settings.PIN_FREE_ATTEMPTS
+    if excess <= 0:
+        return 0
+    return min(settings.PIN_LOCKOUT_BASE_SECONDS * 2 ** (excess - 1), settings.PIN_LOCKOUT_MAX_SECONDS)
+
+
+def pin_lockout_remaining(guardian):
+    """Seconds until the guardian may try a PIN again (0 when not locked out)."""
+    if settings.PIN_FAILURE_STORE == 'db':
+        locked_until = PinFailure.objects.filter(guardian_id=guardian.id).values_list('locked_until', flat=True).first()
+        if locked_until is None:
+            return 0
+        return max(int((locked_until - timezone.now()).total_seconds()) + 1, 0)
+
+    locked_until = cache.get(_lockout_key(guardian))
+    if locked_until is None:
+        return 0
+    return max(int(locked_until - time.time()) + 1, 0)
+
+
+def record_pin_failure(guardian):
+    """
+    Count a wrong PIN. After PIN_FREE_ATTEMPTS failures every further failure locks the
+    guardian out for PIN_LOCKOUT_BASE_SECONDS, doubling up to PIN_LOCKOUT_MAX_SECONDS.
+    Returns the lockout in seconds (0 while attempts are still free).
+    """
+    if settings.PIN_FAILURE_STORE == 'db':
+        return _record_pin_failure_row(guardian)
+
+    key = _failures_key(guardian)
+    cache.add(key, 0, settings.PIN_FAILURE_WINDOW_SECONDS)
+    try:
+        failures = cache.incr(key)
+    except ValueError:
+        failures = 1
+
+    lockout = _lockout_seconds(failures)
+    if lockout:
+        cache.set(_lockout_key(guardian), time.time() + lockout, lockout)
+    return lockout
+
+
+# Same counting on the guardian's PinFailure row, locked so concurrent workers count every failure
+def _record_pin_failure_row(guardian):
+    now = timezone.now()
+    with transaction.atomic():
+        row, _created = PinFailure.objects.select_for_update().get_or_create(
+            guardian_id=guardian.id, defaults={'last_failed_at': now}
+        )
+        if (now - row.last_failed_at).total_seconds() > settings.PIN_FAILURE_WINDOW_SECONDS:
+            row.failures = 0
+        row.failures += 1
+        row.last_failed_at = now
+        lockout = _lockout_seconds(row.failures)
+        if lockout:
+            row.locked_until = now + timedelta(seconds=lockout)
+        row.save()
+    return lockout
+
+
+def clear_pin_failures(guardian):
+    if settings.PIN_FAILURE_STORE == 'db':
+        PinFailure.objects.filter(guardian_id=guardian.id).delete()
+        return
+    cache.delete_many([_failures_key(guardian), _lockout_key(guardian)])
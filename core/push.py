@@ -0,0 +1,258 @@
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from fcm_django.models import FCMDevice
+from firebase_admin import messaging
+from firebase_admin.messaging import AndroidConfig, AndroidNotification, APNSConfig, APNSPayload, Aps
+from firebase_admin.messaging import Message as FCMMessage, Notification as FCM_Notification
+
+
+logger = logging.getLogger(__name__)
+
+# Firebase accepts at most 500 messages per send_each call 
+FCM_BATCH_SIZE = 500
+
+# Batch requests in flight at once when a send spans several batches 
+FCM_MAX_CONCURRENCY = 4
+
+
+# Build the push message sent to one device token 
+def build_fcm_message(token, title, body, data):
+    return FCMMessage(
+        token=token,
+        notification=FCM_Notification(
+            title=title,
+            body=body,
+        ),
+        android=AndroidConfig(
+            notification=AndroidNotification(
+                sound='default'
+            )
+        ),
+        apns=APNSConfig(
+            payload=APNSPayload(aps=Aps(sound='default'))
+        ),
+        data={str(k): str(v) for k, v in (data or {}).items()},
+    )
+
+
+# Minimal message used to validate a token with a dry-run send 
+def build_fcm_probe(token):
+    return FCMMessage(token=token)
+
+
+def _send_batch(batch, dry_run=False):
+    try:
+        return messaging.send_each(batch, dry_run=dry_run).responses
+    except Exception as e:
+        logger.error(f"FCM batch of {len(batch)} messages failed: {str(e)}")
+        return [None] * len(batch)
+
+
+def prune_dead_tokens(results):
+    """
+    Deactivate devices whose send came back UNREGISTERED, SENDER_ID_MISMATCH or
+    INVALID_ARGUMENT (invalid registration). Takes the (message, SendResponse or None)
+    pairs returned by send_fcm_messages; returns the deactivated registration ids.
+    """
+    sent = [(message.token, response) for message, response in results if response is not None]
+    if not sent:
+        return []
+    tokens, responses = zip(*sent)
+    deactivated = FCMDevice.objects.deactivate_devices_with_error_results(list(tokens), list(responses))
+    forget_fcm_devices(deactivated)
+    if deactivated:
+        logger.info(f"Deactivated {len(deactivated)} dead FCM tokens")
+    return deactivated
+
+
+def send_fcm_messages(messages, max_workers=FCM_MAX_CONCURRENCY, dry_run=False, prune=True):
+    """
+    Send token messages in Firebase batch requests of up to FCM_BATCH_SIZE, running at
+    most `max_workers` requests at once. Returns a list of (message, SendResponse or None)
+    in the order given; None means the whole batch request failed. Devices whose tokens
+    Firebase rejects are deactivated unless `prune` is False.
+    """
+    batches = [messages[start:start + FCM_BATCH_SIZE] for start in range(0, len(messages), FCM_BATCH_SIZE)]
+    send = (lambda batch: _send_batch(batch, dry_run=dry_run))
+    if len(batches) <= 1 or max_workers <= 1:
+        responses = [send(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            responses = list(executor.map(send, batches))
+
+    results = []
+    for batch, batch_responses in zip(batches, responses):
+        results.extend(zip(batch, batch_responses))
+    if prune:
+        prune_dead_tokens(results)
+    return results
+
+
+# Cache key holding the (user, type) a token was last registered with 
+def _device_cache_key(registration_id):
+    return 'fcm-device:' + hashlib.sha256(registration_id.encode()).hexdigest()
+
+
+def _device_fingerprint(user_id, device_type):
+    return f'{user_id}:{device_type}'
+
+
+def forget_fcm_devices(registration_ids):
+    """Drop cached registrations so the next register_fcm_device call goes to the database."""
+    if registration_ids:
+        cache.delete_many([_device_cache_key(registration_id) for registration_id in registration_ids])
+
+
+def register_fcm_device(user, registration_id, device_type):
+    """
+    Register (or re-activate) a device token for the user. Tokens are unique, so a token
+    last registered to another account moves to this one. The user's oldest active
+    devices are deactivated so at most FCM_MAX_DEVICES_PER_USER stay active.
+
+    Calls that change nothing are answered from a cached fingerprint without touching
+    the database. Returns True when a row was written.
+    """
+    key = _device_cache_key(registration_id)
+    fingerprint = _device_fingerprint(user.pk, device_type)
+    cache_seconds = settings.FCM_DEVICE_CACHE_SECONDS
+    if cache_seconds and cache.get(key) == fingerprint:
+        return False
+
+    with transaction.atomic():
+        device = FCMDevice.objects.filter(registration_id=registration_id).first()
+        if device is not None and device.user_id == user.pk and device.type == device_type and device.active:
+            if cache_seconds:
+                cache.set(key, fingerprint, cache_seconds)
+            return False
+
+        if device is None:
+            FCMDevice.objects.create(user=user, registration_id=registration_id, type=device_type, active=True)
+        else:
+            # Reassigned or re-activated: drop the previous registration's fingerprint first
+            forget_fcm_devices([registration_id])
+            device.user = user
+            device.type = device_type
+            device.active = True
+            # Counts as the newest registration, so the device cap below does not evict it again
+            device.date_created = timezone.now()
+            device.save(update_fields=['user', 'type', 'active', 'date_created'])
+
+        evicted = list(
+            FCMDevice.objects.filter(user=user, active=True)
+            .order_by('-date_created', '-id')
+            .values_list('id', 'registration_id')[settings.FCM_MAX_DEVICES_PER_USER:]
+        )
+        if evicted:
+            FCMDevice.objects.filter(id__in=[device_id for device_id, _token in evicted]).update(active=False)
+
+    forget_fcm_devices([token for _device_id, token in evicted])
+    if cache_seconds:
+        cache.set(key, fingerprint, cache_seconds)
+    return True
+
+
+class PushDispatcher:
+    """
+    Collects pushes submitted from request handlers for up to PUSH_DISPATCH_WINDOW_MS
+    (or PUSH_DISPATCH_MAX_BATCH messages) and sends them as one FCM batch request.
+    Each submitted message gets a Future resolved with its own SendResponse (or None).
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    # Start the sender thread on first use, and again in a forked worker process 
+    def _ensure_running(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='push-dispatcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, messages):
+        self._ensure_running()
+        futures = []
+        for message in messages:
+            future = Future()
+            self._queue.put((message, future))
+            futures.append(future)
+        return futures
+
+    def _collect(self, first):
+        window = settings.PUSH_DISPATCH_WINDOW_MS / 1000
+        max_batch = min(settings.PUSH_DISPATCH_MAX_BATCH, FCM_BATCH_SIZE)
+        batch = [first]
+        deadline = time.monotonic() + window
+        while len(batch) < max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _send(self, batch):
+        messages = [message for message, _future in batch]
+        responses = _send_batch(messages)
+        for (_message, future), response in zip(batch, responses):
+            future.set_result(response)
+
+        close_old_connections()
+        try:
+            prune_dead_tokens(list(zip(messages, responses)))
+        finally:
+            close_old_connections()
+
+    def _run(self):
+        while True:
+            batch = self._collect(self._queue.get())
+            try:
+                self._send(batch)
+            except Exception as e:
+                logger.error(f"Push dispatcher failed to send {len(batch)} messages: {str(e)}")
+                for _message, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+
+    # Send whatever is still queued (called at interpreter exit) 
+    def flush(self):
+        pending = []
+        while True:
+            try:
+                pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for start in range(0, len(pending), FCM_BATCH_SIZE):
+            self._send(pending[start:start + FCM_BATCH_SIZE])
+
+
+dispatcher = PushDispatcher()
+atexit.register(dispatcher.flush)
+
+
+def dispatch_fcm_messages(messages):
+    """Queue messages on the process-wide dispatcher; returns one Future per message."""
+    return dispatcher.submit(messages)
+
@@ -0,0 +1,148 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Min, Q
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from message.models import Message
+from .models import Dependent, ReportJob
+
+
+# Breakdowns available per report type: name -> expression grouped on 
+REPORT_BREAKDOWNS = {
+    'messages': {
+        'day': TruncDate('created_at'),
+        'month': TruncMonth('created_at'),
+        'message_type': F('message_type__message_type_id'),
+        'is_sms': F('is_sms'),
+        'is_voice': F('is_voice'),
+        'is_emergency': F('is_emergency'),
+        'gender': F('dependent__gender'),
+        'disability_type': F('dependent__disability_type_id'),
+    },
+    'dependents': {
+        'day': TruncDate('created_at'),
+        'month': TruncMonth('created_at'),
+        'gender': F('gender'),
+        'marital_status': F('marital_status'),
+        'control_method': F('control_method'),
+        'degree_type': F('degree_type'),
+        'disability_type': F('disability_type_id'),
+    },
+}
+
+REPORT_MODELS = {
+    'messages': Message,
+    'dependents': Dependent,
+}
+
+# Rows scanned per query; each chunk is an id range so it stays on the primary key index 
+REPORT_CHUNK_SIZE = 50000
+
+
+# Canonical form of a report definition, so identical requests share one job 
+def normalize_definition(report_type, start_date=None, end_date=None, breakdowns=None):
+    return {
+        'report_type': report_type,
+        'start_date': start_date.isoformat() if start_date else None,
+        'end_date': end_date.isoformat() if end_date else None,
+        'breakdowns': sorted(set(breakdowns or [])),
+    }
+
+
+def hash_definition(definition):
+    return hashlib.sha256(json.dumps(definition, sort_keys=True).encode()).hexdigest()
+
+
+def _report_queryset(definition):
+    queryset = REPORT_MODELS[definition['report_type']].objects.all()
+    if definition['start_date']:
+        queryset = queryset.filter(created_at__date__gte=definition['start_date'])
+    if definition['end_date']:
+        queryset = queryset.filter(created_at__date__lte=definition['end_date'])
+    return queryset
+
+
+def stale_report_jobs():
+    """Jobs marked running whose worker has not reported progress within REPORT_JOB_STALE_SECONDS."""
+    cutoff = timezone.now() - timedelta(seconds=settings.REPORT_JOB_STALE_SECONDS)
+    return ReportJob.objects.filter(status='running').filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+
+
+def requeue_stale_report_jobs():
+    """
+    Put jobs left running by a dead worker back in the queue, or fail them once they have
+    been started REPORT_JOB_MAX_ATTEMPTS times. Returns the number of jobs requeued.
+    """
+    stale = stale_report_jobs()
+    stale.filter(attempts__gte=settings.REPORT_JOB_MAX_ATTEMPTS).update(
+        status='failed',
+        error='Worker stopped before the report completed',
+        completed_at=timezone.now()
+    )
+    return stale.update(status='pending', progress=0, processed_rows=0)
+
+
+def _json_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def run_report(job, chunk_size=REPORT_CHUNK_SIZE):
+    """
+    Compute a report job in id-range chunks, grouping each chunk in the database
+    and merging the partial counts. Progress is written after every chunk.
+    """
+    definition = job.definition
+    breakdowns = definition['breakdowns']
+    # Aliased so a breakdown may share its name with a model field 
+    expressions = {f'by_{name}': REPORT_BREAKDOWNS[definition['report_type']][name] for name in breakdowns}
+    queryset = _report_queryset(definition)
+
+    bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+    totals = {}
+    processed = 0
+
+    if bounds['low'] is not None:
+        span = bounds['high'] - bounds['low'] + 1
+        for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+            chunk = queryset.filter(id__gte=start, id__lt=start + chunk_size)
+            if expressions:
+                rows = chunk.values(**expressions).annotate(count=Count('id')).order_by()
+            else:
+                rows = [chunk.aggregate(count=Count('id'))]
+
+            for row in rows:
+                key = tuple(row.get(f'by_{name}') for name in breakdowns)
+                totals[key] = totals.get(key, 0) + row['count']
+                processed += row['count']
+
+            scanned = min(start + chunk_size, bounds['high'] + 1) - bounds['low']
+            ReportJob.objects.filter(pk=job.pk).update(
+                processed_rows=processed,
+                progress=int(scanned * 100 / span),
+                heartbeat_at=timezone.now(),
+            )
+
+    result_rows = [
+        {**{name: _json_value(value) for name, value in zip(breakdowns, key)}, 'count': count}
+        for key, count in totals.items()
+        if count
+    ]
+    result_rows.sort(key=lambda row: [str(row[name]) for name in breakdowns])
+
+    job.result = {
+        'definition': definition,
+        'total': processed,
+        'rows': result_rows,
+    }
+    job.processed_rows = processed
+    job.progress = 100
+    job.status = 'completed'
+    job.completed_at = timezone.now()
+    job.save(update_fields=['result', 'processed_rows', 'progress', 'status', 'completed_at'])
+    return job
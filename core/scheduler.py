@@ -0,0 +1,232 @@
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import JobLease
+
+
+logger = logging.getLogger(__name__)
+
+CRON_FIELD_RANGES = (
+    (0, 59),  # minute
+    (0, 23),  # hour
+    (1, 31),  # day of month
+    (1, 12),  # month
+    (0, 6),   # day of week (0 = Sunday)
+)
+
+
+def _parse_cron_field(value, low, high):
+    values = set()
+    for part in value.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-'))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron value '{value}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+# Five-field cron expression (minute hour day-of-month month day-of-week) 
+class CronSchedule:
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression '{expression}' must have 5 fields")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELD_RANGES)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def _day_matches(self, moment):
+        if moment.month not in self.months:
+            return False
+        day_match = moment.day in self.days
+        weekday_match = (moment.weekday() + 1) % 7 in self.weekdays
+        # Cron semantics: when both day fields are restricted either one may match 
+        if not self.any_day and not self.any_weekday:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def previous_run(self, now, max_days=366):
+        """Latest scheduled time at or before `now` (in the current time zone), or None."""
+        moment = timezone.localtime(now).replace(second=0, microsecond=0)
+        day = moment
+        for _ in range(max_days):
+            if self._day_matches(day):
+                for hour in sorted(self.hours, reverse=True):
+                    for minute in sorted(self.minutes, reverse=True):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate <= moment:
+                            return candidate
+            day = (day - timedelta(days=1)).replace(hour=23, minute=59)
+        return None
+
+
+# Identifier of this scheduler process 
+def scheduler_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _ensure_lease(name):
+    try:
+        JobLease.objects.get_or_create(name=name)
+    except IntegrityError:
+        pass
+
+
+def claim_run(name, scheduled_for, owner, ttl):
+    """
+    Claim the run of `name` scheduled at `scheduled_for`. The conditional UPDATE only
+    succeeds on one node: the run must not be done yet and no live lease may exist.
+    """
+    now = timezone.now()
+    _ensure_lease(name)
+    return JobLease.objects.filter(name=name).filter(
+        Q(last_run_at__isnull=True) | Q(last_run_at__lt=scheduled_for)
+    ).filter(
+        Q(owner__isnull=True) | Q(expires_at__lt=now)
+    ).update(
+        owner=owner,
+        expires_at=now + ttl,
+        heartbeat_at=now,
+    ) == 1
+
+
+# Take a standing lease (for long-running workers rather than scheduled runs) 
+def acquire_lease(name, owner, ttl):
+    now = timezone.now()
+    _ensure_lease(name)
+    return JobLease.objects.filter(name=name).filter(
+        Q(owner__isnull=True) | Q(owner=owner) | Q(expires_at__lt=now)
+    ).update(
+        owner=owner,
+        expires_at=now + ttl,
+        heartbeat_at=now,
+    ) == 1
+
+
+def release_lease(name, owner):
+    JobLease.objects.filter(name=name, owner=owner).update(owner=None, expires_at=None)
+
+
+def extend_lease(name, owner, ttl):
+    now = timezone.now()
+    return JobLease.objects.filter(name=name, owner=owner).update(
+        expires_at=now + ttl,
+        heartbeat_at=now,
+    ) == 1
+
+
+def release_run(name, owner, scheduled_for):
+    JobLease.objects.filter(name=name, owner=owner).update(
+        owner=None,
+        expires_at=None,
+        last_run_at=scheduled_for,
+    )
+
+
+# Skip a run that is too old to catch up on, without running it 
+def skip_run(name, scheduled_for):
+    _ensure_lease(name)
+    JobLease.objects.filter(name=name).filter(
+        Q(last_run_at__isnull=True) | Q(last_run_at__lt=scheduled_for)
+    ).update(last_run_at=scheduled_for)
+
+
+# Keeps a lease alive from a background thread while its job runs 
+class LeaseHeartbeat(threading.Thread):
+    def __init__(self, name, owner, ttl):
+        super().__init__(daemon=True)
+        self.lease_name = name
+        self.owner = owner
+        self.ttl = ttl
+        self.stopped = threading.Event()
+
+    def run(self):
+        interval = max(self.ttl.total_seconds() / 3, 1)
+        try:
+            while not self.stopped.wait(interval):
+                if not extend_lease(self.lease_name, self.owner, self.ttl):
+                    logger.warning(f"Lost lease on {self.lease_name}")
+                    return
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class ScheduledJob:
+    def __init__(self, schedule, path):
+        self.name = path
+        self.path = path
+        self.schedule = CronSchedule(schedule)
+
+    def __str__(self):
+        return f"{self.schedule.expression} {self.path}"
+
+
+# Jobs declared in settings.SCHEDULED_JOBS as (cron expression, dotted path) 
+def get_scheduled_jobs():
+    return [ScheduledJob(schedule, path) for schedule, path in settings.SCHEDULED_JOBS]
+
+
+def run_claimed_job(job, owner, scheduled_for):
+    """Run a job whose lease is held, heartbeating until it finishes, then release it."""
+    ttl = timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+    heartbeat = LeaseHeartbeat(job.name, owner, ttl)
+    heartbeat.start()
+    try:
+        close_old_connections()
+        logger.info(f"Running {job.name} scheduled for {scheduled_for:%Y-%m-%d %H:%M}")
+        import_string(job.path)()
+    except Exception:
+        logger.exception(f"Scheduled job {job.name} failed")
+    finally:
+        heartbeat.stop()
+        heartbeat.join()
+        release_run(job.name, owner, scheduled_for)
+        connection.close()
+
+
+def due_runs(jobs, owner, now=None):
+    """
+    Claim every job whose latest scheduled time has not run yet. Missed runs are caught up
+    once (coalesced) as long as they are within SCHEDULER_MAX_CATCH_UP_SECONDS.
+    Returns (job, scheduled_for) pairs this node now owns.
+    """
+    now = now or timezone.now()
+    ttl = timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+    max_catch_up = timedelta(seconds=settings.SCHEDULER_MAX_CATCH_UP_SECONDS)
+    claimed = []
+    for job in jobs:
+        scheduled_for = job.schedule.previous_run(now)
+        if scheduled_for is None:
+            continue
+        if now - scheduled_for > max_catch_up:
+            skip_run(job.name, scheduled_for)
+            continue
+        if claim_run(job.name, scheduled_for, owner, ttl):
+            claimed.append((job, scheduled_for))
+    return claimed
@@ -5,9 +5,11 @@ from rest_framework import serializers
 
 from message.serializers import MessageMiniSerializer
 from django.conf import settings
-from .models import  AppSettings, DisabilityType, Guardian, Dependent, GuardianMessageDefault, User 
+from .models import  AppSettings, Broadcast, ChangeLogEntry, DisabilityType, Guardian, Dependent, GuardianMessageDefault, ReportJob, User 
+from .reports import REPORT_BREAKDOWNS
+from .context import get_principal
+from .otp import OTPCooldown, issue_otp
 from .utils import TaqnyatSMSService 
-import random
 
 # Phone Login Serializer 
 class PhoneLoginSerializer(serializers.Serializer):
@@ -16,35 +18,26 @@ class PhoneLoginSerializer(serializers.Serializer):
     def validate(self, attrs):
         phone_number = attrs.get('phone_number')
 
-        user, created = User.objects.get_or_create(
-            phone_number=phone_number,
-            defaults={'role': 'guardian', 'is_active': True, 'is_block': False}
-        )
-    
-        if created and user.role == 'guardian':
-            Guardian.objects.create(user=user)
+        # New numbers stay pending in the OTP store; the account is created once the code is verified
+        user = User.objects.filter(phone_number=phone_number).only('id', 'phone_number', 'role', 'is_block', 'is_deleted').first()
 
         # Check if user is blocked 
-        if user.is_block :
+        if user and user.is_block :
             raise serializers.ValidationError({"detail": _('تم حظر حساب المستخدم.')}) 
         
-        if user.is_deleted:
+        if user and user.is_deleted:
             raise serializers.ValidationError({"detail": _('تم حذف حساب المستخدم. يرجى الاتصال بالدعم الفني.')})
         
-        # OTP ثابت لرقم معين
-        if phone_number == "507177774":  
-            otp = "2252"
-        else:
-            otp = str(random.randint(1000, 9999))
-
-        user.otp = otp
-        user.save()
-        print(f"OTP for {user.phone_number} is {otp}")
+        # The code itself is kept in the OTP store (hashed, with TTL and attempt limit), never on the user row
+        try:
+            otp = issue_otp(phone_number)
+        except OTPCooldown as e:
+            raise serializers.ValidationError({"detail": _('يرجى الانتظار {seconds} ثانية قبل طلب رمز جديد.').format(seconds=e.retry_after)})
 
         # Send OTP via SMS
         sms_service = TaqnyatSMSService()
         sms_response = sms_service.send_sms(
-            recipients=[user.phone_number],
+            recipients=[phone_number],
             message=f"عزيزنا العميل،\nكود التحقق الخاص بكم للدخول الى منصة شركة رزان عدنان المليك للتجارة هو {otp}",
             sender_name=settings.TAQNYAT_SENDER_NAME
         )
@@ -153,9 +146,8 @@ class SetGuardianPinCodeSerializer(serializers.Serializer):
         if user.role != 'guardian':
             raise serializers.ValidationError({"detail" : _("Only guardians can set PIN code.")})
 
-        try:
-            guardian = Guardian.objects.get(user=user)
-        except Guardian.DoesNotExist:
+        guardian = get_principal(self.context['request']).guardian
+        if guardian is None:
             raise serializers.ValidationError({"detail" : _("Guardian not found.")})
 
         if guardian.guardian_code_hashed:
@@ -267,6 +259,43 @@ class SimpleGuardianSerializer(serializers.ModelSerializer):
         return representation
     
 
+# Guardian Bulk Action Serializers (guardians selected by ids or with the guardian list filters) 
+class GuardianBulkFilterSerializer(serializers.Serializer):
+    user__is_active = serializers.BooleanField(required=False)
+    user__is_block = serializers.BooleanField(required=False)
+    user__is_deleted = serializers.BooleanField(required=False)
+
+
+class GuardianBulkSelectionSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+        max_length=settings.GUARDIAN_BULK_MAX_ROWS,
+    )
+    filter = GuardianBulkFilterSerializer(required=False)
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError({"detail": _('يجب تحديد معرفات المشرفين أو عامل التصفية.')})
+        # An empty filter (or one with only unknown keys) would select every guardian 
+        if 'filter' in attrs and not attrs['filter']:
+            raise serializers.ValidationError({"filter": _('يجب أن يحتوي عامل التصفية على شرط واحد على الأقل.')})
+        return attrs
+
+
+class GuardianBulkBlockSerializer(GuardianBulkSelectionSerializer):
+    is_block = serializers.BooleanField()
+
+
+class GuardianBulkActivateSerializer(GuardianBulkSelectionSerializer):
+    is_active = serializers.BooleanField()
+
+
+class GuardianBulkMessagesSerializer(GuardianBulkSelectionSerializer):
+    messages_per_month = serializers.IntegerField(min_value=0)
+
+
 # Disability Type Serializer 
 class DisabilityTypeSerializer(serializers.ModelSerializer):
     dependents_count = serializers.SerializerMethodField()
@@ -314,10 +343,21 @@ class DependentSerializer(serializers.ModelSerializer):
         ]
 
     def create(self, validated_data):
-        guardian = self.context['request'].user.guardian
+        guardian = get_principal(self.context['request']).guardian
         if not guardian:
             raise serializers.ValidationError({'detail': _('Guardian profile not found.')})
-        return Dependent.objects.create(guardian=guardian, **validated_data)
+        interests = validated_data.pop('interest_field', None)
+        dependent = Dependent.objects.create(guardian=guardian, **validated_data)
+        if interests:
+            dependent.set_interests(interests)
+        return dependent
+
+    def update(self, instance, validated_data):
+        interests = validated_data.pop('interest_field', None)
+        instance = super().update(instance, validated_data)
+        if interests is not None:
+            instance.set_interests(interests)
+        return instance
 
     def validate(self, attrs):
         # Validate control method
@@ -384,6 +424,7 @@ class AppSettingsSerializer(serializers.ModelSerializer):
     class Meta:
         model = AppSettings
         fields = '__all__'
+        read_only_fields = ['immediate_guardian_increment']
 
 
 # Guardian Message Default Serializer 
@@ -393,3 +434,66 @@ class GuardianMessageDefaultSerializer(serializers.ModelSerializer):
         fields = ["id", "guardian", "messages_per_month", "app_settings"]
         read_only_fields = ["id", "guardian", "app_settings"]
 
+
+# Report Definition Serializer (input for a report job) 
+class ReportDefinitionSerializer(serializers.Serializer):
+    report_type = serializers.ChoiceField(choices=ReportJob.REPORT_TYPE_CHOICES)
+    start_date = serializers.DateField(required=False, allow_null=True)
+    end_date = serializers.DateField(required=False, allow_null=True)
+    breakdowns = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+
+    def validate(self, attrs):
+        allowed = REPORT_BREAKDOWNS[attrs['report_type']]
+        invalid = [name for name in attrs.get('breakdowns', []) if name not in allowed]
+        if invalid:
+            raise serializers.ValidationError({'breakdowns': _('Invalid breakdowns: %(names)s. Allowed: %(allowed)s') % {
+                'names': ', '.join(invalid),
+                'allowed': ', '.join(allowed),
+            }})
+
+        start_date, end_date = attrs.get('start_date'), attrs.get('end_date')
+        if start_date and end_date and start_date > end_date:
+            raise serializers.ValidationError({'end_date': _('End date must be after start date.')})
+        return attrs
+
+
+# Report Job Serializer 
+class ReportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'report_type', 'definition', 'status', 'progress', 'processed_rows',
+            'error', 'created_by', 'created_at', 'started_at', 'completed_at'
+        ]
+        read_only_fields = fields
+
+
+# Change Log Entry Serializer 
+class ChangeLogEntrySerializer(serializers.ModelSerializer):
+    offset = serializers.IntegerField(source='id', read_only=True)
+
+    class Meta:
+        model = ChangeLogEntry
+        fields = ['offset', 'model', 'object_id', 'action', 'data', 'created_at']
+
+
+# Broadcast Serializer 
+class BroadcastSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Broadcast
+        fields = [
+            'id', 'title', 'body', 'segment', 'disability_type', 'status', 'recipients_count',
+            'pushes_sent', 'pushes_failed', 'error', 'created_by', 'created_at', 'started_at', 'completed_at'
+        ]
+        read_only_fields = [
+            'status', 'recipients_count', 'pushes_sent', 'pushes_failed', 'error',
+            'created_by', 'created_at', 'started_at', 'completed_at'
+        ]
+
+    def validate(self, attrs):
+        if attrs.get('segment') == 'disability_type' and not attrs.get('disability_type'):
+            raise serializers.ValidationError({'disability_type': _('Disability type is required for this segment.')})
+        if attrs.get('segment') != 'disability_type':
+            attrs['disability_type'] = None
+        return attrs
+
@@ -1,6 +1,11 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import GuardianMessageDefault, AppSettings, Guardian
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from message.models import Message
+from .authentication import invalidate_principal
+from .changelog import record_change
+from .tokens import forget_blacklisted, remember_blacklisted
+from .models import Dependent, GuardianMessageDefault, AppSettings, Guardian, User
 
 
 @receiver(post_save, sender=Guardian)
@@ -19,3 +24,45 @@ def create_guardian_message_default(sender, instance, created, **kwargs):
             "app_settings": app_settings,
         },
     )
+
+
+# Change feed: log every create, update and delete of the tracked models 
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=Dependent)
+@receiver(post_save, sender=Guardian)
+@receiver(post_save, sender=GuardianMessageDefault)
+def log_saved_change(sender, instance, created, **kwargs):
+    record_change(instance, 'create' if created else 'update')
+
+
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=Dependent)
+@receiver(post_delete, sender=Guardian)
+@receiver(post_delete, sender=GuardianMessageDefault)
+def log_deleted_change(sender, instance, **kwargs):
+    record_change(instance, 'delete')
+
+
+# Cached JWT principals: drop the cached copy whenever the user or guardian row changes 
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_principal(sender, instance, **kwargs):
+    invalidate_principal(instance.pk)
+
+
+@receiver(post_save, sender=Guardian)
+@receiver(post_delete, sender=Guardian)
+def invalidate_guardian_principal(sender, instance, **kwargs):
+    invalidate_principal(instance.user_id)
+
+
+
+# Blacklisting from anywhere (rotation, logout, admin) is mirrored in the cache the refresh check reads 
+@receiver(post_save, sender=BlacklistedToken)
+def cache_blacklisted_token(sender, instance, **kwargs):
+    remember_blacklisted(instance.token.jti, instance.token.expires_at)
+
+
+@receiver(post_delete, sender=BlacklistedToken)
+def uncache_blacklisted_token(sender, instance, **kwargs):
+    forget_blacklisted(instance.token.jti)
@@ -1,76 +1,299 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from django.db.models import F
-from core.utils import send_notification_to_user  
-from .utils import send_notification_to_user
-from .models import AppSettings, GuardianMessageDefault
+from django.db.models import F, Value
+from django.db.models.functions import Least
+from fcm_django.models import FCMDevice
+from .changelog import record_changes
+from .jobs import record_rows, tracked_job
+from .push import FCM_BATCH_SIZE, build_fcm_probe, prune_dead_tokens, send_fcm_messages
+from .utils import create_bulk_notifications, push_bulk_notifications, send_bulk_notification
+from .broadcasts import run_broadcast
+from .deletions import run_account_deletion
+from .models import AccountDeletion, AppSettings, Broadcast, GuardianMessageDefault, JobCheckpoint, ReportJob
+from .reports import requeue_stale_report_jobs, run_report
+from .tokens import prune_expired_tokens, token_table_stats
+
+
+logger = logging.getLogger(__name__)
+
+
+# Rows updated per transaction by the set-based batch jobs 
+ROLLOVER_CHUNK_SIZE = 2000
+
+
+# Yield (id, user_id) rows of a GuardianMessageDefault queryset in keyset pages 
+def _guardian_default_chunks(queryset, chunk_size=ROLLOVER_CHUNK_SIZE):
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'guardian__user_id')[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
 
 
 # Notify guardians whose message package has expired 
+@tracked_job
 def notify_expired_guardians():
+    """
+    Notify expired guardians chunk by chunk. Each chunk creates its Notification rows,
+    flips notified_expired and advances the checkpoint in one transaction, then pushes.
+    A crashed run resumes after the last committed chunk instead of starting over.
+    """
+    title = "انتهت الباقة الشهرية"
+    notification_body = "لقد استهلكت كل الرسائل المسموح بها لهذا الشهر."
+
+    checkpoint, _ = JobCheckpoint.objects.get_or_create(name='notify_expired_guardians')
     expired = GuardianMessageDefault.objects.filter(
         messages_per_month__gte=F("app_settings__max_sms_message"),
-        notified_expired=False
+        notified_expired=False,
+        id__gt=checkpoint.position
     )
-    for record in expired:
-        guardian = record.guardian
-        print(f"Notify guardian {guardian.id}: package expired")
-        title = "انتهت الباقة الشهرية"
-        notification_body = "لقد استهلكت كل الرسائل المسموح بها لهذا الشهر."
-        send_notification_to_user(
-            user=guardian.user,
-            title=title,
-            body=notification_body,
-            data={"type": "package_expired"}
-        )
-        record.notified_expired = True
-        record.save()
 
+    for rows in _guardian_default_chunks(expired):
+        ids = [record_id for record_id, _user_id in rows]
+        with transaction.atomic():
+            notifications = create_bulk_notifications(
+                user_ids=[user_id for _record_id, user_id in rows],
+                title=title,
+                body=notification_body,
+                notification_type="package_expired"
+            )
+            GuardianMessageDefault.objects.filter(id__in=ids).update(notified_expired=True)
+            record_changes(GuardianMessageDefault, ids, 'update', {'notified_expired': True})
+            checkpoint.position = ids[-1]
+            checkpoint.save(update_fields=['position', 'updated_at'])
+
+        push_bulk_notifications(notifications, title, notification_body, {"type": "package_expired"})
+        record_rows(len(ids))
+        logger.info(f"Notified {len(ids)} guardians: package expired")
+
+    # Finished: the next run scans from the beginning again 
+    checkpoint.position = 0
+    checkpoint.save(update_fields=['position', 'updated_at'])
 
-# Reset monthly messages for all guardians at the start of a new month 
+
+# Add `diff` messages to every guardian of the app settings, clamped to their maximum.
+# With a checkpoint, guardians up to its position are skipped and it advances with every chunk 
+def increment_guardian_messages(app_settings, diff, chunk_size=ROLLOVER_CHUNK_SIZE, checkpoint=None):
+    updated = 0
+    records = GuardianMessageDefault.objects.filter(app_settings=app_settings)
+    if checkpoint is not None:
+        records = records.filter(id__gt=checkpoint.position)
+    for rows in _guardian_default_chunks(records, chunk_size):
+        ids = [record_id for record_id, _user_id in rows]
+        with transaction.atomic():
+            updated += GuardianMessageDefault.objects.filter(id__in=ids).update(
+                messages_per_month=Least(F('messages_per_month') + diff, Value(app_settings.max_sms_message))
+            )
+            record_changes(GuardianMessageDefault, ids, 'update')
+            if checkpoint is not None:
+                checkpoint.position = ids[-1]
+                checkpoint.save(update_fields=['position', 'updated_at'])
+        record_rows(len(ids))
+    return updated
+
+
+# Reset monthly messages for all guardians at the start of a new month (scheduled in settings.SCHEDULED_JOBS) 
+@tracked_job
 def reset_monthly_messages():
-    today = timezone.now().date()
-
-    # If it's not the first day of the month, do nothing
-    if today.day != 1:
-        return  
-
-    records = GuardianMessageDefault.objects.all()
-    for record in records:
-        record.messages_per_month = record.app_settings.max_sms_message
-        record.notified_expired = False
-        record.save()
-
-        guardian = record.guardian
-        title = "تم تجديد الباقة الشهرية"
-        notification_body = f"تم تجديد رصيد رسائلك إلى {record.app_settings.max_sms_message} رسالة."
-
-        send_notification_to_user(
-            user=guardian.user,
-            title=title,
-            body=notification_body,
-            data={"type": "package_renewed"}
-        )
+    title = "تم تجديد الباقة الشهرية"
+    for app_settings in AppSettings.objects.all():
+        notification_body = f"تم تجديد رصيد رسائلك إلى {app_settings.max_sms_message} رسالة."
+        records = GuardianMessageDefault.objects.filter(app_settings=app_settings)
 
+        for rows in _guardian_default_chunks(records):
+            ids = [record_id for record_id, _user_id in rows]
+            with transaction.atomic():
+                GuardianMessageDefault.objects.filter(id__in=ids).update(
+                    messages_per_month=app_settings.max_sms_message,
+                    notified_expired=False
+                )
+                record_changes(GuardianMessageDefault, ids, 'update', {
+                    'messages_per_month': app_settings.max_sms_message,
+                    'notified_expired': False,
+                })
 
-# Reset Or Increment Guardians 
-def reset_or_increment_guardians():
-    today = timezone.now().date()
-    if today.day != 1:
-        return
+            # Notify the whole chunk at once, after its transaction has committed 
+            send_bulk_notification(
+                user_ids=[user_id for _record_id, user_id in rows],
+                title=title,
+                body=notification_body,
+                data={"type": "package_renewed"}
+            )
+            record_rows(len(ids))
+            logger.info(f"Renewed packages for {len(ids)} guardians")
 
-    settings = AppSettings.objects.first()
-    if not settings:
+
+# Reset Or Increment Guardians (scheduled for the first day of the month in settings.SCHEDULED_JOBS) 
+@tracked_job
+def reset_or_increment_guardians():
+    app_settings = AppSettings.objects.first()
+    if not app_settings:
         return
 
     # If there is a pending_guardian_increment, apply it
-    if hasattr(settings, 'pending_guardian_increment') and settings.pending_guardian_increment:
-        diff = settings.pending_guardian_increment
-        new_max = settings.max_sms_message
-        for guardian_default in GuardianMessageDefault.objects.filter(app_settings=settings):
-            guardian_default.messages_per_month += diff
-            if guardian_default.messages_per_month > new_max:
-                guardian_default.messages_per_month = new_max
-            guardian_default.save()
-
-        settings.pending_guardian_increment = 0
-        settings.save(update_fields=['pending_guardian_increment'])
+    if app_settings.pending_guardian_increment:
+        updated = increment_guardian_messages(app_settings, app_settings.pending_guardian_increment)
+        logger.info(f"Applied pending increment of {app_settings.pending_guardian_increment} to {updated} guardians")
+
+        app_settings.pending_guardian_increment = 0
+        app_settings.save(update_fields=['pending_guardian_increment'])
+
+
+# Apply increments queued by AppSettingsView (update_guardians_now) outside the web request 
+@tracked_job
+def apply_immediate_guardian_increment():
+    """
+    The claimed amount and the last guardian it was applied to are kept in a JobCheckpoint,
+    so a run that stopped part way resumes where it left off instead of losing the rest.
+    """
+    for app_settings in AppSettings.objects.all():
+        name = f'apply_immediate_guardian_increment:{app_settings.pk}'
+        checkpoint = JobCheckpoint.objects.filter(name=name, amount__gt=0).first()
+
+        if checkpoint is None:
+            diff = app_settings.immediate_guardian_increment
+            if diff <= 0:
+                continue
+
+            # Claim the queued amount into the checkpoint; an increment queued meanwhile is left for the next run 
+            with transaction.atomic():
+                claimed = AppSettings.objects.filter(pk=app_settings.pk, immediate_guardian_increment=diff).update(
+                    immediate_guardian_increment=F('immediate_guardian_increment') - diff
+                )
+                if not claimed:
+                    continue
+                checkpoint, _ = JobCheckpoint.objects.update_or_create(name=name, defaults={'amount': diff, 'position': 0})
+        else:
+            logger.info(f"Resuming immediate increment of {checkpoint.amount} after guardian default {checkpoint.position}")
+
+        updated = increment_guardian_messages(app_settings, checkpoint.amount, checkpoint=checkpoint)
+        logger.info(f"Applied immediate increment of {checkpoint.amount} to {updated} guardians")
+
+        checkpoint.amount = 0
+        checkpoint.position = 0
+        checkpoint.save(update_fields=['amount', 'position', 'updated_at'])
+
+
+# Process pending report jobs (claimed one at a time, so several workers can run side by side) 
+@tracked_job
+def process_report_jobs():
+    requeued = requeue_stale_report_jobs()
+    if requeued:
+        logger.warning(f"Requeued {requeued} report jobs left running by a stopped worker")
+
+    while True:
+        job = ReportJob.objects.filter(status='pending').order_by('created_at').first()
+        if not job:
+            return
+
+        now = timezone.now()
+        claimed = ReportJob.objects.filter(pk=job.pk, status='pending').update(
+            status='running',
+            started_at=now,
+            heartbeat_at=now,
+            attempts=F('attempts') + 1
+        )
+        if not claimed:
+            continue
+
+        job.refresh_from_db()
+        logger.info(f"Running report job {job.id}: {job.definition}")
+        try:
+            run_report(job)
+            record_rows(job.processed_rows)
+        except Exception as e:
+            ReportJob.objects.filter(pk=job.pk).update(
+                status='failed',
+                error=str(e),
+                completed_at=timezone.now()
+            )
+
+
+# Send queued broadcasts; the scheduler lease makes this the only runner, so broadcasts left running by a crash are resumed 
+@tracked_job
+def process_broadcasts():
+    for broadcast in Broadcast.objects.filter(status__in=['pending', 'running']).order_by('created_at'):
+        if broadcast.status == 'pending':
+            broadcast.status = 'running'
+            broadcast.started_at = timezone.now()
+            broadcast.save(update_fields=['status', 'started_at'])
+
+        logger.info(f"Sending broadcast {broadcast.id} to segment {broadcast.segment}")
+        recipients_before = broadcast.recipients_count
+        try:
+            run_broadcast(broadcast)
+        except Exception as e:
+            Broadcast.objects.filter(pk=broadcast.pk).update(
+                status='failed',
+                error=str(e),
+                completed_at=timezone.now()
+            )
+        record_rows(broadcast.recipients_count - recipients_before)
+
+
+
+# Delete the rows of accounts queued by request_account_deletion 
+@tracked_job
+def process_account_deletions():
+    for deletion in AccountDeletion.objects.filter(status__in=['pending', 'running']).order_by('created_at'):
+        if deletion.status == 'pending':
+            deletion.status = 'running'
+            deletion.started_at = timezone.now()
+            deletion.save(update_fields=['status', 'started_at'])
+
+        logger.info(f"Deleting account {deletion.user_id}")
+        rows_before = deletion.rows_deleted
+        try:
+            run_account_deletion(deletion)
+        except Exception as e:
+            AccountDeletion.objects.filter(pk=deletion.pk).update(
+                status='failed',
+                error=str(e),
+                completed_at=timezone.now()
+            )
+        record_rows(deletion.rows_deleted - rows_before)
+
+
+# Validate old device tokens with a dry-run send and delete devices that are no longer active 
+@tracked_job
+def sweep_stale_fcm_devices(chunk_size=FCM_BATCH_SIZE):
+    cutoff = timezone.now() - timedelta(days=settings.FCM_STALE_DEVICE_DAYS)
+    stale = FCMDevice.objects.filter(active=True, date_created__lt=cutoff)
+
+    checked = 0
+    deactivated = 0
+    last_id = 0
+    while True:
+        rows = list(stale.filter(id__gt=last_id).order_by('id').values_list('id', 'registration_id')[:chunk_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        results = send_fcm_messages([build_fcm_probe(token) for _id, token in rows], dry_run=True, prune=False)
+        deactivated += len(prune_dead_tokens(results))
+        checked += len(rows)
+
+    deleted, _ = FCMDevice.objects.filter(active=False).delete()
+    logger.info(f"Checked {checked} stale FCM devices, deactivated {deactivated}, deleted {deleted} inactive")
+    record_rows(checked + deleted)
+
+
+@tracked_job
+def prune_token_blacklist():
+    deleted = prune_expired_tokens()
+    stats = token_table_stats()
+    logger.info(
+        f"Pruned {deleted} expired tokens; token tables now hold {stats['outstanding']} outstanding "
+        f"and {stats['blacklisted']} blacklisted rows"
+        + (f" ({stats['outstanding_bytes']} + {stats['blacklisted_bytes']} bytes)" if 'outstanding_bytes' in stats else "")
+    )
+    record_rows(deleted)
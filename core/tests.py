@@ -1,3 +1,1131 @@
-from django.test import TestCase
+import csv
+import json
+import re
+import time
+import tracemalloc
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from fcm_django.models import FCMDevice
+from firebase_admin import exceptions, messaging
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from message.models import EscalationTimer, Message
+
+from . import tasks
+from .authentication import PRINCIPAL_USER_FIELDS, build_principal, load_principal
+from .broadcasts import run_broadcast
+from .checks import check_shared_cache
+from .context import PrincipalContext
+from .deletions import request_account_deletion, run_account_deletion
+from .exports import iterate_by_pk
+from .jobs import record_rows, track_job
+from .models import AppSettings, Broadcast, ChangeLogEntry, Dependent, DisabilityType, Guardian, GuardianMessageDefault, JobCheckpoint, JobLease, JobRun, Notification, OneTimePassword, PinFailure, ReportJob, User
+from .otp import OTP_EXPIRED, OTP_INVALID, OTP_LOCKED, OTP_VALID, OTPCooldown, issue_otp, verify_otp
+from .push import prune_dead_tokens, register_fcm_device, send_fcm_messages
+from .reports import hash_definition, normalize_definition
+from .scheduler import CronSchedule, ScheduledJob, acquire_lease, due_runs, release_run
+from .tasks import process_account_deletions, process_report_jobs
+from .throttling import parse_rate
+from .utils import create_and_send_notification
+
+
+def make_guardian(phone_number, **user_fields):
+    user = User.objects.create(phone_number=phone_number, role='guardian', **user_fields)
+    return Guardian.objects.create(user=user)
+
+
+def make_app_settings(**fields):
+    return AppSettings.objects.create(version='test', whatsapp_number='966500000000', **{'max_sms_message': 30, **fields})
+
+
+# Columns set by each UPDATE of `table` among the captured queries
+def updated_columns(queries, table):
+    columns = []
+    for query in queries:
+        match = re.match(r'UPDATE [`"]%s[`"] SET (.*) WHERE' % table, query['sql'])
+        if match:
+            columns.append(sorted(re.findall(r'[`"](\w+)[`"] = ', match.group(1))))
+    return columns
+
+
+def admin_client():
+    admin = User.objects.create_superuser(phone_number='100000000000')
+    client = APIClient()
+    client.force_authenticate(admin)
+    return client
+
+
+class ReportJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.definition = normalize_definition('dependents')
+
+    def make_job(self, **fields):
+        return ReportJob.objects.create(
+            report_type='dependents',
+            definition=self.definition,
+            definition_hash=hash_definition(self.definition),
+            **fields
+        )
+
+    def test_abandoned_running_job_is_requeued_and_completed(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        job = self.make_job(status='running', started_at=long_ago, heartbeat_at=long_ago, attempts=1)
+
+        process_report_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.attempts, 2)
+
+    @override_settings(REPORT_JOB_MAX_ATTEMPTS=2)
+    def test_abandoned_job_fails_after_max_attempts(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        job = self.make_job(status='running', started_at=long_ago, heartbeat_at=long_ago, attempts=2)
+
+        process_report_jobs()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_create_does_not_reuse_abandoned_job(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        stale = self.make_job(status='running', started_at=long_ago, heartbeat_at=long_ago)
+        live = timezone.now()
+        client = admin_client()
+
+        response = client.post('/core/reports/', {'report_type': 'dependents'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.data['id'], stale.id)
+
+        # A running job that is still reporting progress is shared
+        ReportJob.objects.filter(pk=response.data['id']).update(status='running', started_at=live, heartbeat_at=live)
+        response = client.post('/core/reports/', {'report_type': 'dependents'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class RolloverTests(TestCase):
+    def setUp(self):
+        self.app_settings = make_app_settings(max_sms_message=10)
+        self.guardians = [make_guardian(f'96650000000{n}') for n in range(5)]
+        GuardianMessageDefault.objects.update(messages_per_month=0)
+
+    def quotas(self):
+        return list(GuardianMessageDefault.objects.order_by('id').values_list('messages_per_month', flat=True))
+
+    def test_immediate_increment_is_clamped_to_the_maximum(self):
+        GuardianMessageDefault.objects.filter(guardian=self.guardians[0]).update(messages_per_month=8)
+        AppSettings.objects.filter(pk=self.app_settings.pk).update(immediate_guardian_increment=3)
+
+        tasks.apply_immediate_guardian_increment()
+
+        self.assertEqual(self.quotas(), [10, 3, 3, 3, 3])
+        self.assertEqual(AppSettings.objects.get(pk=self.app_settings.pk).immediate_guardian_increment, 0)
+
+    def test_interrupted_immediate_increment_resumes_from_checkpoint(self):
+        AppSettings.objects.filter(pk=self.app_settings.pk).update(immediate_guardian_increment=4)
+
+        # The second chunk's transaction fails: the first chunk and the checkpoint stay committed
+        with mock.patch.object(tasks.increment_guardian_messages, '__defaults__', (2, None)), \
+                mock.patch('core.tasks.record_changes', side_effect=[None, RuntimeError('stopped')]):
+            with self.assertRaises(RuntimeError):
+                tasks.apply_immediate_guardian_increment()
+
+        checkpoint = JobCheckpoint.objects.get(name=f'apply_immediate_guardian_increment:{self.app_settings.pk}')
+        self.assertEqual(checkpoint.amount, 4)
+        self.assertEqual(self.quotas(), [4, 4, 0, 0, 0])
+
+        tasks.apply_immediate_guardian_increment()
+
+        self.assertEqual(self.quotas(), [4, 4, 4, 4, 4])
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.amount, checkpoint.position), (0, 0))
+
+    def test_pending_increment_is_applied_once(self):
+        AppSettings.objects.filter(pk=self.app_settings.pk).update(pending_guardian_increment=6)
+
+        tasks.reset_or_increment_guardians()
+        tasks.reset_or_increment_guardians()
+
+        self.assertEqual(self.quotas(), [6] * 5)
+
+    @mock.patch('core.tasks.send_bulk_notification')
+    def test_monthly_reset_renews_every_guardian(self, send_bulk_notification):
+        GuardianMessageDefault.objects.update(messages_per_month=10, notified_expired=True)
+
+        tasks.reset_monthly_messages()
+
+        self.assertEqual(self.quotas(), [10] * 5)
+        self.assertFalse(GuardianMessageDefault.objects.filter(notified_expired=True).exists())
+        notified = [user_id for call in send_bulk_notification.call_args_list for user_id in call.kwargs['user_ids']]
+        self.assertCountEqual(notified, [guardian.user_id for guardian in self.guardians])
+
+    @mock.patch('core.tasks.push_bulk_notifications')
+    def test_expired_guardians_are_notified_once(self, push_bulk_notifications):
+        GuardianMessageDefault.objects.filter(guardian__in=self.guardians[:2]).update(messages_per_month=10)
+
+        tasks.notify_expired_guardians()
+        tasks.notify_expired_guardians()
+
+        self.assertEqual(Notification.objects.filter(notification_type='package_expired').count(), 2)
+        self.assertEqual(JobCheckpoint.objects.get(name='notify_expired_guardians').position, 0)
+
+
+class JobRunTests(TestCase):
+    def test_run_records_rows_queries_and_errors(self):
+        with track_job('test.counting') as tracker:
+            User.objects.count()
+            record_rows(7)
+        run = JobRun.objects.get(pk=tracker.run.pk)
+        self.assertEqual((run.status, run.rows_processed, run.queries), ('succeeded', 7, 1))
+        self.assertIsNone(run.peak_memory_kb)
+
+        with self.assertRaises(ValueError):
+            with track_job('test.failing'):
+                raise ValueError('broken')
+        self.assertEqual(JobRun.objects.get(name='test.failing').status, 'failed')
+
+    @override_settings(JOB_RUN_TRACE_MEMORY=True)
+    def test_nested_job_is_measured_by_the_outer_run(self):
+        with track_job('test.outer') as outer:
+            with track_job('test.inner') as inner:
+                buffer = bytearray(1024 * 1024)
+            del buffer
+
+        self.assertIsNone(JobRun.objects.get(pk=inner.run.pk).peak_memory_kb)
+        self.assertGreaterEqual(JobRun.objects.get(pk=outer.run.pk).peak_memory_kb, 1024)
+
+    @override_settings(JOB_RUN_TRACE_MEMORY=True)
+    def test_tracing_started_outside_the_job_stays_on(self):
+        self.assertFalse(tracemalloc.is_tracing())
+        with track_job('test.own'):
+            pass
+        self.assertFalse(tracemalloc.is_tracing())
+
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        with track_job('test.traced'):
+            pass
+        self.assertTrue(tracemalloc.is_tracing())
+
+
+class BroadcastTests(TestCase):
+    def setUp(self):
+        self.guardians = [make_guardian(f'96650000001{n}') for n in range(3)]
+        for guardian in self.guardians:
+            FCMDevice.objects.create(user=guardian.user, registration_id=f'token-{guardian.user_id}', type='android')
+        self.broadcast = Broadcast.objects.create(title='title', body='body', segment='all_guardians', status='running')
+
+    @staticmethod
+    def no_responses(messages):
+        return [(message, None) for message in messages]
+
+    def test_interrupted_push_does_not_notify_the_chunk_again(self):
+        pushes = iter([self.no_responses, mock.Mock(side_effect=RuntimeError('stopped'))])
+        with mock.patch('core.utils.send_fcm_messages', side_effect=lambda messages: next(pushes)(messages)):
+            with self.assertRaises(RuntimeError):
+                run_broadcast(self.broadcast, chunk_size=2)
+
+        # The second chunk's notifications committed with the checkpoint before its push failed
+        self.broadcast.refresh_from_db()
+        self.assertEqual((self.broadcast.recipients_count, self.broadcast.last_user_id), (3, self.guardians[2].user_id))
+
+        with mock.patch('core.utils.send_fcm_messages', side_effect=self.no_responses):
+            run_broadcast(self.broadcast, chunk_size=2)
+
+        self.assertEqual(Notification.objects.count(), 3)
+        self.assertEqual(self.broadcast.status, 'completed')
+
+    def test_push_payload_carries_the_notification_id_without_returned_ids(self):
+        # Simulate MySQL, where bulk_create leaves the instances without ids
+        returns_ids = mock.PropertyMock(return_value=False)
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', returns_ids), \
+                mock.patch('core.utils.send_fcm_messages', side_effect=self.no_responses) as send:
+            run_broadcast(self.broadcast)
+
+        sent = {message.token: message.data['notification_id'] for message in send.call_args.args[0]}
+        expected = {
+            f'token-{user_id}': str(notification_id)
+            for user_id, notification_id in Notification.objects.values_list('user_id', 'id')
+        }
+        self.assertEqual(sent, expected)
+        self.assertEqual(self.broadcast.pushes_failed, 3)
+
+
+class NotificationPushTests(TestCase):
+    def test_failed_dispatched_push_is_logged_with_the_notification_id(self):
+        guardian = make_guardian('966500000020')
+        FCMDevice.objects.create(user=guardian.user, registration_id='token-a', type='android')
+        future = Future()
+
+        with mock.patch('core.utils.dispatch_fcm_messages', return_value=[future]):
+            notification = create_and_send_notification(guardian.user, 'title', 'body', {}, 'general', None)
+
+        with self.assertLogs('core.utils', 'ERROR') as logs:
+            future.set_result(None)
+        self.assertIn(f'notification {notification.id}', logs.output[0])
+
+
+class PurgeUnverifiedAccountsTests(TestCase):
+    def setUp(self):
+        long_ago = timezone.now() - timedelta(days=30)
+        self.unverified = make_guardian('966500000040')
+        self.verified = make_guardian('966500000041')
+        Guardian.objects.update(created_at=long_ago)
+        OutstandingToken.objects.create(user=self.verified.user, jti='first', token='token', created_at=long_ago, expires_at=long_ago)
+
+    def test_backfilled_login_protects_accounts_whose_tokens_were_pruned(self):
+        import_module('core.migrations.0039_backfill_last_login').backfill_last_login(apps, None)
+        self.assertIsNotNone(User.objects.get(pk=self.verified.user_id).last_login)
+        self.assertIsNone(User.objects.get(pk=self.unverified.user_id).last_login)
+
+        OutstandingToken.objects.all().delete()
+        call_command('purge_unverified_accounts', stdout=StringIO())
+
+        self.assertEqual(list(User.objects.values_list('id', flat=True)), [self.verified.user_id])
+
+    def test_dry_run_only_counts(self):
+        stdout = StringIO()
+        call_command('purge_unverified_accounts', '--dry-run', stdout=stdout)
+        self.assertIn('1 unverified accounts would be deleted', stdout.getvalue())
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_accounts_in_use_are_kept(self):
+        FCMDevice.objects.create(user=self.unverified.user, registration_id='token', type='android')
+        call_command('purge_unverified_accounts', stdout=StringIO())
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_recent_accounts_are_kept(self):
+        call_command('purge_unverified_accounts', '--older-than-days=60', stdout=StringIO())
+        self.assertEqual(User.objects.count(), 2)
+
+
+@mock.patch('core.serializers.TaqnyatSMSService')
+class OTPLoginTests(TestCase):
+    phone_number = '966500000115'
+
+    def setUp(self):
+        cache.clear()
+        make_app_settings()
+
+    def verify(self, code):
+        return APIClient().post('/core/verify-otp/', {'phone_number': self.phone_number, 'otp': code}, format='json')
+
+    def test_requesting_a_code_creates_no_account(self, sms_service):
+        response = APIClient().post('/core/phone-login/', {'phone_number': self.phone_number}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['role'], 'guardian')
+        self.assertEqual(sms_service.return_value.send_sms.call_args.kwargs['recipients'], [self.phone_number])
+        self.assertFalse(User.objects.filter(phone_number=self.phone_number).exists())
+
+    def test_wrong_code_creates_no_account(self, _sms_service):
+        issue_otp(self.phone_number)
+        self.assertEqual(self.verify('wrong').status_code, 400)
+        self.assertFalse(User.objects.filter(phone_number=self.phone_number).exists())
+
+    def test_first_verified_login_creates_the_account(self, _sms_service):
+        response = self.verify(issue_otp(self.phone_number))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access_token', response.data)
+
+        user = User.objects.get(phone_number=self.phone_number)
+        self.assertEqual(user.role, 'guardian')
+        self.assertIsNotNone(user.last_login)
+        self.assertTrue(GuardianMessageDefault.objects.filter(guardian__user=user).exists())
+
+        # Later logins reuse the account
+        self.assertEqual(self.verify(issue_otp(self.phone_number)).status_code, 200)
+        self.assertEqual(User.objects.filter(phone_number=self.phone_number).count(), 1)
+        self.assertEqual(Guardian.objects.filter(user=user).count(), 1)
+
+    def test_blocked_account_gets_no_code(self, sms_service):
+        make_guardian(self.phone_number, is_block=True)
+        response = APIClient().post('/core/phone-login/', {'phone_number': self.phone_number}, format='json')
+        self.assertEqual(response.status_code, 400)
+        sms_service.return_value.send_sms.assert_not_called()
+
+
+class ThrottledView(APIView):
+    throttle_scope = 'test'
+
+    def post(self, request):
+        return Response({})
+
+
+@override_settings(REST_FRAMEWORK={
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {'test.phone': '2/m', 'test.ip': '3/m'},
+})
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+
+    def post(self, phone_number, ip='10.0.0.1'):
+        request = self.factory.post('/', {'phone_number': phone_number}, format='json', REMOTE_ADDR=ip)
+        return ThrottledView.as_view()(request)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('5/m'), (5, 60))
+        self.assertEqual(parse_rate('3/10m'), (3, 600))
+        with self.assertRaises(ImproperlyConfigured):
+            parse_rate('3/w')
+
+    def test_each_key_is_limited_by_its_own_rate(self):
+        self.assertEqual([self.post('966500000050').status_code for _ in range(3)], [200, 200, 429])
+        self.assertIn('Retry-After', self.post('966500000050'))
+
+        # Rejected requests count too: the IP rate is spent for every other number from it
+        self.assertEqual(self.post('966500000051').status_code, 429)
+        cache.clear()
+        self.assertEqual([self.post(f'96650000006{n}').status_code for n in range(4)], [200, 200, 200, 429])
+
+    @override_settings(SHARED_CACHE=False, ACTIVITY_COUNTER_STORE='db')
+    def test_per_process_cache_is_reported(self):
+        self.assertEqual([message.id for message in check_shared_cache(None)], ['core.W001'])
+        with override_settings(PIN_FAILURE_STORE='cache'):
+            self.assertEqual([message.id for message in check_shared_cache(None)], ['core.E002', 'core.W001'])
+        with override_settings(SHARED_CACHE=True):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class DirtyFieldSaveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.app_settings = make_app_settings()
+        self.guardian = make_guardian('966500000070')
+        self.user = self.guardian.user
+
+    def guardian_client(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.user.pk))
+        return client
+
+    def test_unchanged_save_issues_no_update(self):
+        user = User.objects.get(pk=self.user.pk)
+        guardian = Guardian.objects.get(pk=self.guardian.pk)
+        with self.assertNumQueries(0):
+            user.save()
+            guardian.save()
+
+    def test_toggles_write_only_their_column(self):
+        client = admin_client()
+        with CaptureQueriesContext(connection) as queries:
+            client.post(f'/core/guardians/{self.guardian.pk}/toggle-block/')
+            client.post(f'/core/guardians/{self.guardian.pk}/toggle-activate/')
+        self.assertEqual(updated_columns(queries, 'core_user'), [['is_block'], ['is_active']])
+
+    def test_update_messages_writes_only_a_changed_quota(self):
+        client = admin_client()
+        url = f'/core/guardians/{self.guardian.pk}/update-messages/'
+        with CaptureQueriesContext(connection) as queries:
+            client.post(url, {'messages_per_month': 7}, format='json')
+            client.post(url, {'messages_per_month': 7}, format='json')
+        self.assertEqual(updated_columns(queries, 'core_guardianmessagedefault'), [['messages_per_month']])
+
+    def test_soft_delete_writes_only_the_flags(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guardian_client().delete('/core/soft-delete-account/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(updated_columns(queries, 'core_user'), [['is_active', 'is_deleted']])
+
+        # Deleting an already deleted account changes nothing
+        with CaptureQueriesContext(connection) as queries:
+            self.guardian_client().delete('/core/soft-delete-account/')
+        self.assertEqual(updated_columns(queries, 'core_user'), [])
+
+    @mock.patch('core.views.TaqnyatSMSService')
+    def test_pin_reset_writes_only_the_reset_columns(self, _sms_service):
+        client = self.guardian_client()
+        with CaptureQueriesContext(connection) as queries:
+            otp = client.post('/core/request-guardian-pin-code/').data['otp']
+        self.assertEqual(updated_columns(queries, 'core_guardian'), [['otp_created_at', 'pin_reset_otp']])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post('/core/reset-guardian-pin-code/', {'otp': otp, 'new_pin_code': '1234'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            updated_columns(queries, 'core_guardian'), [['guardian_code_hashed', 'otp_created_at', 'pin_reset_otp']]
+        )
+
+    def test_verify_otp_writes_only_last_login(self):
+        code = issue_otp(self.user.phone_number)
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().post('/core/verify-otp/', {'phone_number': self.user.phone_number, 'otp': code}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(updated_columns(queries, 'core_user'), [['last_login']])
+
+    @mock.patch('message.views.send_notification_to_user')
+    @mock.patch('message.views.TaqnyatSMSService')
+    def test_message_create_writes_only_the_quota(self, _sms_service, _send_notification):
+        GuardianMessageDefault.objects.filter(guardian=self.guardian).update(messages_per_month=5)
+        Dependent.objects.create(
+            name='dependent', guardian=self.guardian, control_method='eye', gender='male', registration_id='dependent-token',
+            disability_type=DisabilityType.objects.create(name_ar='حركية', name_en='Motor'),
+        )
+        client = self.guardian_client()
+        data = {'registration_id': 'dependent-token', 'is_emergency': True}
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(client.post('/message/messages/', data, format='json').status_code, 201)
+            self.assertEqual(client.post('/message/messages/', {**data, 'is_sms': True}, format='json').status_code, 201)
+        self.assertEqual(updated_columns(queries, 'core_guardianmessagedefault'), [['messages_per_month']])
+        self.assertEqual(updated_columns(queries, 'core_guardian') + updated_columns(queries, 'core_dependent'), [])
+
+
+class GuardianBulkActionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = admin_client()
+        make_app_settings()
+        self.guardians = [make_guardian(f'96650000008{n}') for n in range(3)]
+        User.objects.filter(pk=self.guardians[0].user_id).update(is_block=True)
+
+    def test_empty_filter_is_rejected(self):
+        for data in ({'filter': {}}, {'filter': {'unknown': True}}, {}):
+            response = self.client.post('/core/guardians/bulk-block/', {**data, 'is_block': True}, format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(User.objects.filter(is_block=True).count(), 1)
+
+    def test_selection_by_ids_reports_each_guardian(self):
+        ids = [guardian.pk for guardian in self.guardians[:2]] + [999999]
+        response = self.client.post('/core/guardians/bulk-block/', {'ids': ids, 'is_block': True}, format='json')
+
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([result['status'] for result in response.data['results']], ['unchanged', 'updated', 'not_found'])
+
+    def test_selection_by_filter_updates_quotas_in_one_statement(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                '/core/guardians/bulk-update-messages/',
+                {'filter': {'user__is_block': False}, 'messages_per_month': 4},
+                format='json',
+            )
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(updated_columns(queries, 'core_guardianmessagedefault'), [['messages_per_month']])
+
+
+def at(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class SchedulerTests(TestCase):
+    def test_previous_run_matches_cron_fields(self):
+        daily = CronSchedule('30 3 * * *')
+        self.assertEqual(daily.previous_run(at(2026, 10, 19, 3, 29)), at(2026, 10, 18, 3, 30))
+        self.assertEqual(daily.previous_run(at(2026, 10, 19, 3, 30, 59)), at(2026, 10, 19, 3, 30))
+        self.assertEqual(CronSchedule('*/15 * * * *').previous_run(at(2026, 10, 19, 10, 44)), at(2026, 10, 19, 10, 30))
+        self.assertEqual(CronSchedule('0 9-17/4 * * *').previous_run(at(2026, 10, 19, 16, 0)), at(2026, 10, 19, 13, 0))
+
+        # Day of month and day of week both restricted: either one matches (2026-10-19 is a Monday)
+        self.assertEqual(CronSchedule('0 0 1 * 1').previous_run(at(2026, 10, 20, 12, 0)), at(2026, 10, 19, 0, 0))
+        self.assertEqual(CronSchedule('0 0 1 * *').previous_run(at(2026, 10, 20, 12, 0)), at(2026, 10, 1, 0, 0))
+
+        for expression in ('60 * * * *', '* * * *', '0 0 31-1 * *'):
+            with self.assertRaises(ValueError):
+                CronSchedule(expression)
+
+    def test_each_run_is_claimed_by_one_node_once(self):
+        job = ScheduledJob('0 * * * *', 'core.tasks.process_report_jobs')
+        now = at(2026, 10, 19, 10, 5)
+
+        self.assertEqual(due_runs([job], 'node-a', now), [(job, at(2026, 10, 19, 10, 0))])
+        self.assertEqual(due_runs([job], 'node-b', now), [])
+
+        release_run(job.name, 'node-a', at(2026, 10, 19, 10, 0))
+        self.assertEqual(due_runs([job], 'node-b', now), [])
+        self.assertEqual(len(due_runs([job], 'node-b', now + timedelta(hours=1))), 1)
+
+    def test_expired_claim_is_taken_over(self):
+        job = ScheduledJob('0 * * * *', 'core.tasks.process_report_jobs')
+        due_runs([job], 'node-a', at(2026, 10, 19, 10, 5))
+        JobLease.objects.filter(name=job.name).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(len(due_runs([job], 'node-b', at(2026, 10, 19, 10, 6))), 1)
+        self.assertEqual(JobLease.objects.get(name=job.name).owner, 'node-b')
+
+    @override_settings(SCHEDULER_MAX_CATCH_UP_SECONDS=60 * 60)
+    def test_runs_missed_for_too_long_are_skipped(self):
+        job = ScheduledJob('0 3 * * *', 'core.tasks.process_report_jobs')
+
+        self.assertEqual(due_runs([job], 'node-a', at(2026, 10, 19, 5, 0)), [])
+        self.assertEqual(JobLease.objects.get(name=job.name).last_run_at, at(2026, 10, 19, 3, 0))
+
+    def test_standing_lease_has_one_holder_until_it_expires(self):
+        ttl = timedelta(seconds=90)
+        self.assertTrue(acquire_lease('worker', 'node-a', ttl))
+        self.assertTrue(acquire_lease('worker', 'node-a', ttl))
+        self.assertFalse(acquire_lease('worker', 'node-b', ttl))
+
+        JobLease.objects.filter(name='worker').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(acquire_lease('worker', 'node-b', ttl))
+
+
+class OTPStoreTestsMixin:
+    phone_number = '966500000090'
+
+    def setUp(self):
+        cache.clear()
+
+    def test_code_is_consumed_by_a_valid_verification(self):
+        code = issue_otp(self.phone_number)
+        self.assertEqual(verify_otp(self.phone_number, code), OTP_VALID)
+        self.assertEqual(verify_otp(self.phone_number, code), OTP_EXPIRED)
+
+    @override_settings(OTP_MAX_ATTEMPTS=3)
+    def test_code_locks_after_max_attempts(self):
+        code = issue_otp(self.phone_number)
+        wrong = '0000' if code != '0000' else '1111'
+        self.assertEqual([verify_otp(self.phone_number, wrong) for _ in range(3)], [OTP_INVALID] * 3)
+        self.assertEqual(verify_otp(self.phone_number, code), OTP_LOCKED)
+
+    def test_resend_within_cooldown_is_refused(self):
+        issue_otp(self.phone_number)
+        with self.assertRaises(OTPCooldown) as raised:
+            issue_otp(self.phone_number)
+        self.assertGreater(raised.exception.retry_after, 0)
+
+
+@override_settings(OTP_STORE='cache')
+class CacheOTPStoreTests(OTPStoreTestsMixin, TestCase):
+    pass
+
+
+@override_settings(OTP_STORE='db')
+class DatabaseOTPStoreTests(OTPStoreTestsMixin, TestCase):
+    def test_only_the_hash_is_stored_until_it_expires(self):
+        code = issue_otp(self.phone_number)
+        record = OneTimePassword.objects.get(phone_number=self.phone_number)
+        self.assertNotIn(code, record.code_hash)
+
+        OneTimePassword.objects.filter(pk=record.pk).update(
+            expires_at=timezone.now() - timedelta(seconds=1), sent_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(verify_otp(self.phone_number, code), OTP_EXPIRED)
+        # A new code may be sent once the cooldown has passed
+        self.assertEqual(verify_otp(self.phone_number, issue_otp(self.phone_number)), OTP_VALID)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], PIN_FAILURE_STORE='cache')
+class GuardianPinTests(TestCase):
+    url = '/core/verify-guardian-pin-code/'
+
+    def setUp(self):
+        cache.clear()
+        self.guardian = make_guardian('966500000095')
+        self.guardian.set_code('1234')
+        self.client = APIClient()
+
+    # Authenticated as a freshly loaded user, like each real request
+    def verify(self, **data):
+        self.client.force_authenticate(User.objects.get(pk=self.guardian.user_id))
+        return self.client.post(self.url, data, format='json')
+
+    @override_settings(PIN_FREE_ATTEMPTS=2, PIN_LOCKOUT_BASE_SECONDS=30)
+    def test_wrong_pins_lock_out_with_doubling_delays(self):
+        self.assertEqual([self.verify(pin_code='0000').data['retry_after'] for _ in range(3)], [0, 0, 30])
+
+        # Locked out: even the right PIN is refused without being checked
+        with mock.patch.object(Guardian, 'check_code') as check_code:
+            response = self.verify(pin_code='1234')
+        self.assertEqual(response.status_code, 429)
+        check_code.assert_not_called()
+
+        later = time.time() + 31
+        with mock.patch('core.pin.time.time', return_value=later):
+            self.assertEqual(self.verify(pin_code='0000').data['retry_after'], 60)
+        with mock.patch('core.pin.time.time', return_value=later + 61):
+            self.assertEqual(self.verify(pin_code='1234').status_code, 200)
+        self.assertEqual(self.verify(pin_code='0000').data['retry_after'], 0)
+
+    @override_settings(PIN_FAILURE_STORE='db', PIN_FREE_ATTEMPTS=2, PIN_LOCKOUT_BASE_SECONDS=30)
+    def test_database_store_locks_out_across_workers(self):
+        self.assertEqual([self.verify(pin_code='0000').data['retry_after'] for _ in range(3)], [0, 0, 30])
+        # A per-process cache forgets nothing here: the count is on the guardian's PinFailure row
+        cache.clear()
+        self.assertEqual(self.verify(pin_code='1234').status_code, 429)
+
+        PinFailure.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.verify(pin_code='0000').data['retry_after'], 60)
+        PinFailure.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.verify(pin_code='1234').status_code, 200)
+        self.assertFalse(PinFailure.objects.exists())
+
+    @override_settings(PIN_FAILURE_STORE='db', PIN_FREE_ATTEMPTS=1)
+    def test_database_store_forgets_old_failures(self):
+        self.verify(pin_code='0000')
+        PinFailure.objects.update(last_failed_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.verify(pin_code='0000').data['retry_after'], 0)
+
+    def test_pin_token_skips_the_pin_until_the_pin_changes(self):
+        pin_token = self.verify(pin_code='1234').data['pin_token']
+
+        with mock.patch.object(Guardian, 'check_code') as check_code:
+            self.assertEqual(self.verify(pin_token=pin_token).status_code, 200)
+        check_code.assert_not_called()
+
+        Guardian.objects.get(pk=self.guardian.pk).set_code('5678')
+        self.assertEqual(self.verify(pin_token=pin_token).status_code, 400)
+
+    def test_guardian_without_pin_is_refused(self):
+        Guardian.objects.filter(pk=self.guardian.pk).update(guardian_code_hashed=None)
+        self.assertEqual(self.verify(pin_code='1234').status_code, 400)
+
+
+class AccountDeletionTests(TestCase):
+    def setUp(self):
+        make_app_settings()
+        self.guardian = make_guardian('966500000096')
+        self.other = make_guardian('966500000097')
+        disability_type = DisabilityType.objects.create(name_ar='حركية', name_en='Motor')
+        for guardian in (self.guardian, self.other):
+            dependent = Dependent.objects.create(
+                name='dependent', guardian=guardian, control_method='eye', gender='male', disability_type=disability_type
+            )
+            for _ in range(5):
+                message = Message.objects.create(guardian=guardian, dependent=dependent, is_emergency=True)
+                EscalationTimer.objects.create(message=message, fire_at=timezone.now())
+                Notification.objects.create(user=guardian.user, dependent_msg=message, title='title', message='body')
+            FCMDevice.objects.create(user=guardian.user, registration_id=f'token-{guardian.pk}', type='android')
+        ChangeLogEntry.objects.all().delete()
+
+    @mock.patch('core.deletions.forget_fcm_devices')
+    def test_rows_are_deleted_in_batches_children_first(self, forget_fcm_devices):
+        user = User.objects.get(pk=self.guardian.user_id)
+        deletion = request_account_deletion(user, requested_by=user)
+        self.assertEqual(request_account_deletion(user), deletion)
+
+        with CaptureQueriesContext(connection) as queries:
+            run_account_deletion(deletion, batch_size=2)
+
+        message_deletes = [query for query in queries if query['sql'].startswith('DELETE FROM "message_message"')]
+        self.assertEqual(len(message_deletes), 3)
+        connection.check_constraints()
+
+        self.assertFalse(User.objects.filter(pk=user.pk).exists())
+        self.assertFalse(Message.objects.filter(guardian=self.guardian).exists())
+        self.assertEqual(Message.objects.count(), 5)
+        self.assertEqual(FCMDevice.objects.count(), 1)
+        forget_fcm_devices.assert_called_once_with([f'token-{self.guardian.pk}'])
+
+        deletion.refresh_from_db()
+        self.assertEqual((deletion.status, deletion.requested_by_id), ('completed', None))
+        self.assertEqual(ChangeLogEntry.objects.filter(model='message.message', action='delete').count(), 5)
+
+    def test_queued_account_cannot_be_restored(self):
+        request_account_deletion(User.objects.get(pk=self.guardian.user_id))
+        client = admin_client()
+
+        response = client.post(f'/core/restore/{self.guardian.pk}/')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(User.objects.get(pk=self.guardian.user_id).is_deleted)
+
+        listed = [row['id'] for row in client.get('/core/guardians/', {'user__is_deleted': 'true'}).data['results']]
+        self.assertEqual(listed, [])
+        self.assertEqual(client.post(f'/core/guardians/{self.guardian.pk}/toggle-activate/').status_code, 404)
+
+        # A soft-deleted account without a queued deletion is restored as before
+        User.objects.filter(pk=self.other.user_id).update(is_deleted=True, is_active=False)
+        self.assertEqual(client.post(f'/core/restore/{self.other.pk}/').status_code, 200)
+        self.assertTrue(User.objects.get(pk=self.other.user_id).is_active)
+
+    @mock.patch('core.deletions.forget_fcm_devices')
+    def test_failed_deletion_is_recorded(self, _forget_fcm_devices):
+        deletion = request_account_deletion(User.objects.get(pk=self.guardian.user_id))
+
+        with mock.patch('core.tasks.run_account_deletion', side_effect=RuntimeError('broken')):
+            process_account_deletions()
+
+        deletion.refresh_from_db()
+        self.assertEqual((deletion.status, deletion.error), ('failed', 'broken'))
+        self.assertTrue(User.objects.filter(pk=self.guardian.user_id, is_active=False, is_deleted=True).exists())
+
+
+def send_response(exception=None):
+    return messaging.SendResponse(None if exception else {'name': 'projects/test/messages/1'}, exception)
+
+
+class FCMDeviceRegistrationTests(TestCase):
+    token = 'device-token'
+
+    def setUp(self):
+        cache.clear()
+        self.first = make_guardian('966500000100').user
+        self.second = make_guardian('966500000101').user
+
+    def device(self):
+        return FCMDevice.objects.get(registration_id=self.token)
+
+    @override_settings(FCM_DEVICE_CACHE_SECONDS=0)
+    def test_per_process_cache_never_skips_the_database(self):
+        self.assertTrue(register_fcm_device(self.first, self.token, 'android'))
+        # Another worker moves the token to a different account
+        FCMDevice.objects.filter(registration_id=self.token).update(user=self.second)
+
+        self.assertTrue(register_fcm_device(self.first, self.token, 'android'))
+        self.assertEqual(self.device().user_id, self.first.pk)
+
+    @override_settings(FCM_DEVICE_CACHE_SECONDS=60)
+    def test_reassigned_token_moves_back(self):
+        register_fcm_device(self.first, self.token, 'android')
+        self.assertFalse(register_fcm_device(self.first, self.token, 'android'))
+
+        self.assertTrue(register_fcm_device(self.second, self.token, 'android'))
+        self.assertTrue(register_fcm_device(self.first, self.token, 'android'))
+        self.assertEqual(self.device().user_id, self.first.pk)
+
+    @override_settings(FCM_DEVICE_CACHE_SECONDS=60)
+    def test_deactivated_token_is_reactivated(self):
+        register_fcm_device(self.first, self.token, 'android')
+        message = messaging.Message(token=self.token)
+        prune_dead_tokens([(message, send_response(messaging.UnregisteredError('gone')))])
+        self.assertFalse(self.device().active)
+
+        self.assertTrue(register_fcm_device(self.first, self.token, 'android'))
+        self.assertTrue(self.device().active)
+
+    @override_settings(FCM_DEVICE_CACHE_SECONDS=60, FCM_MAX_DEVICES_PER_USER=1)
+    def test_evicted_token_is_reactivated(self):
+        register_fcm_device(self.first, self.token, 'android')
+        FCMDevice.objects.filter(registration_id=self.token).update(date_created=timezone.now() - timedelta(days=1))
+        register_fcm_device(self.first, 'newer-token', 'android')
+        self.assertFalse(self.device().active)
+
+        self.assertTrue(register_fcm_device(self.first, self.token, 'android'))
+        self.assertTrue(self.device().active)
+
+
+# Stand-in for messaging.send_each: each token's outcome is looked up in `outcomes`
+def fake_send_each(outcomes):
+    def send_each(batch, dry_run=False):
+        if any(outcomes.get(message.token) == 'batch-error' for message in batch):
+            raise exceptions.UnavailableError('unavailable')
+        return messaging.BatchResponse([send_response(outcomes.get(message.token)) for message in batch])
+    return send_each
+
+
+class FCMSendTests(TestCase):
+    def setUp(self):
+        self.user = make_guardian('966500000102').user
+        for token in ('ok', 'unregistered', 'mismatch', 'quota'):
+            FCMDevice.objects.create(user=self.user, registration_id=token, type='android')
+
+    def active_tokens(self):
+        return sorted(FCMDevice.objects.filter(active=True).values_list('registration_id', flat=True))
+
+    def test_only_tokens_that_came_back_dead_are_deactivated(self):
+        outcomes = {
+            'unregistered': messaging.UnregisteredError('gone'),
+            'mismatch': messaging.SenderIdMismatchError('mismatch'),
+            'quota': messaging.QuotaExceededError('slow down'),
+        }
+        messages = [messaging.Message(token=token) for token in ('ok', 'unregistered', 'mismatch', 'quota')]
+        with mock.patch('core.push.messaging.send_each', side_effect=fake_send_each(outcomes)) as send_each:
+            results = send_fcm_messages(messages)
+
+        send_each.assert_called_once()
+        self.assertEqual([message.token for message, _response in results], ['ok', 'unregistered', 'mismatch', 'quota'])
+        self.assertEqual([response.success for _message, response in results], [True, False, False, False])
+        self.assertEqual(self.active_tokens(), ['ok', 'quota'])
+
+    @mock.patch('core.push.FCM_BATCH_SIZE', 2)
+    def test_failed_batch_request_deactivates_nothing(self):
+        outcomes = {'unregistered': messaging.UnregisteredError('gone'), 'quota': 'batch-error'}
+        messages = [messaging.Message(token=token) for token in ('ok', 'unregistered', 'mismatch', 'quota')]
+        with mock.patch('core.push.messaging.send_each', side_effect=fake_send_each(outcomes)) as send_each:
+            with self.assertLogs('core.push', 'ERROR') as logs:
+                results = send_fcm_messages(messages)
+
+        self.assertEqual(send_each.call_count, 2)
+        self.assertIn('unavailable', logs.output[0])
+        # Results keep the order given, whichever batch finished first
+        self.assertEqual([message.token for message, _response in results], ['ok', 'unregistered', 'mismatch', 'quota'])
+        self.assertEqual([response for _message, response in results][2:], [None, None])
+        self.assertEqual(self.active_tokens(), ['mismatch', 'ok', 'quota'])
+
+    def test_stale_devices_are_probed_and_inactive_ones_deleted(self):
+        FCMDevice.objects.exclude(registration_id='ok').update(date_created=timezone.now() - timedelta(days=60))
+        FCMDevice.objects.create(user=self.user, registration_id='inactive', type='android', active=False)
+        outcomes = {'unregistered': messaging.UnregisteredError('gone')}
+        with mock.patch('core.push.messaging.send_each', side_effect=fake_send_each(outcomes)) as send_each:
+            tasks.sweep_stale_fcm_devices()
+
+        probed = send_each.call_args.args[0]
+        self.assertEqual(sorted(message.token for message in probed), ['mismatch', 'quota', 'unregistered'])
+        self.assertTrue(send_each.call_args.kwargs['dry_run'])
+        self.assertEqual(sorted(FCMDevice.objects.values_list('registration_id', flat=True)), ['mismatch', 'ok', 'quota'])
+
+
+def bearer_client(user):
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+    return client
+
+
+@override_settings(
+    PRINCIPAL_CACHE_SECONDS=60, PIN_FAILURE_STORE='cache',
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class CachedPrincipalTests(TestCase):
+    url = '/core/verify-guardian-pin-code/'
+
+    def setUp(self):
+        cache.clear()
+        self.guardian = make_guardian('966500000110')
+        self.guardian.set_code('1234')
+        self.client = bearer_client(self.guardian.user)
+
+    def test_cached_principal_serves_guardian_fields_without_queries(self):
+        self.assertEqual(self.client.post(self.url, {'pin_code': '1234'}, format='json').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.post(self.url, {'pin_code': '1234'}, format='json').status_code, 200)
+
+    def test_pin_change_reaches_the_cached_principal(self):
+        self.client.post(self.url, {'pin_code': '1234'}, format='json')
+        Guardian.objects.get(pk=self.guardian.pk).set_code('5678')
+
+        self.assertEqual(self.client.post(self.url, {'pin_code': '1234'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, {'pin_code': '5678'}, format='json').status_code, 200)
+
+    def test_blocking_or_deactivating_rejects_the_cached_user(self):
+        admin = admin_client()
+        for action in ('toggle-block', 'toggle-activate'):
+            self.assertEqual(self.client.get('/core/profile/').status_code, 200)
+            admin.post(f'/core/guardians/{self.guardian.pk}/{action}/')
+            self.assertEqual(self.client.get('/core/profile/').status_code, 401)
+            admin.post(f'/core/guardians/{self.guardian.pk}/{action}/')
+
+        self.assertEqual(self.client.get('/core/profile/').status_code, 200)
+        admin.post('/core/guardians/bulk-block/', {'ids': [self.guardian.pk], 'is_block': True}, format='json')
+        self.assertEqual(self.client.get('/core/profile/').status_code, 401)
+
+    def test_deleted_user_is_rejected(self):
+        self.assertEqual(self.client.delete('/core/soft-delete-account/').status_code, 204)
+        self.assertEqual(self.client.get('/core/profile/').status_code, 401)
+
+
+class PrincipalContextTests(TestCase):
+    def setUp(self):
+        self.guardian = make_guardian('966500000111')
+        self.principal = load_principal(self.guardian.user_id)
+
+    def test_fully_cached_guardian_is_reused(self):
+        user = build_principal(self.principal)
+        with self.assertNumQueries(0):
+            guardian = PrincipalContext(user).guardian
+            guardian.guardian_code_hashed, guardian.pin_reset_otp, guardian.otp_created_at
+
+    def test_partly_cached_guardian_is_loaded_in_one_query(self):
+        # A principal cached before every guardian column was kept
+        partial = {key: value for key, value in self.principal.items() if key in PRINCIPAL_USER_FIELDS}
+        partial.update({'guardian__id': self.guardian.pk, 'guardian__created_at': self.guardian.created_at})
+        context = PrincipalContext(build_principal(partial))
+
+        with self.assertNumQueries(1):
+            guardian = context.guardian
+            guardian.guardian_code_hashed, guardian.pin_reset_otp, guardian.otp_created_at
+            context.message_defaults
+
+
+class DependentInterestTests(TestCase):
+    def setUp(self):
+        self.guardian = make_guardian('966500000112')
+        self.disability_type = DisabilityType.objects.create(name_ar='حركية', name_en='Motor')
+
+    def guardian_client(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.guardian.user_id))
+        return client
+
+    def make_dependent(self, name, interests):
+        dependent = Dependent.objects.create(
+            name=name, guardian=self.guardian, control_method='eye', gender='male', disability_type=self.disability_type
+        )
+        dependent.set_interests(interests)
+        return dependent
+
+    def test_interests_are_written_and_read_as_choice_keys(self):
+        data = {
+            'name': 'dependent', 'control_method': 'eye', 'gender': 'male',
+            'disability_type': self.disability_type.pk, 'interest_field': ['science', 'tech'],
+        }
+        response = self.guardian_client().post('/core/dependents/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['interest_field'], ['tech', 'science'])
+
+        url = f"/core/dependents/{response.data['id']}/"
+        response = self.guardian_client().patch(url, {'control_method': 'eye', 'interest_field': ['design', 'tech']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['interest_field'], ['tech', 'design'])
+        self.assertEqual(self.guardian_client().get(url).data['interest_field'], ['tech', 'design'])
+
+    def test_unknown_interest_is_rejected(self):
+        data = {
+            'name': 'dependent', 'control_method': 'eye', 'gender': 'male',
+            'disability_type': self.disability_type.pk, 'interest_field': ['astrology'],
+        }
+        response = self.guardian_client().post('/core/dependents/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('interest_field', response.data)
+
+    def test_dependents_are_filtered_by_interest(self):
+        self.make_dependent('coder', ['tech', 'design'])
+        self.make_dependent('doctor', ['medical'])
+        self.make_dependent('none', [])
+        client = self.guardian_client()
+
+        def names(interest):
+            response = client.get('/core/dependents/', {'interest': interest})
+            return sorted(item['name'] for item in response.data['results'])
+
+        self.assertEqual(names('tech'), ['coder'])
+        self.assertEqual(names('tech,design,medical'), ['coder', 'doctor'])
+
+    def test_dashboard_reports_the_interest_distribution(self):
+        self.make_dependent('first', ['tech', 'design'])
+        self.make_dependent('second', ['tech'])
+
+        response = admin_client().get('/core/dashboard-statistics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['demographics']['interests'],
+            [{'interest': 'tech', 'count': 2}, {'interest': 'design', 'count': 1}],
+        )
+
+
+def export_lines(response):
+    return b''.join(response.streaming_content).decode().splitlines()
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        make_app_settings()
+        self.guardian = make_guardian('966500000113', name='guardian')
+        dependent = Dependent.objects.create(
+            name='dependent', guardian=self.guardian, control_method='eye', gender='male',
+            disability_type=DisabilityType.objects.create(name_ar='حركية', name_en='Motor'),
+        )
+        dependent.set_interests(['science', 'tech'])
+
+    def test_guardians_are_streamed_as_csv(self):
+        response = admin_client().get('/core/export/guardians/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('guardians.csv', response['Content-Disposition'])
+
+        header, *rows = csv.reader(export_lines(response))
+        self.assertEqual(header[:3], ['id', 'name', 'phone_number'])
+        self.assertEqual(len(rows), 1)
+        row = dict(zip(header, rows[0]))
+        self.assertEqual(row['phone_number'], '966500000113')
+        self.assertEqual(row['messages_per_month'], '30')
+
+    def test_dependents_are_streamed_as_ndjson(self):
+        response = admin_client().get('/core/export/dependents/', {'output': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        rows = [json.loads(line) for line in export_lines(response)]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['guardian_phone_number'], '966500000113')
+        self.assertEqual(rows[0]['disability_type'], 'Motor')
+        self.assertEqual(rows[0]['interest_field'], ['tech', 'science'])
+
+    def test_csv_joins_the_interests(self):
+        header, row = csv.reader(export_lines(admin_client().get('/core/export/dependents/')))
+        self.assertEqual(dict(zip(header, row))['interest_field'], 'tech,science')
+
+    def test_unknown_output_is_rejected(self):
+        self.assertEqual(admin_client().get('/core/export/guardians/', {'output': 'xlsx'}).status_code, 400)
+
+    def test_exports_are_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.guardian.user_id))
+        self.assertEqual(client.get('/core/export/guardians/').status_code, 403)
+        self.assertEqual(client.get('/core/export/dependents/').status_code, 403)
+
+    def test_rows_are_read_one_keyset_page_at_a_time(self):
+        for index in range(4):
+            make_guardian(f'96650000012{index}')
+        # Three full pages, then the empty page that ends the walk
+        with self.assertNumQueries(4):
+            ids = [guardian.pk for guardian in iterate_by_pk(Guardian.objects.all(), chunk_size=2)]
+        self.assertEqual(ids, sorted(Guardian.objects.values_list('pk', flat=True)))
+
+
+@override_settings(CHANGE_FEED_SETTLE_SECONDS=0)
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.guardian = make_guardian('966500000114')
+        self.dependent = Dependent.objects.create(
+            name='dependent', guardian=self.guardian, control_method='eye', gender='male',
+            disability_type=DisabilityType.objects.create(name_ar='حركية', name_en='Motor'),
+        )
+        self.client = admin_client()
+
+    def feed(self, **params):
+        response = self.client.get('/core/changes/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_saves_and_deletes_are_appended(self):
+        self.dependent.name = 'renamed'
+        self.dependent.save()
+        dependent_id = self.dependent.pk
+        self.dependent.delete()
+
+        entries = [entry for entry in self.feed(model='core.dependent')['results'] if entry['object_id'] == dependent_id]
+        self.assertEqual([entry['action'] for entry in entries], ['create', 'update', 'delete'])
+        self.assertEqual(entries[1]['data']['name'], 'renamed')
+        self.assertEqual(entries[1]['data']['guardian_id'], self.guardian.pk)
+        self.assertIsNone(entries[2]['data'])
+
+    def test_consumers_resume_from_the_next_offset(self):
+        first = self.feed(limit=1)
+        self.assertEqual(len(first['results']), 1)
+        self.assertTrue(first['has_more'])
+        self.assertEqual(first['next_offset'], first['results'][0]['offset'])
+
+        rest = self.feed(after=first['next_offset'])
+        self.assertFalse(rest['has_more'])
+        self.assertTrue(all(entry['offset'] > first['next_offset'] for entry in rest['results']))
+
+        # Nothing new past the last offset
+        done = self.feed(after=rest['next_offset'])
+        self.assertEqual(done['results'], [])
+        self.assertEqual(done['next_offset'], rest['next_offset'])
+
+    @override_settings(CHANGE_FEED_SETTLE_SECONDS=60)
+    def test_unsettled_entries_are_held_back(self):
+        self.assertEqual(self.feed()['results'], [])
+
+    def test_unknown_model_is_rejected(self):
+        self.assertEqual(self.client.get('/core/changes/', {'model': 'core.user'}).status_code, 400)
+
+    def test_marking_messages_read_is_recorded(self):
+        message = Message.objects.create(guardian=self.guardian, dependent=self.dependent, is_emergency=True)
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.guardian.user_id))
+        self.assertEqual(client.post('/message/guardian/messages/mark-read/').status_code, 200)
+
+        entries = self.feed(model='message.message')['results']
+        self.assertEqual([entry['action'] for entry in entries], ['create', 'update'])
+        self.assertEqual(entries[1]['object_id'], message.pk)
+        self.assertEqual(entries[1]['data'], {'is_seen': True})
@@ -0,0 +1,107 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def parse_rate(rate):
+    """'5/m' -> (5, 60); the period may carry a multiplier, e.g. '5/10m' -> (5, 600)."""
+    num, period = rate.split('/')
+    multiplier = int(period[:-1] or 1)
+    try:
+        return int(num), multiplier * PERIODS[period[-1]]
+    except KeyError:
+        raise ImproperlyConfigured(f"Invalid throttle rate {rate!r}")
+
+
+def _data_value(request, name):
+    data = request.data
+    return data.get(name) if hasattr(data, 'get') else None
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Sliding window rate limit kept in two atomic cache counters: the current fixed window
+    and the previous one, weighted by how much of it still overlaps the sliding window.
+
+    The rate comes from DEFAULT_THROTTLE_RATES['<view.throttle_scope>.<kind>'], so each
+    endpoint picks its own limits per key; a view without a rate for this kind is not limited.
+    Rejected requests are counted too, so hammering a limited key keeps it limited.
+    """
+    kind = None
+
+    def get_ident_value(self, request, view):
+        """The value requests are counted by, or None to let the request through unlimited."""
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(f'{scope}.{self.kind}') if scope else None
+        if rate is None:
+            return True
+        value = self.get_ident_value(request, view)
+        if not value:
+            return True
+
+        self.num_requests, self.duration = parse_rate(rate)
+        ident = hashlib.sha256(str(value).encode()).hexdigest()[:32]
+        prefix = f'throttle:{scope}.{self.kind}:{ident}'
+
+        self.now = time.time()
+        window = int(self.now // self.duration)
+        current_key = f'{prefix}:{window}'
+        cache.add(current_key, 0, self.duration * 2)
+        try:
+            self.current = cache.incr(current_key)
+        except ValueError:
+            self.current = 1
+        self.previous = cache.get(f'{prefix}:{window - 1}', 0)
+
+        self.elapsed = (self.now % self.duration) / self.duration
+        return self.previous * (1 - self.elapsed) + self.current <= self.num_requests
+
+    def wait(self):
+        remaining = self.duration * (1 - self.elapsed)
+        if self.current >= self.num_requests or not self.previous:
+            # Only the next window brings the count back under the limit
+            return remaining
+        # The previous window's weight has to shrink until this request fits
+        fits_at = 1 - (self.num_requests - self.current) / self.previous
+        return max((fits_at - self.elapsed) * self.duration, 1)
+
+
+class PhoneNumberThrottle(SlidingWindowThrottle):
+    kind = 'phone'
+
+    def get_ident_value(self, request, view):
+        phone_number = _data_value(request, 'phone_number')
+        return str(phone_number).strip() if phone_number else None
+
+
+class UserThrottle(SlidingWindowThrottle):
+    kind = 'user'
+
+    def get_ident_value(self, request, view):
+        return request.user.pk if request.user and request.user.is_authenticated else None
+
+
+# The FCM registration id of the calling device, or the dependent device a message is sent from
+class DeviceThrottle(SlidingWindowThrottle):
+    kind = 'device'
+
+    def get_ident_value(self, request, view):
+        return request.headers.get('X-Client-Fcm-Token') or _data_value(request, 'registration_id')
+
+
+class IPThrottle(SlidingWindowThrottle):
+    kind = 'ip'
+
+    def get_ident_value(self, request, view):
+        return self.get_ident(request)
+
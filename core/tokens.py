@@ -0,0 +1,94 @@
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+logger = logging.getLogger(__name__)
+
+
+def _blacklist_key(jti):
+    return f'blacklisted-jti:{jti}'
+
+
+def remember_blacklisted(jti, expires_at):
+    """Cache a blacklisted JTI until its token expires; after that the token is rejected as expired anyway."""
+    ttl = int((expires_at - timezone.now()).total_seconds())
+    if ttl > 0:
+        cache.set(_blacklist_key(jti), True, ttl)
+
+
+def forget_blacklisted(jti):
+    cache.delete(_blacklist_key(jti))
+
+
+# Refresh token whose blacklist check answers replays of a rotated token from the cache
+class CachedBlacklistRefreshToken(RefreshToken):
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if cache.get(_blacklist_key(jti)):
+            raise TokenError(_("Token is blacklisted"))
+        # A miss proves nothing (evicted, or blacklisted through another process's cache)
+        super().check_blacklist()
+
+
+class CachedBlacklistTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CachedBlacklistRefreshToken
+
+
+def token_table_stats():
+    """
+    Row counts of the token blacklist tables, how many of those rows are expired,
+    and on MySQL the on-disk size (data and indexes) of each table in bytes.
+    """
+    now = timezone.now()
+    stats = {
+        'outstanding': OutstandingToken.objects.count(),
+        'outstanding_expired': OutstandingToken.objects.filter(expires_at__lt=now).count(),
+        'blacklisted': BlacklistedToken.objects.count(),
+        'blacklisted_expired': BlacklistedToken.objects.filter(token__expires_at__lt=now).count(),
+    }
+    if connection.vendor == 'mysql':
+        tables = {OutstandingToken._meta.db_table: 'outstanding_bytes', BlacklistedToken._meta.db_table: 'blacklisted_bytes'}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT table_name, data_length + index_length FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name IN (%s, %s)",
+                list(tables),
+            )
+            for table, size in cursor.fetchall():
+                stats[tables[table]] = size
+    return stats
+
+
+def prune_expired_tokens(batch_size=None):
+    """
+    Delete expired outstanding tokens and their blacklist entries, oldest first, in batches
+    of TOKEN_PRUNE_BATCH_SIZE. Each batch is two short statements on the primary key, so no
+    lock is held across the whole table. Returns the number of outstanding tokens deleted.
+    """
+    batch_size = batch_size or settings.TOKEN_PRUNE_BATCH_SIZE
+    expired = OutstandingToken.objects.filter(expires_at__lt=timezone.now())
+
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = list(expired.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            break
+        last_id = ids[-1]
+        # Raw deletes: the cached JTIs expire with the tokens, so the signal handlers have nothing to do
+        for batch in (BlacklistedToken.objects.filter(token_id__in=ids), OutstandingToken.objects.filter(id__in=ids)):
+            batch._raw_delete(batch.db)
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+    return deleted
@@ -1,13 +1,15 @@
 from django.urls import include, path 
 from rest_framework_simplejwt.views import TokenRefreshView
 from rest_framework.routers import DefaultRouter
-from .views import AppSettingsView, DashboardStatsView, DependentViewSet, DisabilityTypeViewSet, GuardianViewSet, PhoneLoginAPIView, PhonePasswordLoginAPIView, RequestGuardianPinResetView, ResetGuardianPinCodeView, RestoreGuardianAccountAPIView, SetGuardianPinCodeView, SoftDeleteAccountAPIView, VerifyGuardianPinCodeView, VerifyOTPAPIView, UserProfileAPIView, DeleteAccountAPIView
+from .views import AppSettingsView, BroadcastViewSet, ChangeFeedAPIView, DashboardStatsView, DependentViewSet, DisabilityTypeViewSet, ExportDependentsAPIView, ExportGuardiansAPIView, GuardianViewSet, PhoneLoginAPIView, PhonePasswordLoginAPIView, ReportJobViewSet, RequestGuardianPinResetView, ResetGuardianPinCodeView, RestoreGuardianAccountAPIView, SetGuardianPinCodeView, SoftDeleteAccountAPIView, VerifyGuardianPinCodeView, VerifyOTPAPIView, UserProfileAPIView, DeleteAccountAPIView
 
 # Create a router and register our viewsets with it 
 router = DefaultRouter()
 router.register('guardians', GuardianViewSet, basename='guardians')
 router.register('disability-types', DisabilityTypeViewSet, basename='disability-types')
 router.register('dependents', DependentViewSet, basename='dependents') 
+router.register('reports', ReportJobViewSet, basename='reports')
+router.register('broadcasts', BroadcastViewSet, basename='broadcasts')
 
 
 # URL patterns for the core app
@@ -26,6 +28,9 @@ urlpatterns = [
     path('reset-guardian-pin-code/', ResetGuardianPinCodeView.as_view(), name='reset_guardian_pin_code'),
     path('verify-guardian-pin-code/', VerifyGuardianPinCodeView.as_view(), name='verify_guardian_pin_code'),
     path('app-settings/', AppSettingsView.as_view(), name='app-settings'),
-    path('dashboard-statistics/', DashboardStatsView.as_view(), name='dashboard')
+    path('dashboard-statistics/', DashboardStatsView.as_view(), name='dashboard'),
+    path('export/guardians/', ExportGuardiansAPIView.as_view(), name='export_guardians'),
+    path('export/dependents/', ExportDependentsAPIView.as_view(), name='export_dependents'),
+    path('changes/', ChangeFeedAPIView.as_view(), name='change_feed'),
 
 ]
@@ -1,13 +1,15 @@
 
 import requests
 import logging
+from functools import partial
 from django.conf import settings 
+from django.db import connection
+from django.db.models import Max
 from fcm_django.models import FCMDevice
 from core.models import Notification
-from firebase_admin.messaging import Message as FCMMessage, Notification as FCM_Notification, AndroidConfig, APNSConfig, APNSPayload, Aps
-from firebase_admin.messaging import AndroidNotification
 
 from message.models import Message
+from .push import build_fcm_message, dispatch_fcm_messages, send_fcm_messages
 
 
 logger = logging.getLogger(__name__)
@@ -123,6 +125,18 @@ class TaqnyatSMSService:
             }
 
 
+# Done-callback of a dispatched push: a failed send is logged with the notification it belonged to 
+def _log_push_failure(notification_id, future):
+    if future.exception() is not None:
+        logger.error(f"Push for notification {notification_id} was not sent: {str(future.exception())}")
+        return
+    response = future.result()
+    if response is None:
+        logger.error(f"Push for notification {notification_id} was not sent: FCM batch request failed")
+    elif not response.success:
+        logger.error(f"Push for notification {notification_id} was rejected: {str(response.exception)}")
+
+
 # ---------------------------
 def create_and_send_notification(user, title, message, data_message, notification_type, data_id):
     """
@@ -147,34 +161,19 @@ def create_and_send_notification(user, title, message, data_message, notificatio
         title=title
     )
 
-    # Send the notification if the user has registered devices
-    devices = FCMDevice.objects.filter(user=user)
-    if devices.exists():
+    # Queue the push for every active device; the dispatcher batches it with concurrent pushes
+    registration_ids = list(FCMDevice.objects.filter(user=user, active=True).values_list("registration_id", flat=True))
+    if registration_ids:
         # Ensure all keys and values in data_message are strings
         safe_data_message = {str(k): str(v) for k, v in data_message.items()}
         safe_data_message["notification_id"] = str(notification.id)
 
-        # Decide sound type based on is_voice flag in payload
-        sound_type = "default" if safe_data_message.get("is_voice") == "True" else None
-
-
-        devices.send_message(
-            FCMMessage(
-                notification=FCM_Notification(
-                    title=title,
-                    body=message,
-                ),
-                android=AndroidConfig(
-                    notification=AndroidNotification(
-                        sound='default'
-                    )
-                ),
-                apns=APNSConfig(
-                    payload=APNSPayload(aps=Aps(sound='default'))
-                ),
-                data=safe_data_message
-            )
-        )
+        futures = dispatch_fcm_messages([
+            build_fcm_message(registration_id, title, message, safe_data_message)
+            for registration_id in registration_ids
+        ])
+        for future in futures:
+            future.add_done_callback(partial(_log_push_failure, notification.id))
     else:
         logger.info(f"No FCM devices found for user {user.id}. Notification saved but not sent.")
 
@@ -206,3 +205,69 @@ def send_notification_to_user(user, title, body, data=None):
         notification_type=notification_type,
         data_id=data_id
     )
+
+
+# ---------------------------
+# Helpers to notify many users at once 
+# ---------------------------
+def create_bulk_notifications(user_ids, title, body, notification_type="general", batch_size=1000):
+    """
+    Create one Notification per user with bulk_create. Call inside the caller's
+    transaction and push the returned rows with push_bulk_notifications after it commits.
+    """
+    notifications = [
+        Notification(user_id=user_id, notification_type=notification_type, read=False, message=body, title=title)
+        for user_id in user_ids
+    ]
+    # MySQL returns no ids from a bulk insert: note where the insert starts and read the ids back 
+    floor = None
+    if not connection.features.can_return_rows_from_bulk_insert:
+        floor = Notification.objects.aggregate(floor=Max('id'))['floor'] or 0
+
+    Notification.objects.bulk_create(notifications, batch_size=batch_size)
+
+    if floor is not None:
+        inserted = dict(
+            Notification.objects.filter(
+                id__gt=floor, user_id__in=user_ids, notification_type=notification_type, title=title, message=body
+            ).order_by('id').values_list('user_id', 'id')
+        )
+        for notification in notifications:
+            notification.id = inserted.get(notification.user_id)
+    return notifications
+
+
+def push_bulk_notifications(notifications, title, body, data=None):
+    """
+    Push notifications created by create_bulk_notifications to every active device
+    of their users through batched FCM requests.
+    """
+    data_message = {str(k): str(v) for k, v in (data or {}).items()}
+    user_ids = {n.user_id for n in notifications}
+    notification_ids = {n.user_id: n.id for n in notifications if n.id}
+
+    devices = FCMDevice.objects.filter(user_id__in=user_ids, active=True).values_list("user_id", "registration_id")
+    messages = []
+    for user_id, registration_id in devices:
+        payload = dict(data_message)
+        if user_id in notification_ids:
+            payload["notification_id"] = str(notification_ids[user_id])
+        messages.append(build_fcm_message(registration_id, title, body, payload))
+
+    return send_fcm_messages(messages)
+
+
+def send_bulk_notification(user_ids, title, body, data=None):
+    """
+    Create and push one notification per user.
+
+    Args:
+        user_ids: ids of the users to notify
+        title: Notification title
+        body: Notification body
+        data: Additional data payload (its 'type' becomes the notification type)
+    """
+    notification_type = (data or {}).get("type", "general")
+    notifications = create_bulk_notifications(user_ids, title, body, notification_type)
+    push_bulk_notifications(notifications, title, body, data)
+    return len(notifications)
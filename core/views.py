@@ -1,31 +1,44 @@
+import csv
 import random
 from datetime import date, timedelta
 
 from django.conf import settings
-from fcm_django.models import FCMDevice
 from django.utils.translation import gettext_lazy as _ 
 from django.utils import timezone
-from django.db.models import Count
+from django.db import transaction
+from django.db.models import Count, F
 from django.db.models.functions import TruncMonth
+from django.http import HttpResponse
 from django.utils import timezone
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.decorators import action
 from core.pagination import DefaultPagination
 from core.permissions import IsAdminOrReadOnly, IsGuardianOwnDependent
 from core.utils import TaqnyatSMSService
+from .exports import EXPORT_OUTPUTS, iterate_by_pk, stream_export
+from .bulk import SelectionTooLarge, bulk_set_messages_per_month, bulk_set_user_field, select_guardians
+from .context import get_principal
+from .deletions import queued_deletion_user_ids, request_account_deletion
+from .otp import OTP_EXPIRED, OTP_LOCKED, OTP_VALID, verify_otp
+from .pin import check_pin_token, clear_pin_failures, issue_pin_token, pin_lockout_remaining, record_pin_failure
+from .push import register_fcm_device
 from message.models import GuardianMessageType, Message, MessageType 
-from .models import AppSettings, Dependent, DisabilityType, Guardian, GuardianMessageDefault, User 
-from .serializers import AppSettingsSerializer, DependentSerializer, DisabilityTypeSerializer, GuardianSerializer, PhoneLoginSerializer, PhonePasswordLoginSerializer, SetGuardianPinCodeSerializer, UserProfileSerializer, UserProfileUpdateSerializer
+from .changelog import TRACKED_FIELDS
+from .models import AppSettings, Broadcast, ChangeLogEntry, Dependent, DependentInterest, DisabilityType, Guardian, GuardianMessageDefault, ReportJob, User 
+from .reports import hash_definition, normalize_definition, stale_report_jobs
+from .serializers import AppSettingsSerializer, BroadcastSerializer, ChangeLogEntrySerializer, DependentSerializer, DisabilityTypeSerializer, GuardianBulkActivateSerializer, GuardianBulkBlockSerializer, GuardianBulkMessagesSerializer, GuardianSerializer, PhoneLoginSerializer, PhonePasswordLoginSerializer, ReportDefinitionSerializer, ReportJobSerializer, SetGuardianPinCodeSerializer, UserProfileSerializer, UserProfileUpdateSerializer
 
 
 # Phone Login API View
 class PhoneLoginAPIView(APIView):
+    throttle_scope = 'otp_send'
+
     def post(self, request):
         serializer = PhoneLoginSerializer(data=request.data)
         if serializer.is_valid():
@@ -33,13 +46,15 @@ class PhoneLoginAPIView(APIView):
             # Return OTP in response (for development/testing purposes)
             return Response({
                 'detail': _('تم إرسال OTP بنجاح.'),
-                'role': user.role,
+                'role': user.role if user else 'guardian',
             }, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 # Phone Password Login API View for superusers and admins 
 class PhonePasswordLoginAPIView(APIView):
+    throttle_scope = 'password_login'
+
     def post(self, request):
         serializer = PhonePasswordLoginSerializer(data=request.data)
         if serializer.is_valid():
@@ -59,6 +74,8 @@ class PhonePasswordLoginAPIView(APIView):
 
 
 class VerifyOTPAPIView(APIView):
+    throttle_scope = 'otp_verify'
+
     def post(self, request):
         phone_number = request.data.get('phone_number')
         otp = request.data.get('otp')
@@ -70,45 +87,49 @@ class VerifyOTPAPIView(APIView):
         if not phone_number or not otp:
             return Response({'detail': _('رقم الهاتف وكلمة المرور لمرة واحدة مطلوبان.')}, status=400)
 
-        try:
-            user = User.objects.get(phone_number=phone_number)
-            
-            if user.otp == otp:
-                # Set Otp 
-                user.otp = None
-                user.save()
+        result = verify_otp(phone_number, otp)
+        if result == OTP_LOCKED:
+            return Response({'detail': _('تم تجاوز عدد المحاولات المسموح بها. يرجى طلب رمز جديد.')}, status=429)
+        if result == OTP_EXPIRED:
+            return Response({'detail': _('انتهت صلاحية كلمة المرور لمرة واحدة. يرجى طلب رمز جديد.')}, status=400)
+        if result != OTP_VALID:
+            return Response({'detail': _('كلمة مرور لمرة واحدة غير صالحة.')}, status=400)
+
+        # First verified login of a new number: create the account now 
+        with transaction.atomic():
+            user, created = User.objects.get_or_create(
+                phone_number=phone_number,
+                defaults={'role': 'guardian', 'is_active': True, 'is_block': False}
+            )
+            if created and user.role == 'guardian':
+                Guardian.objects.create(user=user)
 
-                # create JWT Token 
-                refresh = RefreshToken.for_user(user)
-                access_token = str(refresh.access_token)
-                refresh_token = str(refresh)
-
-                # update or create registration id 
-                if registration_id:
-                    FCMDevice.objects.update_or_create(
-                        user=user,
-                        registration_id=registration_id,
-                        defaults={"type": device_type}
-                    )
+        # Record the login: purge_unverified_accounts relies on it once expired tokens are pruned 
+        User.objects.filter(pk=user.pk).update(last_login=timezone.now())
 
-                return Response({
-                    'detail': _('تم تسجيل الدخول بنجاح.'),
-                    'role': user.role,
-                    'access_token': access_token,
-                    'refresh_token': refresh_token
-                })
+        # create JWT Token 
+        refresh = RefreshToken.for_user(user)
+        access_token = str(refresh.access_token)
+        refresh_token = str(refresh)
 
-            else:
-                return Response({'detail': _('كلمة مرور لمرة واحدة غير صالحة.')}, status=400)
+        # update or create registration id 
+        if registration_id:
+            register_fcm_device(user, registration_id, device_type)
 
-        except User.DoesNotExist:
-            return Response({'detail': _('المستخدم غير موجود.')}, status=404)
+        return Response({
+            'detail': _('تم تسجيل الدخول بنجاح.'),
+            'role': user.role,
+            'access_token': access_token,
+            'refresh_token': refresh_token
+        })
 
 
 # User Profile API View 
 class UserProfileAPIView(APIView):
     def get(self, request):
         user = request.user
+        # Load the guardian and its message defaults in one query before the serializer reads them
+        get_principal(request).message_defaults
         serializer = UserProfileSerializer(user)
         return Response(serializer.data)
 
@@ -126,8 +147,8 @@ class DeleteAccountAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def delete(self, request):
-        user = request.user
-        user.delete()
+        # The account is deactivated now; its rows are deleted by a background job 
+        request_account_deletion(request.user, requested_by=request.user)
         return Response({"message": _("تم حذف الحساب بنجاح.")}, status=status.HTTP_204_NO_CONTENT)
 
 
@@ -151,6 +172,9 @@ class RestoreGuardianAccountAPIView(APIView):
         try:
             guardian = Guardian.objects.get(id=guardian_id)
             user = guardian.user
+            # The account's rows are already queued for deletion by process_account_deletions 
+            if queued_deletion_user_ids().filter(user_id=user.pk).exists():
+                return Response({"message": _("الحساب قيد الحذف النهائي ولا يمكن استعادته.")}, status=status.HTTP_400_BAD_REQUEST)
             if user.is_deleted:
                 user.is_deleted = False
                 user.is_active = True  # Reactivate the account
@@ -183,9 +207,8 @@ class RequestGuardianPinResetView(APIView):
         if user.role != 'guardian':
             return Response({'detail': _('يمكن للمشرفين فقط طلب إعادة تعيين الرقم السري.')}, status=403)
 
-        try:
-            guardian = Guardian.objects.get(user=user)
-        except Guardian.DoesNotExist:
+        guardian = get_principal(request).guardian
+        if guardian is None:
             return Response({'detail': _('المشرف غير موجود.')}, status=404)
 
         otp = str(random.randint(1000, 9999))
@@ -212,9 +235,8 @@ class ResetGuardianPinCodeView(APIView):
         if user.role != 'guardian':
             return Response({'detail': _('يمكن للمشرفين فقط إعادة تعيين الرمز البريدي.')}, status=403)
 
-        try:
-            guardian = Guardian.objects.get(user=user)
-        except Guardian.DoesNotExist:
+        guardian = get_principal(request).guardian
+        if guardian is None:
             return Response({'detail': _('المشرف غير مسجل')}, status=404)
 
         otp = request.data.get('otp')
@@ -228,10 +250,10 @@ class ResetGuardianPinCodeView(APIView):
         if not new_pin_code or not new_pin_code.isdigit() or len(new_pin_code) != 4:
             return Response({'detail': _('الرمز البريدي او رمز التحقق غير صحيح')}, status=400)
 
-        guardian.set_code(new_pin_code)
+        # set_code saves the cleared reset OTP along with the new PIN in one write 
         guardian.pin_reset_otp = None
         guardian.otp_created_at = None
-        guardian.save()
+        guardian.set_code(new_pin_code)
 
         return Response({'detail': _('تم إعادة تعيين الرمز البريدي بنجاح.')}, status=200)
     
@@ -239,36 +261,48 @@ class ResetGuardianPinCodeView(APIView):
 # Verify Guardian PIN Code API View
 class VerifyGuardianPinCodeView(APIView):
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'pin'
     
     def post(self, request):
         user = request.user
         if user.role != 'guardian':
             return Response({'detail': _('يمكن للمشرفين فقط التحقق من الرمز البريدي.')}, status=403)
         
-        try:
-            guardian = Guardian.objects.get(user=user)
-        except Guardian.DoesNotExist:
+        guardian = get_principal(request).guardian
+        if guardian is None:
             return Response({'detail': _('المشرف غير موجود.')}, status=404)
         
-        pin_code = request.data.get('pin_code')
-        if not pin_code or not guardian.check_code(pin_code):
-            return Response({'detail': _('الرمز البريدي غير صالح.'), 'is_verified': False}, status=400)
+        # A pin_token from an earlier successful verification skips the (slow) PIN hash check
+        pin_token = request.data.get('pin_token') or request.headers.get('X-Pin-Token')
+        if not pin_token or not check_pin_token(guardian, pin_token):
+            retry_after = pin_lockout_remaining(guardian)
+            if retry_after:
+                return Response({
+                    'detail': _('تم تجاوز عدد المحاولات المسموح بها. يرجى المحاولة بعد {seconds} ثانية.').format(seconds=retry_after),
+                    'is_verified': False,
+                    'retry_after': retry_after
+                }, status=429)
+
+            pin_code = request.data.get('pin_code')
+            if not pin_code or not guardian.guardian_code_hashed or not guardian.check_code(pin_code):
+                lockout = record_pin_failure(guardian)
+                return Response({'detail': _('الرمز البريدي غير صالح.'), 'is_verified': False, 'retry_after': lockout}, status=400)
+
+            clear_pin_failures(guardian)
+            pin_token = issue_pin_token(guardian)
 
         # get registration id from headers  
         registration_id = request.headers.get("X-Client-Fcm-Token")
         device_type = request.headers.get("Device-Type", "ios") # Default to ios 
 
         if registration_id:
-            FCMDevice.objects.update_or_create(
-                user=user,
-                registration_id=registration_id,
-                defaults={"type": device_type}
-            )
+            register_fcm_device(user, registration_id, device_type)
 
-        # If pin_code is valid, return success response
+        # If pin_code is valid, return success response with a token for the next screens 
         return Response({
             'detail': _('تم التحقق من الرمز البريدي بنجاح.'),
-            'is_verified': True
+            'is_verified': True,
+            'pin_token': pin_token
         }, status=200)
     
 
@@ -286,7 +320,9 @@ class GuardianViewSet(viewsets.ModelViewSet):
     }
     
     def get_queryset(self):
-        queryset = Guardian.objects.select_related('user').order_by('-created_at')
+        queryset = Guardian.objects.select_related('user').prefetch_related('dependents__interests').order_by('-created_at')
+        # Accounts queued for deletion are gone for the admin, whatever the is_deleted filter says
+        queryset = queryset.exclude(user_id__in=queued_deletion_user_ids())
         params = self.request.query_params
 
         # Apply filters manually
@@ -352,12 +388,49 @@ class GuardianViewSet(viewsets.ModelViewSet):
             status=status.HTTP_200_OK
         )
 
+    # Bulk actions: guardians selected by `ids` or a `filter`, changed with a single UPDATE 
+    def _bulk_action(self, request, serializer_class, apply):
+        serializer = serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        guardians = select_guardians(data.get('ids'), data.get('filter'))
+        try:
+            results = apply(guardians, data)
+        except SelectionTooLarge:
+            return Response(
+                {"detail": _("عدد المشرفين المحددين أكبر من {count}. يرجى تضييق التحديد.").format(count=settings.GUARDIAN_BULK_MAX_ROWS)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            'status': 'success',
+            'updated': sum(1 for result in results if result['status'] == 'updated'),
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='bulk-block')
+    def bulk_block(self, request):
+        return self._bulk_action(request, GuardianBulkBlockSerializer, lambda guardians, data: bulk_set_user_field(
+            guardians, 'is_block', data['is_block'], data.get('ids')
+        ))
+
+    @action(detail=False, methods=['post'], url_path='bulk-activate')
+    def bulk_activate(self, request):
+        return self._bulk_action(request, GuardianBulkActivateSerializer, lambda guardians, data: bulk_set_user_field(
+            guardians, 'is_active', data['is_active'], data.get('ids')
+        ))
+
+    @action(detail=False, methods=['post'], url_path='bulk-update-messages')
+    def bulk_update_messages(self, request):
+        return self._bulk_action(request, GuardianBulkMessagesSerializer, lambda guardians, data: bulk_set_messages_per_month(
+            guardians, data['messages_per_month'], data.get('ids')
+        ))
 
     def perform_destroy(self, instance):
-        # Delete the Guardian and associated User 
-        user = instance.user
-        instance.delete()
-        user.delete()
+        # Deactivate the guardian's user now; the guardian, its dependents and messages are deleted in the background 
+        request_account_deletion(instance.user, requested_by=self.request.user)
 
 
 # Disability Type Viewset
@@ -377,7 +450,7 @@ class DisabilityTypeViewSet(viewsets.ModelViewSet):
 
 # Dependent Viewset 
 class DependentViewSet(viewsets.ModelViewSet):
-    queryset = Dependent.objects.all()
+    queryset = Dependent.objects.prefetch_related('interests')
     serializer_class = DependentSerializer
     permission_classes = [IsGuardianOwnDependent | IsAdminUser]
     pagination_class = DefaultPagination
@@ -385,13 +458,24 @@ class DependentViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.is_superuser:  
-            return super().get_queryset().order_by('-date_birth')
-        if user.role == 'guardian':
-            return super().get_queryset().filter(guardian__user=user).order_by('-date_birth')
+            queryset = super().get_queryset()
+        elif user.role == 'guardian':
+            queryset = super().get_queryset().filter(guardian__user=user)
         elif user.role == 'admin':
-            return super().get_queryset().order_by('-date_birth')
+            queryset = super().get_queryset()
         else:
             return Dependent.objects.none()
+
+        # Filter by field of interest (?interest=tech or ?interest=tech,design) 
+        interest = self.request.query_params.get('interest')
+        if interest:
+            interests = [item.strip() for item in interest.split(',') if item.strip()]
+            if len(interests) == 1:
+                queryset = queryset.filter(interests__interest=interests[0])
+            else:
+                queryset = queryset.filter(interests__interest__in=interests).distinct()
+
+        return queryset.order_by('-date_birth')
         
     
     # Register Device for Push Notifications 
@@ -406,12 +490,14 @@ class DependentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Unbind any other dependent that has the same registration_id
-        Dependent.objects.filter(registration_id=registration_id).exclude(pk=dependent.pk).update(registration_id=None)
+        # Already bound to this device; nothing to write
+        if dependent.registration_id != registration_id:
+            # Unbind any other dependent that has the same registration_id
+            Dependent.objects.filter(registration_id=registration_id).exclude(pk=dependent.pk).update(registration_id=None)
 
-        # Bind the current dependent to the device
-        dependent.registration_id = registration_id
-        dependent.save()
+            # Bind the current dependent to the device
+            dependent.registration_id = registration_id
+            dependent.save(update_fields=['registration_id'])
 
         return Response(
             {"message": _("تم تسجيل الجهاز بنجاح وربطه بالتابع الحالي")},
@@ -450,12 +536,10 @@ class AppSettingsView(APIView):
 
             if diff > 0:
                 if update_now:
-                    # Immediately adjust the balance
-                    for guardian_default in GuardianMessageDefault.objects.filter(app_settings=instance):
-                        guardian_default.messages_per_month += diff
-                        if guardian_default.messages_per_month > new_max:
-                            guardian_default.messages_per_month = new_max
-                        guardian_default.save()
+                    # Queue the balance adjustment; apply_immediate_guardian_increment applies it in the background
+                    AppSettings.objects.filter(pk=instance.pk).update(
+                        immediate_guardian_increment=F('immediate_guardian_increment') + diff
+                    )
 
                 if update_next_month:
                     # Save the difference to apply it at the beginning of the new month
@@ -534,6 +618,12 @@ class DashboardStatsView(APIView):
         # Demographic distribution
         gender_distribution = dependents_qs.values("gender").annotate(count=Count("id"))
         marital_distribution = dependents_qs.values("marital_status").annotate(count=Count("id"))
+        interest_distribution = (
+            DependentInterest.objects.filter(dependent__in=dependents_qs)
+            .values("interest")
+            .annotate(count=Count("id"))
+            .order_by("-count")
+        )
 
         # Communication statistics
         total_interactions = messages_qs.count()
@@ -584,6 +674,7 @@ class DashboardStatsView(APIView):
             "demographics": {
                 "gender": list(gender_distribution),
                 "marital": list(marital_distribution),
+                "interests": list(interest_distribution),
             },
             "communication": {
                 "total_interactions": total_interactions,
@@ -596,3 +687,182 @@ class DashboardStatsView(APIView):
         return Response(data)
 
 
+# Report Job Viewset (admin analytics computed by the process_report_jobs task) 
+class ReportJobViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    queryset = ReportJob.objects.defer('result')
+    serializer_class = ReportJobSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = DefaultPagination
+
+    def create(self, request, *args, **kwargs):
+        serializer = ReportDefinitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        definition = normalize_definition(**serializer.validated_data)
+        definition_hash = hash_definition(definition)
+
+        # Reuse a queued, running or recently completed job for the same definition; a job whose worker stopped is not reused 
+        fresh_after = timezone.now() - timedelta(seconds=settings.REPORT_CACHE_SECONDS)
+        existing = (
+            self.get_queryset()
+            .filter(definition_hash=definition_hash, status__in=['pending', 'running', 'completed'])
+            .exclude(status='completed', completed_at__lt=fresh_after)
+            .exclude(pk__in=stale_report_jobs().values('pk'))
+            .first()
+        )
+        if existing:
+            return Response(self.get_serializer(existing).data, status=status.HTTP_200_OK)
+
+        job = ReportJob.objects.create(
+            report_type=definition['report_type'],
+            definition=definition,
+            definition_hash=definition_hash,
+            created_by=request.user,
+        )
+        return Response(self.get_serializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    # Download the stored result (?output=json for the raw result, CSV otherwise) 
+    @action(detail=True, methods=['get'], url_path='download')
+    def download(self, request, pk=None):
+        job = ReportJob.objects.filter(pk=pk).first()
+        if not job:
+            return Response({'detail': _('التقرير غير موجود.')}, status=status.HTTP_404_NOT_FOUND)
+        if job.status != 'completed':
+            return Response({'detail': _('التقرير غير جاهز بعد.'), 'status': job.status, 'progress': job.progress}, status=status.HTTP_409_CONFLICT)
+
+        if request.query_params.get('output') == 'json':
+            return Response(job.result)
+
+        columns = job.definition['breakdowns'] + ['count']
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="report-{job.id}.csv"'
+        writer = csv.DictWriter(response, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(job.result['rows'])
+        return response
+
+
+# Export Guardians API View (streams CSV or NDJSON) 
+class ExportGuardiansAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    columns = [
+        'id', 'name', 'phone_number', 'is_active', 'is_block', 'is_deleted',
+        'messages_per_month', 'created_at',
+    ]
+
+    def get(self, request):
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_OUTPUTS:
+            return Response({'detail': _('صيغة التصدير غير مدعومة.')}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = Guardian.objects.select_related('user', 'message_defaults')
+
+        def rows():
+            for guardian in iterate_by_pk(queryset):
+                defaults = getattr(guardian, 'message_defaults', None)
+                yield (
+                    guardian.id,
+                    guardian.user.name,
+                    guardian.user.phone_number,
+                    guardian.user.is_active,
+                    guardian.user.is_block,
+                    guardian.user.is_deleted,
+                    defaults.messages_per_month if defaults else None,
+                    guardian.created_at,
+                )
+
+        return stream_export(rows(), self.columns, output, 'guardians')
+
+
+# Export Dependents API View (streams CSV or NDJSON) 
+class ExportDependentsAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    columns = [
+        'id', 'name', 'guardian_id', 'guardian_phone_number', 'disability_type', 'control_method',
+        'gender', 'marital_status', 'date_birth', 'degree_type', 'degree_type_other',
+        'interest_field', 'created_at',
+    ]
+
+    def get(self, request):
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_OUTPUTS:
+            return Response({'detail': _('صيغة التصدير غير مدعومة.')}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = Dependent.objects.select_related('guardian__user', 'disability_type').prefetch_related('interests')
+
+        def rows():
+            for dependent in iterate_by_pk(queryset):
+                interests = dependent.interest_field
+                yield (
+                    dependent.id,
+                    dependent.name,
+                    dependent.guardian_id,
+                    dependent.guardian.user.phone_number,
+                    dependent.disability_type.name_en,
+                    dependent.control_method,
+                    dependent.gender,
+                    dependent.marital_status,
+                    dependent.date_birth,
+                    dependent.degree_type,
+                    dependent.degree_type_other,
+                    interests if output == 'ndjson' else ','.join(interests),
+                    dependent.created_at,
+                )
+
+        return stream_export(rows(), self.columns, output, 'dependents')
+
+
+# Change Feed API View 
+class ChangeFeedAPIView(APIView):
+    """
+    Append-only feed of changes to messages, dependents, guardians and message defaults.
+    Consumers pass the last offset they processed as ?after= and resume from there.
+    """
+    permission_classes = [IsAdminUser]
+
+    default_limit = 500
+    max_limit = 5000
+
+    def get(self, request):
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            return Response({'detail': _('after و limit يجب ان تكون أعداد صحيحة')}, status=status.HTTP_400_BAD_REQUEST)
+        limit = min(max(limit, 1), self.max_limit)
+
+        # Entries younger than the settle window may still have lower ids committing around them 
+        settled_before = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_SETTLE_SECONDS)
+        queryset = ChangeLogEntry.objects.filter(id__gt=after, created_at__lte=settled_before)
+
+        model = request.query_params.get('model')
+        if model:
+            if model not in TRACKED_FIELDS:
+                return Response({'detail': _('نموذج غير مدعوم.')}, status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(model=model)
+
+        entries = list(queryset.order_by('id')[:limit + 1])
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        return Response({
+            'results': ChangeLogEntrySerializer(entries, many=True).data,
+            'next_offset': entries[-1].id if entries else after,
+            'has_more': has_more,
+        }, status=status.HTTP_200_OK)
+
+
+# Broadcast Viewset (announcements sent in the background by the process_broadcasts task) 
+class BroadcastViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    queryset = Broadcast.objects.all()
+    serializer_class = BroadcastSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = DefaultPagination
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(created_by=request.user)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
@@ -1,7 +1,9 @@
 from django.contrib import admin
-from .models import Message, MessageType, GuardianMessageType 
+from .models import ActivityCounter, EscalationTimer, Message, MessageType, GuardianMessageType 
 
 # Register your models here.
 admin.site.register(Message)
 admin.site.register(MessageType)
-admin.site.register(GuardianMessageType)
\ No newline at end of file
+admin.site.register(GuardianMessageType)
+admin.site.register(ActivityCounter)
+admin.site.register(EscalationTimer)
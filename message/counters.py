@@ -0,0 +1,187 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .models import ActivityCounter
+
+
+# Counter names incremented on the message create path 
+MESSAGE_COUNTERS = ('messages', 'sms_messages', 'emergency_messages')
+
+# How long a bucket lives in the cache; must be longer than the flush interval 
+BUCKET_TIMEOUT = 60 * 60 * 48
+
+# Closed minutes re-flushed on every run, to pick up increments that landed late 
+FLUSH_OVERLAP_MINUTES = 2
+
+
+def _epoch_minute(moment):
+    return int(moment.timestamp() // 60)
+
+
+def _minute_start(epoch_minute):
+    return datetime.fromtimestamp(epoch_minute * 60, tz=dt_timezone.utc)
+
+
+def _minute_key(name, epoch_minute):
+    return f"activity:{name}:minute:{epoch_minute}"
+
+
+def _day_key(name, day):
+    return f"activity:{name}:day:{day.isoformat()}"
+
+
+def _flushed_key(name):
+    return f"activity:{name}:flushed_until"
+
+
+# Atomic increment that creates the key on first use 
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, BUCKET_TIMEOUT):
+            cache.incr(key)
+
+
+# Without a shared cache each worker would count on its own: add to the minute's row instead 
+def _increment_row(name, moment):
+    counters = ActivityCounter.objects.filter(name=name, minute=_minute_start(_epoch_minute(moment)))
+    if counters.update(count=F('count') + 1):
+        return
+    try:
+        with transaction.atomic():
+            ActivityCounter.objects.create(name=name, minute=_minute_start(_epoch_minute(moment)), count=1)
+    except IntegrityError:
+        counters.update(count=F('count') + 1)
+
+
+def increment(name, moment=None):
+    """
+    Count one event in the current minute and day buckets.
+    Only touches the cache, so the write path never waits on the database, unless
+    ACTIVITY_COUNTER_STORE is 'db'.
+    """
+    moment = moment or timezone.now()
+    if settings.ACTIVITY_COUNTER_STORE == 'db':
+        _increment_row(name, moment)
+        return
+    _incr(_minute_key(name, _epoch_minute(moment)))
+    _incr(_day_key(name, timezone.localdate(moment)))
+
+
+# Record a newly created message 
+def record_message(message):
+    increment('messages', message.created_at)
+    if message.is_sms:
+        increment('sms_messages', message.created_at)
+    if message.is_emergency:
+        increment('emergency_messages', message.created_at)
+
+
+# Last minute whose bucket is already in the ActivityCounter table 
+def _last_flushed_minute(name):
+    flushed = cache.get(_flushed_key(name))
+    if flushed is not None:
+        return flushed
+    last = ActivityCounter.objects.filter(name=name).order_by('-minute').values_list('minute', flat=True).first()
+    return _epoch_minute(last) if last else None
+
+
+# Rebuild today's total after the day bucket was evicted: flushed minutes from the table plus unflushed minutes from the cache 
+def _rebuild_day_total(name, now):
+    day = timezone.localdate(now)
+    day_start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    current = _epoch_minute(now)
+
+    flushed = _last_flushed_minute(name)
+    if flushed is None:
+        flushed = _epoch_minute(day_start) - 1
+
+    total = ActivityCounter.objects.filter(
+        name=name,
+        minute__gte=day_start,
+        minute__lte=_minute_start(flushed),
+    ).aggregate(total=Sum('count'))['total'] or 0
+
+    pending_keys = [_minute_key(name, minute) for minute in range(max(flushed + 1, _epoch_minute(day_start)), current + 1)]
+    total += sum(cache.get_many(pending_keys).values())
+
+    cache.add(_day_key(name, day), total, BUCKET_TIMEOUT)
+    return total
+
+
+def _activity_from_table(name, now, window_minutes):
+    window_start = _minute_start(_epoch_minute(now) - window_minutes + 1)
+    day_start = timezone.make_aware(datetime.combine(timezone.localdate(now), datetime.min.time()))
+    totals = ActivityCounter.objects.filter(name=name, minute__gte=min(window_start, day_start)).aggregate(
+        last_minutes=Sum('count', filter=Q(minute__gte=window_start)),
+        today=Sum('count', filter=Q(minute__gte=day_start)),
+    )
+    return {'last_minutes': totals['last_minutes'] or 0, 'today': totals['today'] or 0}
+
+
+def get_activity(name, window_minutes=5):
+    """
+    Return the count for the last `window_minutes` minutes and for today.
+    Served from the cache; the table is only read if the day bucket is missing.
+    """
+    now = timezone.now()
+    current = _epoch_minute(now)
+    if settings.ACTIVITY_COUNTER_STORE == 'db':
+        return _activity_from_table(name, now, window_minutes)
+
+    minute_keys = [_minute_key(name, minute) for minute in range(current - window_minutes + 1, current + 1)]
+    day_key = _day_key(name, timezone.localdate(now))
+
+    values = cache.get_many(minute_keys + [day_key])
+    today = values.get(day_key)
+    if today is None:
+        today = _rebuild_day_total(name, now)
+
+    return {
+        'last_minutes': sum(values.get(key, 0) for key in minute_keys),
+        'today': today,
+    }
+
+
+def flush_counters(names=MESSAGE_COUNTERS):
+    """
+    Write closed minute buckets from the cache to the ActivityCounter table.
+    Upserts are idempotent, so re-flushing the overlap window is safe.
+    """
+    if settings.ACTIVITY_COUNTER_STORE == 'db':
+        return 0
+
+    last_closed = _epoch_minute(timezone.now()) - 1
+    oldest = last_closed - BUCKET_TIMEOUT // 60
+    unique_fields = ['name', 'minute'] if connection.features.supports_update_conflicts_with_target else None
+    flushed_rows = 0
+
+    for name in names:
+        flushed = _last_flushed_minute(name)
+        start = max(flushed - FLUSH_OVERLAP_MINUTES, oldest) if flushed is not None else oldest
+        minutes = range(start + 1, last_closed + 1)
+        values = cache.get_many([_minute_key(name, minute) for minute in minutes])
+
+        rows = [
+            ActivityCounter(name=name, minute=_minute_start(minute), count=values[_minute_key(name, minute)])
+            for minute in minutes
+            if values.get(_minute_key(name, minute))
+        ]
+        if rows:
+            ActivityCounter.objects.bulk_create(
+                rows,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=unique_fields,
+                update_fields=['count'],
+            )
+        cache.set(_flushed_key(name), last_closed, BUCKET_TIMEOUT)
+        flushed_rows += len(rows)
+
+    return flushed_rows
@@ -0,0 +1,168 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core.utils import send_notification_to_user, TaqnyatSMSService
+from .models import EscalationTimer, Message
+
+
+logger = logging.getLogger(__name__)
+
+# Timer wheel resolution and size; a timer further out than SLOTS * TICK simply stays in its slot for more laps 
+WHEEL_TICK_SECONDS = 1
+WHEEL_SLOTS = 512
+
+# Pending timers loaded per query 
+TIMER_LOAD_CHUNK_SIZE = 2000
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: a timer goes into slot (tick % slots), so scheduling is O(1) and
+    each advance only looks at the slots that passed. Memory is one tuple and one set entry per timer.
+    """
+
+    def __init__(self, tick_seconds=WHEEL_TICK_SECONDS, slots=WHEEL_SLOTS, now=None):
+        self.tick_seconds = tick_seconds
+        self.slots = [[] for _ in range(slots)]
+        self.current_tick = self._tick(now if now is not None else timezone.now().timestamp())
+        self.timer_ids = set()
+
+    def _tick(self, timestamp):
+        return int(timestamp // self.tick_seconds)
+
+    @property
+    def size(self):
+        return len(self.timer_ids)
+
+    def schedule(self, timer_id, fire_at):
+        # Overdue timers land in the current slot and fire on the next advance 
+        if timer_id in self.timer_ids:
+            return
+        tick = max(self._tick(fire_at), self.current_tick)
+        self.slots[tick % len(self.slots)].append((tick, timer_id))
+        self.timer_ids.add(timer_id)
+
+    def advance(self, now):
+        """Return the ids of every timer due at or before `now` (a timestamp)."""
+        target = self._tick(now)
+        if target < self.current_tick:
+            return []
+
+        due = []
+        for step in range(min(target - self.current_tick + 1, len(self.slots))):
+            index = (self.current_tick + step) % len(self.slots)
+            slot = self.slots[index]
+            if not slot:
+                continue
+            remaining = [entry for entry in slot if entry[0] > target]
+            due.extend(timer_id for tick, timer_id in slot if tick <= target)
+            self.slots[index] = remaining
+        self.current_tick = target + 1
+        self.timer_ids.difference_update(due)
+        return due
+
+
+# Queue an escalation for an emergency message that has just been sent 
+def schedule_escalation(message):
+    return EscalationTimer.objects.create(
+        message=message,
+        fire_at=timezone.now() + timedelta(seconds=settings.EMERGENCY_ESCALATION_SECONDS)
+    )
+
+
+# Cancel the escalations of messages that were seen; one indexed UPDATE 
+def cancel_escalations(message_ids):
+    if not message_ids:
+        return 0
+    return EscalationTimer.objects.filter(message_id__in=message_ids, status='pending').update(status='cancelled')
+
+
+def load_new_timers(wheel, last_id, now=None):
+    """
+    Add pending timers created after `last_id` to the wheel; returns the new high-water id.
+    Ids are not committed in order, so a timer whose transaction committed after a higher id
+    was loaded is picked up once it is due: overdue pending timers the wheel does not hold
+    are scheduled too.
+    """
+    while True:
+        rows = list(
+            EscalationTimer.objects.filter(id__gt=last_id, status='pending')
+            .order_by('id')
+            .values_list('id', 'fire_at')[:TIMER_LOAD_CHUNK_SIZE]
+        )
+        if not rows:
+            break
+        for timer_id, fire_at in rows:
+            wheel.schedule(timer_id, fire_at.timestamp())
+        last_id = rows[-1][0]
+
+    overdue = EscalationTimer.objects.filter(
+        status='pending', fire_at__lte=now or timezone.now(), id__lte=last_id
+    ).values_list('id', 'fire_at')
+    for timer_id, fire_at in overdue[:TIMER_LOAD_CHUNK_SIZE]:
+        wheel.schedule(timer_id, fire_at.timestamp())
+    return last_id
+
+
+def _escalate(message):
+    dependent = message.dependent
+    guardian_user = message.guardian.user
+    title = f"رسالة طارئة من {dependent.name} لم تتم قراءتها"
+    try:
+        send_notification_to_user(
+            user=guardian_user,
+            title=title,
+            body=title,
+            data={"type": "new_message", "message_id": str(message.id), "dependent_id": str(dependent.id)}
+        )
+        if guardian_user.phone_number:
+            TaqnyatSMSService().send_sms(
+                recipients=[guardian_user.phone_number],
+                message=f"{title} \n \n شركة رزان عدنان المليك للتجارة ",
+                sender_name=settings.TAQNYAT_SENDER_NAME
+            )
+    except Exception as e:
+        logger.error(f"Escalation of message {message.id} failed: {str(e)}")
+
+
+# Executor threads keep their own DB connection; drop it once it is stale 
+def _escalate_on_worker(message):
+    try:
+        _escalate(message)
+    finally:
+        close_old_connections()
+
+
+def fire_timers(timer_ids, executor=None):
+    """
+    Escalate the due timers whose message is still unseen: push the guardian again and
+    send an SMS. Timers whose message was seen meanwhile are marked cancelled.
+    The timers are marked fired right away; the sends run on `executor` when one is
+    given, so a slow SMS gateway does not hold up the wheel.
+    """
+    pending = EscalationTimer.objects.filter(id__in=timer_ids, status='pending')
+    unseen = dict(pending.filter(message__is_seen=False).values_list('id', 'message_id'))
+    pending.exclude(id__in=list(unseen)).update(status='cancelled')
+    if not unseen:
+        return 0
+
+    fired = list(
+        EscalationTimer.objects.filter(id__in=list(unseen), status='pending')
+        .values_list('id', flat=True)
+    )
+    EscalationTimer.objects.filter(id__in=fired).update(status='fired', fired_at=timezone.now())
+
+    messages = Message.objects.filter(id__in=[unseen[timer_id] for timer_id in fired]).select_related(
+        'guardian__user', 'dependent'
+    )
+    for message in messages:
+        if executor is None:
+            _escalate(message)
+        else:
+            executor.submit(_escalate_on_worker, message)
+    logger.info(f"Escalated {len(fired)} unseen emergency messages")
+    return len(fired)
@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from core.scheduler import LeaseHeartbeat, acquire_lease, release_lease, scheduler_owner
+from message.escalations import TimerWheel, fire_timers, load_new_timers
+
+
+LEASE_NAME = 'message.escalations'
+
+
+class Command(BaseCommand):
+    help = "Fire unseen-emergency escalations from an in-memory timer wheel; a DB lease keeps one node active, others stand by."
+
+    def handle(self, *args, **options):
+        owner = scheduler_owner()
+        ttl = timedelta(seconds=settings.SCHEDULER_LEASE_SECONDS)
+        poll = settings.ESCALATION_POLL_SECONDS
+
+        while True:
+            close_old_connections()
+            if not acquire_lease(LEASE_NAME, owner, ttl):
+                time.sleep(ttl.total_seconds() / 3)
+                continue
+
+            self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} {owner} holds the escalation lease")
+            heartbeat = LeaseHeartbeat(LEASE_NAME, owner, ttl)
+            heartbeat.start()
+            try:
+                self.run_wheel(heartbeat, poll)
+            finally:
+                heartbeat.stop()
+                heartbeat.join()
+                release_lease(LEASE_NAME, owner)
+                connection.close()
+
+    # Load every pending timer once, then poll for timers with a higher id and overdue stragglers 
+    def run_wheel(self, heartbeat, poll):
+        wheel = TimerWheel()
+        last_id = 0
+        with ThreadPoolExecutor(max_workers=settings.ESCALATION_SEND_WORKERS, thread_name_prefix='escalation') as executor:
+            while heartbeat.is_alive():
+                close_old_connections()
+                last_id = load_new_timers(wheel, last_id)
+                due = wheel.advance(timezone.now().timestamp())
+                if due:
+                    fire_timers(due, executor)
+                time.sleep(poll)
+        self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} lost the escalation lease")
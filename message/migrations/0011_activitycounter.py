@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0010_alter_messagetype_audio_file_ar_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('minute', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('name', 'minute')},
+            },
+        ),
+    ]
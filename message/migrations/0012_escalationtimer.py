@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-19 14:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0011_activitycounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EscalationTimer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fire_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('fired', 'Fired'), ('cancelled', 'Cancelled')], default='pending', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('fired_at', models.DateTimeField(blank=True, null=True)),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='escalations', to='message.message')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['message', 'status'], name='message_esc_message_2bd7ac_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-19 15:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('message', '0012_escalationtimer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='escalationtimer',
+            index=models.Index(fields=['status', 'fire_at'], name='message_esc_status_e1e3b6_idx'),
+        ),
+    ]
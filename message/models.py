@@ -74,3 +74,37 @@ class Message(models.Model):
     def __str__(self):
         return f"{self.guardian} -> {self.dependent}: {self.message_type} ({self.created_at})"
     
+
+
+# Activity Counter (per-minute message counts flushed from the cache) 
+class ActivityCounter(models.Model):
+    name = models.CharField(max_length=50)
+    minute = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('name', 'minute')
+
+    def __str__(self):
+        return f"{self.name} @ {self.minute:%Y-%m-%d %H:%M}: {self.count}"
+
+
+# Escalation Timer (re-notify the guardian when an emergency message stays unseen) 
+class EscalationTimer(models.Model):
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('fired', _('Fired')),
+        ('cancelled', _('Cancelled')),
+    ]
+
+    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='escalations')
+    fire_at = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    fired_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['message', 'status']), models.Index(fields=['status', 'fire_at'])]
+
+    def __str__(self):
+        return f"Escalation of message {self.message_id} at {self.fire_at:%Y-%m-%d %H:%M:%S} ({self.status})"
@@ -1,5 +1,6 @@
 from rest_framework import serializers 
 from django.utils.translation import gettext_lazy as _
+from core.context import get_principal
 from .models import GuardianMessageType, MessageType, Message 
 
 
@@ -24,7 +25,7 @@ class GuardianMessageTypeSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'guardian']
 
         def create(self, validated_data):
-            guardian = self.context['request'].user.guardian
+            guardian = get_principal(self.context['request']).guardian
             if not guardian:
                 raise serializers.ValidationError({'detail': _('Guardian profile not found.')})
             
@@ -69,7 +70,7 @@ class GuardianMessageTypeBulkUpsertSerializer(serializers.Serializer):
         return value
 
     def create(self, validated_data):
-        guardian = self.context['request'].user.guardian
+        guardian = get_principal(self.context['request']).guardian
         if not guardian:
             raise serializers.ValidationError({'detail': _('Guardian profile not found.')})
 
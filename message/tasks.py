@@ -0,0 +1,15 @@
+import logging
+
+from core.jobs import record_rows, tracked_job
+from .counters import flush_counters
+
+
+logger = logging.getLogger(__name__)
+
+
+# Flush the live activity counters from the cache into the ActivityCounter table 
+@tracked_job
+def flush_activity_counters():
+    rows = flush_counters()
+    record_rows(rows)
+    logger.info(f"Flushed {rows} activity counter buckets")
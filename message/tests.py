@@ -1,3 +1,135 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Dependent, DisabilityType, Guardian, User
+from .counters import flush_counters, get_activity, increment
+from .escalations import TimerWheel, fire_timers, load_new_timers
+from .models import ActivityCounter, EscalationTimer, Message
+
+
+class ActivityCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(ACTIVITY_COUNTER_STORE='db')
+    def test_db_store_writes_minute_rows(self):
+        increment('messages')
+        increment('messages')
+        increment('sms_messages')
+
+        self.assertEqual(ActivityCounter.objects.get(name='messages').count, 2)
+        self.assertEqual(get_activity('messages'), {'last_minutes': 2, 'today': 2})
+        self.assertEqual(flush_counters(), 0)
+
+    @override_settings(ACTIVITY_COUNTER_STORE='cache')
+    def test_cache_store_counts_in_cache_until_flushed(self):
+        earlier = timezone.now() - timedelta(minutes=3)
+        increment('messages', earlier)
+        increment('messages', earlier)
+        increment('messages')
+
+        self.assertFalse(ActivityCounter.objects.exists())
+        self.assertEqual(get_activity('messages')['last_minutes'], 3)
+
+        # Only closed minutes are flushed
+        self.assertEqual(flush_counters(), 1)
+        self.assertEqual(ActivityCounter.objects.get(name='messages').count, 2)
+
+        # Re-flushing the overlap window upserts instead of duplicating
+        flush_counters()
+        self.assertEqual(ActivityCounter.objects.filter(name='messages').count(), 1)
+
+
+def make_emergency_message(phone_number):
+    guardian = Guardian.objects.create(user=User.objects.create(phone_number=phone_number, role='guardian'))
+    disability_type = DisabilityType.objects.create(name_ar='حركية', name_en='Motor')
+    dependent = Dependent.objects.create(
+        name='dependent', guardian=guardian, control_method='eye', disability_type=disability_type, gender='male'
+    )
+    return Message.objects.create(guardian=guardian, dependent=dependent, is_emergency=True)
+
+
+class EscalationTests(TestCase):
+    def setUp(self):
+        self.message = make_emergency_message('966500000030')
+        self.now = timezone.now()
+
+    def make_timer(self, seconds, **fields):
+        return EscalationTimer.objects.create(message=self.message, fire_at=self.now + timedelta(seconds=seconds), **fields)
+
+    def test_wheel_returns_timers_once_they_are_due(self):
+        wheel = TimerWheel(now=self.now.timestamp())
+        wheel.schedule(1, self.now.timestamp() + 5)
+        wheel.schedule(2, self.now.timestamp() + 600)
+        wheel.schedule(2, self.now.timestamp() + 600)
+
+        self.assertEqual(wheel.advance(self.now.timestamp() + 4), [])
+        self.assertEqual(wheel.advance(self.now.timestamp() + 5), [1])
+        # Further than one lap out: stays in its slot until its own tick
+        self.assertEqual(wheel.advance(self.now.timestamp() + 599), [])
+        self.assertEqual(wheel.advance(self.now.timestamp() + 600), [2])
+        self.assertEqual(wheel.size, 0)
+
+    def test_timer_committed_after_a_higher_id_is_loaded_once_due(self):
+        late, loaded = self.make_timer(10), self.make_timer(20)
+        wheel = TimerWheel(now=self.now.timestamp())
+        # The poll that saw `loaded` ran before `late` committed
+        last_id = loaded.id
+        wheel.schedule(loaded.id, loaded.fire_at.timestamp())
+
+        self.assertEqual(load_new_timers(wheel, last_id, now=self.now), last_id)
+        self.assertEqual(wheel.size, 1)
+
+        load_new_timers(wheel, last_id, now=self.now + timedelta(seconds=10))
+        self.assertEqual(wheel.advance((self.now + timedelta(seconds=10)).timestamp()), [late.id])
+
+    def test_fire_marks_timers_and_hands_the_sends_to_the_executor(self):
+        unseen = self.make_timer(0)
+        seen_message = make_emergency_message('966500000031')
+        Message.objects.filter(pk=seen_message.pk).update(is_seen=True)
+        seen = EscalationTimer.objects.create(message=seen_message, fire_at=self.now)
+        executor = mock.Mock()
+
+        self.assertEqual(fire_timers([unseen.id, seen.id], executor), 1)
+
+        self.assertEqual(EscalationTimer.objects.get(pk=unseen.pk).status, 'fired')
+        self.assertEqual(EscalationTimer.objects.get(pk=seen.pk).status, 'cancelled')
+        self.assertEqual(executor.submit.call_args.args[1], self.message)
+
+
+class ExportMessagesTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(phone_number='100000000000')
+        self.old = make_emergency_message('966500000032')
+        Message.objects.filter(pk=self.old.pk).update(created_at=timezone.now() - timedelta(days=10))
+        self.new = make_emergency_message('966500000033')
+
+    def export(self, **params):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        return client.get('/message/export/messages/', params)
+
+    def test_messages_are_filtered_by_date(self):
+        since = (timezone.now() - timedelta(days=1)).date().isoformat()
+        response = self.export(start_date=since, output='ndjson')
+        self.assertEqual(response.status_code, 200)
+
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.new.id])
+        self.assertEqual(rows[0]['message_type'], 'emergency')
+        self.assertEqual(rows[0]['guardian_phone_number'], '966500000033')
+
+    def test_csv_has_a_header_and_a_row_per_message(self):
+        response = self.export()
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'created_at'])
+        self.assertEqual(len(lines), 3)
+
+    def test_invalid_date_is_rejected(self):
+        self.assertEqual(self.export(start_date='yesterday').status_code, 400)
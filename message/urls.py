@@ -1,6 +1,6 @@
 from django.urls import path, include 
 from rest_framework.routers import DefaultRouter
-from .views import GuardianMessagesAPIView, MarkMessagesReadAPIView, MessageTypeViewSet, GuardianMessageTypeViewSet, MessageViewSet
+from .views import ExportMessagesAPIView, GuardianMessagesAPIView, MarkMessagesReadAPIView, MessageActivityAPIView, MessageTypeViewSet, GuardianMessageTypeViewSet, MessageViewSet
 
 router = DefaultRouter()
 router.register('message-types', MessageTypeViewSet, basename='message-types') 
@@ -13,5 +13,7 @@ urlpatterns = [
     path('', include(router.urls)),  # Include the router URLs
     path('guardian/messages/', GuardianMessagesAPIView.as_view(), name='guardian-messages'),
     path('guardian/messages/mark-read/', MarkMessagesReadAPIView.as_view(), name='guardian-messages-mark-read'),
+    path('activity/', MessageActivityAPIView.as_view(), name='message-activity'),
+    path('export/messages/', ExportMessagesAPIView.as_view(), name='export-messages'),
 
 ]
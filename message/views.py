@@ -1,4 +1,4 @@
-from datetime import timedelta
+from datetime import date, timedelta
 from django.conf import settings
 from django.utils import timezone
 from django.core.exceptions import ValidationError
@@ -10,10 +10,15 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.utils.translation import gettext_lazy as _
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from core.changelog import record_changes
+from core.context import get_principal
+from core.exports import EXPORT_OUTPUTS, iterate_by_pk, stream_export
 from core.models import Dependent
 from core.pagination import DefaultPagination
 from core.utils import send_notification_to_user, TaqnyatSMSService
 from message.permissions import IsAdminOrReadOnly
+from .counters import MESSAGE_COUNTERS, get_activity, record_message
+from .escalations import cancel_escalations, schedule_escalation
 from .models import GuardianMessageType, MessageType, Message
 from .serializers import GuardianMessageTypeBulkUpsertSerializer, GuardianMessageTypeSerializer, MessageTypeSerializer, MessageSerializer
 
@@ -38,7 +43,7 @@ class GuardianMessageTypeViewSet(viewsets.ModelViewSet):
     search_fields = ['message_type__label_en', 'message_type__label_ar']
 
     def get_queryset(self):
-        guardian = getattr(self.request.user, 'guardian', None)
+        guardian = get_principal(self.request).guardian
         return self.queryset.filter(guardian=guardian) if guardian else self.queryset.none()
 
     def create(self, request, *args, **kwargs):
@@ -56,8 +61,13 @@ class MessageViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     pagination_class = DefaultPagination
 
+    # Only sending is rate limited; listing messages is not
+    @property
+    def throttle_scope(self):
+        return 'message_create' if self.action == 'create' else None
+
     def get_queryset(self):
-        guardian = getattr(self.request.user, 'guardian', None)
+        guardian = get_principal(self.request).guardian
         if guardian:
             return self.queryset.filter(guardian=guardian).select_related(
                 'dependent', 'message_type', 'message_type__message_type'
@@ -74,7 +84,10 @@ class MessageViewSet(viewsets.ModelViewSet):
         if not registration_id:
             return Response({"detail": _("معرف التسجيل مطلوب.")}, status=status.HTTP_400_BAD_REQUEST)
 
-        dependent = get_object_or_404(Dependent, registration_id=registration_id)
+        dependent = get_object_or_404(
+            Dependent.objects.select_related('guardian__user', 'guardian__message_defaults'),
+            registration_id=registration_id
+        )
         guardian = dependent.guardian
 
         if is_sms and is_voice:
@@ -137,6 +150,13 @@ class MessageViewSet(viewsets.ModelViewSet):
             message.save()
         except ValidationError as e:
             return Response({"detail": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Live activity counters (cache only) 
+        record_message(message)
+
+        # Escalate if the guardian does not open the emergency message in time 
+        if message.is_emergency:
+            schedule_escalation(message)
         
         if message.is_emergency:
             title = f"رسالة طارئة من {dependent.name}"
@@ -173,10 +193,10 @@ class GuardianMessagesAPIView(APIView):
 
     def get(self, request):
         user = request.user
-        if user.role != 'guardian' or not hasattr(user, 'guardian'):
+        guardian = get_principal(request).guardian
+        if user.role != 'guardian' or guardian is None:
             return Response({"detail": _("غير مصرح لك.")}, status=403)
 
-        guardian = user.guardian
         dependent_id = request.query_params.get('dependent_id')
 
         messages = guardian.received_messages.all().select_related(
@@ -221,7 +241,7 @@ class MarkMessagesReadAPIView(APIView):
 
     def post(self, request):
         # Get the guardian profile 
-        guardian = getattr(request.user, 'guardian', None)
+        guardian = get_principal(request).guardian
         if not guardian:
             return Response({'detail': _('Guardian profile not found.')}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -232,7 +252,78 @@ class MarkMessagesReadAPIView(APIView):
             queryset = queryset.filter(dependent_id=dependent_id)
         
         # Update the messages to mark them as read 
-        updated_count = queryset.update(is_seen=True)
+        message_ids = list(queryset.values_list('id', flat=True))
+        updated_count = Message.objects.filter(id__in=message_ids).update(is_seen=True)
+        record_changes(Message, message_ids, 'update', {'is_seen': True})
+        cancel_escalations(message_ids)
         return Response({
             'message': f'{updated_count} من الرسائل تم وضع علامة عليهم كمقرؤة.'
         }, status=status.HTTP_200_OK)
+
+
+# Message Activity API View (live counters served from the cache) 
+class MessageActivityAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            window = int(request.query_params.get('minutes', 5))
+        except ValueError:
+            return Response({'detail': _('عدد الدقائق يجب ان يكون عدد صحيح')}, status=status.HTTP_400_BAD_REQUEST)
+        window = min(max(window, 1), 60)
+
+        data = {name: get_activity(name, window_minutes=window) for name in MESSAGE_COUNTERS}
+        return Response({'minutes': window, **data}, status=status.HTTP_200_OK)
+
+
+# Export Messages API View (streams CSV or NDJSON, optionally filtered by start_date / end_date) 
+class ExportMessagesAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    columns = [
+        'id', 'created_at', 'guardian_id', 'guardian_phone_number', 'dependent_id', 'dependent_name',
+        'message_type', 'is_sms', 'is_voice', 'is_emergency', 'is_seen',
+    ]
+
+    def get(self, request):
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_OUTPUTS:
+            return Response({'detail': _('صيغة التصدير غير مدعومة.')}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = Message.objects.select_related(
+            'guardian__user', 'dependent', 'message_type__message_type'
+        )
+        try:
+            start_date = request.query_params.get('start_date')
+            end_date = request.query_params.get('end_date')
+            if start_date:
+                queryset = queryset.filter(created_at__date__gte=date.fromisoformat(start_date))
+            if end_date:
+                queryset = queryset.filter(created_at__date__lte=date.fromisoformat(end_date))
+        except ValueError:
+            return Response({'detail': _('صيغة التاريخ غير صحيحة.')}, status=status.HTTP_400_BAD_REQUEST)
+
+        def rows():
+            for message in iterate_by_pk(queryset):
+                if message.is_emergency:
+                    label = 'emergency'
+                elif message.message_type and message.message_type.message_type:
+                    label = message.message_type.message_type.label_en
+                else:
+                    label = None
+                yield (
+                    message.id,
+                    message.created_at,
+                    message.guardian_id,
+                    message.guardian.user.phone_number,
+                    message.dependent_id,
+                    message.dependent.name,
+                    label,
+                    message.is_sms,
+                    message.is_voice,
+                    message.is_emergency,
+                    message.is_seen,
+                )
+
+        return stream_export(rows(), self.columns, output, 'messages')
+
@@ -41,7 +41,6 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt',
     'fcm_django',
     'django_filters',
-    "django_crontab",
     'rest_framework_simplejwt.token_blacklist',
     'multiselectfield',
     'core', 
@@ -92,10 +91,37 @@ AUTHENTICATION_BACKENDS = [
 # Rest Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'EXCEPTION_HANDLER': 'core.exceptions.custom_exception_handler',
+    # Sliding window limits per endpoint (view.throttle_scope) and key; see core.throttling 
+    'DEFAULT_THROTTLE_CLASSES': (
+        'core.throttling.PhoneNumberThrottle',
+        'core.throttling.UserThrottle',
+        'core.throttling.DeviceThrottle',
+        'core.throttling.IPThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        # OTP sent by SMS (PhoneLoginAPIView)
+        'otp_send.phone': '3/10m',
+        'otp_send.ip': '20/h',
+        # OTP verification (VerifyOTPAPIView)
+        'otp_verify.phone': '10/10m',
+        'otp_verify.device': '20/10m',
+        'otp_verify.ip': '60/h',
+        # Password login for admins (PhonePasswordLoginAPIView)
+        'password_login.phone': '10/10m',
+        'password_login.ip': '30/h',
+        # Guardian PIN verification (VerifyGuardianPinCodeView)
+        'pin.user': '10/m',
+        'pin.device': '10/m',
+        'pin.ip': '60/m',
+        # Messages sent from a dependent device (MessageViewSet.create)
+        'message_create.user': '30/m',
+        'message_create.device': '10/m',
+        'message_create.ip': '120/m',
+    },
 }
 
 # Simple JWT settings
@@ -114,6 +140,7 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+    'TOKEN_REFRESH_SERIALIZER': 'core.tokens.CachedBlacklistTokenRefreshSerializer',
  
 }
 
@@ -143,6 +170,21 @@ DATABASES = {
 }
 
 
+# Cache 
+# Live activity counters are kept here. Point CACHE_BACKEND / CACHE_LOCATION at a shared
+# Redis or Memcached server in production so every worker and the flush job see the same values.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='hajeen-default'),
+    }
+}
+
+# Whether all workers share one cache; a per-process LocMemCache (or the dummy cache) does not,
+# so features that coordinate through the cache fall back to the database or are refused
+SHARED_CACHE = not any(name in CACHES['default']['BACKEND'].lower() for name in ('locmem', 'dummy'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -198,13 +240,104 @@ TAQNYAT_SENDER_NAME = "RazanMulaik"
 cred = credentials.Certificate("hajeen-1-firebase-adminsdk-fbsvc-867086a1ce.json")
 firebase_admin.initialize_app(cred)
 
-
-# Django Crontab Configuration 
-CRONJOBS = [
+# Push dispatcher: request-path pushes are collected for this long, or up to this many, per FCM batch request
+PUSH_DISPATCH_WINDOW_MS = 5
+PUSH_DISPATCH_MAX_BATCH = 500
+# Active devices kept per user; registering another deactivates the oldest
+FCM_MAX_DEVICES_PER_USER = 5
+# Active tokens registered longer ago than this are re-validated by the weekly sweep (days)
+FCM_STALE_DEVICE_DAYS = 30
+# How long an unchanged device registration is answered from the cache (seconds).
+# Disabled with a per-process cache, where another worker's reassignment or deactivation of the token would go unseen
+FCM_DEVICE_CACHE_SECONDS = 60 * 60 * 24 if SHARED_CACHE else 0
+
+# Unseen emergency messages are pushed again and sent by SMS after this delay (seconds)
+EMERGENCY_ESCALATION_SECONDS = 120
+# How often run_escalations polls for newly created timers (seconds)
+ESCALATION_POLL_SECONDS = 1
+# Threads sending escalation pushes and SMS, off the timer wheel loop
+ESCALATION_SEND_WORKERS = 4
+
+
+# Scheduled Jobs 
+# Run by `python manage.py run_scheduler` on any number of nodes; each run is claimed
+# through a JobLease row so exactly one node executes it.
+SCHEDULED_JOBS = [
     # Notify expired guardians daily at midnight
     ('0 0 * * *', 'core.tasks.notify_expired_guardians'),
-    ('0 0 * * *', 'core.tasks.reset_or_increment_guardians'),  # Reset or increment guardians at midnight
-    # Reset monthly messages at 1 AM every day
-    ('0 1 * * *', 'app.tasks.reset_monthly_messages'),  
-
+    # Apply the pending increment at midnight on the first day of the month
+    ('0 0 1 * *', 'core.tasks.reset_or_increment_guardians'),
+    # Reset monthly messages at 1 AM on the first day of the month
+    ('0 1 1 * *', 'core.tasks.reset_monthly_messages'),
+    # Apply balance increments queued from the app settings screen every minute
+    ('* * * * *', 'core.tasks.apply_immediate_guardian_increment'),
+    # Flush live activity counters from the cache every 5 minutes
+    ('*/5 * * * *', 'message.tasks.flush_activity_counters'),
+    # Pick up queued admin report jobs every minute
+    ('* * * * *', 'core.tasks.process_report_jobs'),
+    # Send queued broadcast notifications every minute
+    ('* * * * *', 'core.tasks.process_broadcasts'),
+    # Delete the rows of deleted accounts every minute
+    ('* * * * *', 'core.tasks.process_account_deletions'),
+    # Delete old job run telemetry daily at 3 AM
+    ('0 3 * * *', 'core.jobs.prune_job_runs'),
+    # Validate old FCM tokens and delete inactive devices weekly, Sunday at 4 AM
+    ('0 4 * * 0', 'core.tasks.sweep_stale_fcm_devices'),
+    # Delete expired outstanding and blacklisted JWTs daily at 3:30 AM
+    ('30 3 * * *', 'core.tasks.prune_token_blacklist'),
 ]
+
+# Lease lifetime; renewed by a heartbeat every third of it while the job runs (seconds)
+SCHEDULER_LEASE_SECONDS = 90
+# Missed runs older than this are skipped instead of caught up (seconds)
+SCHEDULER_MAX_CATCH_UP_SECONDS = 60 * 60 * 24
+
+# Job run telemetry (core.jobs): keep runs this many days. Tracing peak memory with tracemalloc
+# slows every job and makes tracked jobs in one process run one at a time, so it is opt-in
+JOB_RUN_TRACE_MEMORY = config('JOB_RUN_TRACE_MEMORY', default=False, cast=bool)
+JOB_RUN_RETENTION_DAYS = 30
+
+
+# Authenticated users are served from a cached principal for this long; saves of the user or guardian invalidate it.
+# Disabled with a per-process cache, where an invalidation (e.g. blocking a user) would not reach the other workers (seconds)
+PRINCIPAL_CACHE_SECONDS = 60 if SHARED_CACHE else 0
+
+# Guardian PIN: lifetime of the pin_token returned by a successful verification (seconds)
+PIN_VERIFIED_TOKEN_SECONDS = 15 * 60
+# Wrong PINs allowed before lockouts start; each further failure doubles the lockout up to the maximum (seconds)
+PIN_FREE_ATTEMPTS = 3
+PIN_LOCKOUT_BASE_SECONDS = 30
+PIN_LOCKOUT_MAX_SECONDS = 60 * 60
+# Failures older than this are forgotten (seconds)
+PIN_FAILURE_WINDOW_SECONDS = 24 * 60 * 60
+# Wrong PINs are counted in the shared cache, or in the PinFailure table when the cache is per process ('cache' or 'db')
+PIN_FAILURE_STORE = config('PIN_FAILURE_STORE', default='cache' if SHARED_CACHE else 'db')
+
+# Expired JWTs deleted per batch by core.tasks.prune_token_blacklist
+TOKEN_PRUNE_BATCH_SIZE = 1000
+
+# Login OTPs: stored hashed in the cache, or in the OneTimePassword table when the cache is per process
+OTP_STORE = config('OTP_STORE', default='cache' if SHARED_CACHE else 'db')
+# How long a login code stays valid (seconds)
+OTP_TTL_SECONDS = 5 * 60
+# Wrong codes allowed before the code is discarded
+OTP_MAX_ATTEMPTS = 5
+# Minimum time between two codes sent to the same phone number (seconds)
+OTP_RESEND_COOLDOWN_SECONDS = 60
+
+# Most guardians one bulk admin action (block, activate, update messages) may select
+GUARDIAN_BULK_MAX_ROWS = 5000
+
+# Live message activity counters: counted in the shared cache and flushed to ActivityCounter,
+# or written straight to the table when the cache is per process ('cache' or 'db')
+ACTIVITY_COUNTER_STORE = config('ACTIVITY_COUNTER_STORE', default='cache' if SHARED_CACHE else 'db')
+
+# Report jobs: how long a completed report is reused for an identical definition (seconds)
+REPORT_CACHE_SECONDS = 60 * 60
+# A running report that wrote no progress for this long is taken as abandoned and requeued (seconds)
+REPORT_JOB_STALE_SECONDS = 15 * 60
+# Starts after which an abandoned report is failed instead of requeued
+REPORT_JOB_MAX_ATTEMPTS = 3
+
+# Change feed: entries newer than this are held back so in-flight transactions cannot be skipped (seconds)
+CHANGE_FEED_SETTLE_SECONDS = 2